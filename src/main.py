@@ -1,14 +1,36 @@
 import argparse
+import atexit
+import functools
 import hashlib
 import json
+import multiprocessing
 import os
 import re
 import socket
 import time
 
 from utils.logUtils import LoggerSingleton
+from utils.prowler_connection_pool import connection_pool, DEFAULT_POOL_SIZE, DEFAULT_IDLE_TIMEOUT
+from utils.prowler_async_engine import DEFAULT_CONCURRENCY, DEFAULT_PER_HOST_CONCURRENCY
+from utils.prowler_timeout_manager import timeout_manager, DEFAULT_PERCENTILE, DEFAULT_MARGIN
+from utils.prowler_rate_limiter import rate_scheduler, DEFAULT_RATE_LIMIT, DEFAULT_MAX_REQUEUE
+from utils.prowler_pipeline import pipelined_transport, DEFAULT_PIPELINE_DEPTH
+from utils.prowler_response import response_reader, DEFAULT_MAX_BODY_SIZE
+from utils.prowler_dedup_cache import dedup_cache
+from utils.prowler_combinations import combination_engine
+from utils.prowler_obfuscation import variant_generator, DEFAULT_VARIANTS
+from utils.prowler_mutation_cache import mutation_cache, DEFAULT_CACHE_FILE
+from utils.prowler_applicability import applicability_index
+from utils.prowler_bandit import bandit_scheduler, STRATEGIES, DEFAULT_STRATEGY, DEFAULT_STATS_FILE
+from utils.prowler_segmented_body import padding_buffer, chunked_encoder, DEFAULT_PADDING_SIZE, DEFAULT_CHUNK_SIZE, \
+    DEFAULT_CHUNK_DELAY
+from utils.prowler_routes import route_table, DEFAULT_ROUTES_FILE
+from utils.prowler_circuit_breaker import circuit_breaker, DEFAULT_FAILURE_THRESHOLD, DEFAULT_MAX_RETRIES, \
+    DEFAULT_GIVE_UP_AFTER
+from utils.prowler_distributed import Coordinator, run_worker, parse_address, DEFAULT_LEASE_TIMEOUT
 from utils.prowler_parse_raw_payload import prowler_begin_to_sniff_payload
-from utils.prowler_process_requests import prowler_begin_to_send_payloads
+from utils.prowler_process_requests import prowler_begin_to_send_payloads, resLogger
+from utils.fileLockUtils import locked_file, atomic_write_json
 
 
 logger = LoggerSingleton().get_logger()
@@ -25,9 +47,22 @@ def parse_arguments():
 
     parser.add_argument("-mp", "--multiprocess", default="false",
                           choices=["true", "false"], help="Enable multiprocess")
+    parser.add_argument("--workers", default=os.cpu_count() or 1, type=int,
+                        help="Worker processes used when multiprocess is enabled")
+    # 多机分发: 协调者分发载荷并合并结果，工作者领取载荷执行测试
+    parser.add_argument("--coordinator", metavar="[HOST:]PORT",
+                        help="Serve the payloads as work units to remote workers and merge their results "
+                             "(binds 127.0.0.1 unless HOST is given, e.g. 0.0.0.0:7700 on a trusted network)")
+    parser.add_argument("--worker", metavar="HOST:PORT",
+                        help="Pull payloads from a coordinator instead of reading --raw")
+    parser.add_argument("--lease-timeout", default=DEFAULT_LEASE_TIMEOUT, type=float,
+                        help="Seconds a worker may go silent before its work unit is handed to another worker")
     parser.add_argument("-r", "--raw", default="config/payload/json", help="Path to raw payload files")
     parser.add_argument("--host",  default="localhost", help="Target host ip")
     parser.add_argument("--port", default=8001, type=int, help="Target port")
+    # 原始站点 -> WAF 部署的路由表，一次运行同时测试多个 WAF
+    parser.add_argument("--routes", default=DEFAULT_ROUTES_FILE,
+                        help="Route table mapping each origin to its WAF endpoints (default routes if missing)")
 
     parser.add_argument("--test-payloads", help="Use test-payloads payload", action="store_true")
     parser.add_argument("--disable-memory", help="Disable memory", action="store_true")
@@ -39,11 +74,77 @@ def parse_arguments():
     parser.add_argument("-p", "--plain", help="Use text format payload", action="store_true")
     # 是否启用强化学习
     parser.add_argument("--rl", help="Use reinforcement learning mode", action="store_true")
+    # 组合变异: 按前缀树组合多个变异方法，限制每个载荷的组合数
+    parser.add_argument("--dd", help="Mutate with combinations of mutant methods", action="store_true")
+    parser.add_argument("--max-combinations", default=0, type=int,
+                        help="Max mutant method combinations per payload with --dd, 0 for unlimited")
+    # 字符级混淆变异方法每次生成的候选载荷数
+    parser.add_argument("--obfuscation-variants", default=DEFAULT_VARIANTS, type=int,
+                        help="Candidate payloads each character-level obfuscation mutant generates")
+    # 变异种子: 相同 (变异方法, 种子, 请求) 得到相同的变异载荷，结果缓存后不再重复执行变异
+    parser.add_argument("--seed", default=None, type=int,
+                        help="Seed mutant methods so mutants are reproducible and cached per (method, seed, request)")
+    parser.add_argument("--mutation-cache", default=None, metavar="PATH",
+                        help="Keep seeded mutation results in PATH across runs (e.g. " + DEFAULT_CACHE_FILE + ")")
+    # 变异方法调度: 按 (WAF, 攻击类型) 的绕过统计在线选择方法顺序，统计跨运行保存
+    parser.add_argument("--scheduler", default=DEFAULT_STRATEGY, choices=STRATEGIES,
+                        help="Order mutant methods with a UCB1 or Thompson sampling bandit per WAF and attack class, "
+                             "or by memory success counts (weighted)")
+    parser.add_argument("--bandit-stats", default=DEFAULT_STATS_FILE, metavar="PATH",
+                        help="File the scheduler statistics are loaded from and saved to")
+    # 长连接池配置
+    parser.add_argument("--pool-size", default=DEFAULT_POOL_SIZE, type=int,
+                        help="Max idle keep-alive connections kept per target host")
+    parser.add_argument("--pool-idle-timeout", default=DEFAULT_IDLE_TIMEOUT, type=float,
+                        help="Seconds before an idle keep-alive connection is evicted")
+    # 并发发送变异载荷，1 表示顺序发送
+    parser.add_argument("-c", "--concurrency", default=DEFAULT_CONCURRENCY, type=int,
+                        help="Max mutant payloads in flight at once, 1 keeps the sequential loop")
+    parser.add_argument("--per-host-concurrency", default=DEFAULT_PER_HOST_CONCURRENCY, type=int,
+                        help="Max mutant payloads in flight to a single target host")
+    # 自适应超时: 超时 = 延迟分位数 * 系数 + 余量
+    parser.add_argument("--timeout-percentile", default=DEFAULT_PERCENTILE, type=float,
+                        help="Latency percentile per host and body size used to derive timeouts")
+    parser.add_argument("--timeout-margin", default=DEFAULT_MARGIN, type=float,
+                        help="Seconds added to the latency percentile when deriving timeouts")
+    # 按主机限速，并根据限流/超时/错误自动调整并发与速率(AIMD)
+    parser.add_argument("--rate-limit", default=DEFAULT_RATE_LIMIT, type=float,
+                        help="Max requests per second per target host (per process), 0 for unlimited")
+    parser.add_argument("--disable-autotune", help="Keep per-host concurrency and rate fixed instead of AIMD tuning",
+                        action="store_true")
+    parser.add_argument("--max-requeue", default=DEFAULT_MAX_REQUEUE, type=int,
+                        help="Times a throttled (429/503) mutant payload is re-queued before it counts as failed")
+    # HTTP/1.1 管线化: 同一目标的一批变异载荷在一个连接上连续发送
+    parser.add_argument("--pipeline", default=DEFAULT_PIPELINE_DEPTH, type=int,
+                        help="Pipeline N mutant payloads per round trip when sending sequentially (-c 1), 0 to disable")
+    # 响应体读取上限；调试模式下才输出格式化后的 HTML
+    parser.add_argument("--max-body-size", default=DEFAULT_MAX_BODY_SIZE, type=int,
+                        help="Max response body bytes read per request, 0 for unlimited")
+    parser.add_argument("--debug-response", help="Log prettified HTML of every response (slow)", action="store_true")
+    # 字节完全相同的变异请求只发送一次
+    parser.add_argument("--disable-dedup", help="Send byte-identical mutant requests again instead of reusing the result",
+                        action="store_true")
+    # 填充类变异的填充字节数，可设为数 MB 以探测 WAF 的检测长度上限
+    parser.add_argument("--padding-size", default=DEFAULT_PADDING_SIZE, type=int,
+                        help="Bytes of junk the padding mutant puts in the request body")
+    # 分块传输变异: 每块字节数与块间延迟，分块帧在发送时逐块写出
+    parser.add_argument("--chunk-size", default=DEFAULT_CHUNK_SIZE, type=int,
+                        help="Body bytes per chunk sent by the chunked transfer-encoding mutant")
+    parser.add_argument("--chunk-delay", default=DEFAULT_CHUNK_DELAY, type=float,
+                        help="Seconds to wait between chunks sent by the chunked transfer-encoding mutant")
+    # 熔断与重试: 目标重启期间暂停发送并探测，恢复后继续
+    parser.add_argument("--max-retries", default=DEFAULT_MAX_RETRIES, type=int,
+                        help="Retries with backoff for a request that timed out or failed to connect")
+    parser.add_argument("--breaker-threshold", default=DEFAULT_FAILURE_THRESHOLD, type=int,
+                        help="Consecutive connection failures before a host is paused and probed")
+    parser.add_argument("--breaker-give-up", default=DEFAULT_GIVE_UP_AFTER, type=float,
+                        help="Seconds a host may stay unreachable before requests stop waiting for it")
 
     return parser.parse_args()
 
 
 def configure_settings(args):
+    global enable_shortcut
     # if using wsl
     if args.wsl:
         logger.info(TAG+"==>Using wsl")
@@ -68,6 +169,21 @@ def configure_settings(args):
     # Use reinforcement learning
     if args.rl:
         logger.info(TAG+"==>Using reinforcement learning")
+    route_table.configure(args.routes)
+    connection_pool.configure(pool_size=args.pool_size, idle_timeout=args.pool_idle_timeout)
+    timeout_manager.configure(percentile=args.timeout_percentile, margin=args.timeout_margin)
+    response_reader.configure(max_body_size=args.max_body_size, debug=args.debug_response)
+    dedup_cache.configure(enabled=not args.disable_dedup)
+    combination_engine.configure(max_combinations=args.max_combinations)
+    variant_generator.configure(variants=args.obfuscation_variants)
+    mutation_cache.configure(seed=args.seed, path=args.mutation_cache)
+    bandit_scheduler.configure(strategy=args.scheduler, path=args.bandit_stats)
+    padding_buffer.configure(size=args.padding_size)
+    chunked_encoder.configure(chunk_size=args.chunk_size, delay=args.chunk_delay)
+    circuit_breaker.configure(failure_threshold=args.breaker_threshold, max_retries=args.max_retries,
+                              give_up_after=args.breaker_give_up)
+    rate_scheduler.configure(max_concurrency=args.per_host_concurrency, rate_limit=args.rate_limit,
+                             autotune=not args.disable_autotune, max_requeue=args.max_requeue)
 
 
 def generate_unique_id(entry):
@@ -84,12 +200,12 @@ def deduplicate_results(results):
     for result in results:
         # 定义一个元组作为去重的依据
         identifier = (result['url'], result['response_status_code'], json.dumps(result['response_text']),
-                      json.dumps(result['payload']), result['original_url'])
+                      str(result['payload']), result['original_url'])
         if identifier not in seen:
             seen.add(identifier)
             unique_results.append(result)
     results = unique_results
-    formatted_results = json.dumps(results, indent=6, ensure_ascii=False)
+    formatted_results = json.dumps(results, indent=6, ensure_ascii=False, default=str)
     logger.debug(TAG + "==>results: " + formatted_results)
     for result in results:
         if result['response_status_code'] == 200:
@@ -116,6 +232,24 @@ def generate_statistic(results):
     total_success = sum(attempts['success'] for attempts in url_attempts.values())
     success_rate = total_success / total_attempts if total_attempts > 0 else 0
     logger.info(TAG + "==>Total attempts(initial attempt not included): " + str(total_attempts) + " Total success: " + str(total_success) + " Success rate: " + str(success_rate))
+    # 按 WAF 目标统计尝试次数与成功次数
+    target_attempts = {}
+    for result in results:
+        attempts = target_attempts.setdefault(result.get('target', 'origin'), {'attempts': 0, 'success': 0})
+        attempts['attempts'] += 1
+        if result['success']:
+            attempts['success'] += 1
+    for target, attempts in target_attempts.items():
+        logger.warning(TAG + "==>target: " + str(target) + " attempts: " + str(attempts['attempts']) + " success: " + str(attempts['success']))
+    # 输出每个目标主机被判定为超时与真实失败的次数，以及调度器收敛到的并发数与速率
+    timeout_manager.report()
+    rate_scheduler.report()
+    pipelined_transport.report()
+    dedup_cache.report()
+    circuit_breaker.report()
+    mutation_cache.report()
+    applicability_index.report()
+    bandit_scheduler.report()
 
 
 def update_memory(results):
@@ -123,12 +257,12 @@ def update_memory(results):
     memories = {}
     for result in results:
         if result['success'] == True:
-            # 使用正则表达式提取mutant_method的值
+            # 使用正则表达式提取mutant_method的值，ddmin 最小化后的方法链优先
             pattern = r"'mutant_method':\s*'([^']+)'"
-            match = re.search(pattern, result['payload'])
+            match = re.search(pattern, str(result['payload']))
 
             if match:
-                mutant_method = match.group(1)
+                mutant_method = result.get('minimized_mutant_method') or match.group(1)
                 url = result['original_url']
 
                 # 如果该url不存在，创建一个新的列表
@@ -139,33 +273,30 @@ def update_memory(results):
                 if mutant_method not in memories[url]:
                     memories[url].append(mutant_method)
 
-    # 读取或初始化内存文件
+    # 读取或初始化内存文件，多进程时加锁后读-合并-写
     memory_file_path = "config/memory.json"
-    try:
-        if not os.path.exists(memory_file_path):
-            os.makedirs(os.path.dirname(memory_file_path), exist_ok=True)
+    with locked_file(memory_file_path):
+        try:
+            if not os.path.exists(memory_file_path):
+                old_memory = {}
+            else:
+                with open(memory_file_path, "r") as f:
+                    old_memory = json.load(f)
+        except json.decoder.JSONDecodeError:
+            logger.error(f"{TAG} ==> 'memory.json' is empty or corrupted")
             old_memory = {}
-            with open(memory_file_path, "w") as f:
-                json.dump(old_memory, f, indent=4)
-        else:
-            with open(memory_file_path, "r") as f:
-                old_memory = json.load(f)
-    except json.decoder.JSONDecodeError:
-        logger.error(f"{TAG} ==> 'memory.json' is empty or corrupted")
-        old_memory = {}
-
-    # 更新 old_memory 中的内容
-    for url, mutant_methods in memories.items():
-        if url not in old_memory:
-            old_memory[url] = mutant_methods
-        else:
-            # 将新方法添加到旧方法列表中，并去重
-            old_memory[url].extend(mutant_methods)
-            old_memory[url] = list(set(old_memory[url]))
 
-    # 将更新后的内容写回 memory.json
-    with open(memory_file_path, "w") as f:
-        json.dump(old_memory, f, indent=4)
+        # 更新 old_memory 中的内容
+        for url, mutant_methods in memories.items():
+            if url not in old_memory:
+                old_memory[url] = mutant_methods
+            else:
+                # 将新方法添加到旧方法列表中，并去重
+                old_memory[url].extend(mutant_methods)
+                old_memory[url] = list(set(old_memory[url]))
+
+        # 将更新后的内容写回 memory.json
+        atomic_write_json(memory_file_path, old_memory, indent=4)
     logger.info(f"{TAG} ==> Updated 'memory.json' with new entries.")
 
 
@@ -183,14 +314,121 @@ def check_url_reachable(host, port):
         return False
 
 
+def log_origin_results(results):
+    formatted_results = json.dumps(results, indent=4, ensure_ascii=False, default=str)
+    logger.debug(TAG + "==>results: " + formatted_results)
+    for result in results:
+        if result['response_status_code'] == 200:
+            logger.info(TAG + "==>url: " + result['url'] + " success")
+        else:
+            if result['response_text'] is not None:
+                logger.warning(TAG + "==>url: " + result['url'] + " failed" + " response: " + result['response_text'])
+            else:
+                logger.warning(TAG + "==>url: " + result['url'] + " failed")
+
+
+def run_waf_pass(args, payloads, shortcut):
+    # send payloads to address with waf
+    if args.mutant:
+        return prowler_begin_to_send_payloads(args.host, args.port, payloads, waf=True, PAYLOAD_MUTANT_ENABLED=True,
+                                              enable_shortcut=shortcut, enable_dd=args.dd, rl=args.rl,
+                                              concurrency=args.concurrency,
+                                              per_host_concurrency=args.per_host_concurrency,
+                                              pipeline=args.pipeline)
+    return prowler_begin_to_send_payloads(args.host, args.port, payloads, waf=True, PAYLOAD_MUTANT_ENABLED=False,
+                                          enable_shortcut=shortcut)
+
+
+def run_payload_in_worker(args, shortcut, task, remote=False):
+    """
+    子进程中执行: 对一个载荷依次进行原始站点测试和 WAF/变异测试。
+    返回载荷序号、两轮结果、本次新记录到 resLogger 中的条目、超时判定计数、去重节省的发送次数、
+    变异方法调度的新增计数以及变异结果缓存的新增条目，由父进程汇总。
+    变异结果缓存的新增条目是 pickle 字节，只在本机进程池中传回；远程工作者(remote)不返回该项，
+    协调者不反序列化来自网络的数据。
+    """
+    index, payload = task
+    logged_before = len(resLogger.cache)
+    origin_results = prowler_begin_to_send_payloads(args.host, args.port, [payload])
+    waf_results = run_waf_pass(args, [payload], shortcut)
+    state = (index, origin_results, waf_results, resLogger.cache[logged_before:], timeout_manager.pop_outcomes(),
+             dedup_cache.pop_saved(), bandit_scheduler.pop_updates())
+    if remote:
+        return state
+    return state + (mutation_cache.pop_updates(),)
+
+
+def merge_worker_state(logged, outcomes, saved, bandit_updates, mutation_updates=None):
+    """
+    合并子进程或远程工作者的 resLogger 条目、超时判定计数、去重节省的发送次数、
+    变异方法调度的新增计数以及变异结果缓存的新增条目
+    """
+    # 子进程和工作者不会保存结果文件，由父进程(协调者)统一记录
+    resLogger.cache.extend(logged)
+    timeout_manager.merge_outcomes(outcomes)
+    dedup_cache.merge_saved(saved)
+    # 调度统计与变异结果缓存由父进程(协调者)统一保存
+    bandit_scheduler.merge_updates(bandit_updates)
+    mutation_cache.merge_updates(mutation_updates)
+
+
+def run_multiprocess(args, payloads):
+    """将载荷分片到进程池中执行，结果按完成顺序流回父进程"""
+    workers = max(1, min(args.workers, len(payloads)))
+    logger.info(TAG + "==>Using multiprocess, workers: " + str(workers))
+    origin_results = [None] * len(payloads)
+    waf_results = [None] * len(payloads)
+    worker_func = functools.partial(run_payload_in_worker, args, enable_shortcut)
+    with multiprocessing.Pool(processes=workers) as pool:
+        for index, origin, waf, *worker_state in pool.imap_unordered(worker_func, enumerate(payloads)):
+            origin_results[index] = origin
+            waf_results[index] = waf
+            merge_worker_state(*worker_state)
+            logger.info(TAG + "==>payload " + str(index + 1) + "/" + str(len(payloads)) + " finished")
+    origin_results = [result for shard in origin_results for result in shard]
+    waf_results = [result for shard in waf_results for result in shard]
+    return origin_results, waf_results
+
+
+def run_coordinator(args, payloads):
+    """把载荷分发给远程工作者，按载荷顺序合并两轮结果"""
+    coordinator = Coordinator(payloads, lease_timeout=args.lease_timeout)
+    # 默认只监听本机，对外暴露需要显式指定监听地址
+    unit_results = coordinator.serve(parse_address(args.coordinator, default_host="127.0.0.1"))
+    origin_results = []
+    waf_results = []
+    for unit_result in unit_results:
+        if unit_result is None:
+            # 多次分发都失败的载荷
+            continue
+        # 只取数据项，不合并变异结果缓存(来自网络的 pickle 字节不反序列化)
+        index, origin, waf, logged, outcomes, saved, bandit_updates = unit_result[:7]
+        origin_results.extend(origin)
+        waf_results.extend(waf)
+        merge_worker_state(logged, outcomes, saved, bandit_updates)
+    return origin_results, waf_results
+
+
+def run_distributed_worker(args):
+    # 工作者不保存本地结果文件与调度统计，记录的条目与新增计数随结果推回协调者；
+    # 变异结果缓存不经网络传输，由工作者自己保存
+    atexit.unregister(resLogger.save_on_exit)
+    run_worker(parse_address(args.worker), functools.partial(run_payload_in_worker, args, enable_shortcut,
+                                                             remote=True))
+    mutation_cache.save()
+
+
 def main(args):
     configure_settings(args)
-    # 判断目标网址是否可达，不可达则不测试
-    if not check_url_reachable(args.host, args.port):
+    # 判断目标网址是否可达，不可达则不测试(协调者不直接发送请求)
+    if not args.coordinator and not check_url_reachable(args.host, args.port):
         logger.error(TAG + "==>Target website is unreachable, please use --host and --port to "
                            "specify the target address.")
         return
     logger.info(TAG + "==>Target website: " + args.host + ":" + str(args.port))
+    if args.worker:
+        run_distributed_worker(args)
+        return
 
     # read raw payload folder
     logger.info(TAG + "==>raw payload folder: " + args.raw)
@@ -198,30 +436,24 @@ def main(args):
         payloads = prowler_begin_to_sniff_payload(args.raw, plain=True)
     else:
         payloads = prowler_begin_to_sniff_payload(args.raw)
-    # send payloads to address without waf
 
-    results = prowler_begin_to_send_payloads(args.host, args.port, payloads)
-    formatted_results = json.dumps(results, indent=4, ensure_ascii=False)
-    logger.debug(TAG + "==>results: " + formatted_results)
-    for result in results:
-        if result['response_status_code'] == 200:
-            logger.info(TAG + "==>url: " + result['url'] + " success")
-        else:
-            if result['response_text'] is not None:
-                logger.warning(TAG + "==>url: " + result['url'] + " failed" + " response: " + result['response_text'])
-            else:
-                logger.warning(TAG + "==>url: " + result['url'] + " failed")
-    # send payloads to address with waf
-    if args.mutant:
-        results = prowler_begin_to_send_payloads(args.host, args.port, payloads, waf=True, PAYLOAD_MUTANT_ENABLED=True,
-                                                 enable_shortcut=enable_shortcut, rl=args.rl)
+    if args.coordinator:
+        origin_results, results = run_coordinator(args, payloads)
+        log_origin_results(origin_results)
+    elif args.multiprocess == "true" and len(payloads) > 1:
+        origin_results, results = run_multiprocess(args, payloads)
+        log_origin_results(origin_results)
     else:
-        results = prowler_begin_to_send_payloads(args.host, args.port, payloads, waf=True, PAYLOAD_MUTANT_ENABLED=False,
-                                                 enable_shortcut=enable_shortcut)
+        # send payloads to address without waf
+        origin_results = prowler_begin_to_send_payloads(args.host, args.port, payloads)
+        log_origin_results(origin_results)
+        results = run_waf_pass(args, payloads, enable_shortcut)
 
     deduplicate_results(results)
     generate_statistic(results)
     update_memory(results)
+    mutation_cache.save()
+    bandit_scheduler.save()
 
 
 if __name__ == "__main__":
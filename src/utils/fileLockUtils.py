@@ -0,0 +1,41 @@
+import json
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，退化为不加锁
+    fcntl = None
+
+"""
+多进程共享文件(结果文件、memory.json)的读写工具。
+usage:
+    from utils.fileLockUtils import locked_file, atomic_write_json
+    with locked_file("config/memory.json"):
+        ...读取、合并...
+        atomic_write_json("config/memory.json", data, indent=4)
+"""
+
+
+@contextmanager
+def locked_file(path):
+    """对 path 加进程间独占锁，锁文件为 path + '.lock'"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + '.lock', 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write_json(path, data, **kwargs):
+    """先写临时文件再替换，读者不会读到写了一半的 JSON"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp_path, path)
@@ -0,0 +1,187 @@
+import threading
+from collections import namedtuple
+
+from utils.logUtils import LoggerSingleton
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_applicability.py: "
+
+"""
+变异方法的适用条件: 很多变异方法只适用于特定形态的请求(GET / POST、multipart 请求体、带 Content-Type 请求头...)，
+不适用时返回 []，但调用前整个请求已经被复制了一份。每个变异方法声明适用条件(见 mutant_methods_applicability)，
+启动时建立索引，分发前按请求形态过滤，不适用的方法不再复制请求、不再调用。
+usage:
+    shape = request_shape(headers, url, method, data, files, analysis)
+    methods = applicability_index.applicable(mutant_methods, shape)
+"""
+
+CONTENT_TYPE_NONE = None
+CONTENT_TYPE_MULTIPART = 'multipart'
+CONTENT_TYPE_JSON = 'json'
+CONTENT_TYPE_FORM = 'form'
+CONTENT_TYPE_OTHER = 'other'
+
+# 请求形态: 各变异方法的适用条件只依赖这些字段
+# has_files: files 非空，或请求体中有 filename(multipart 上传载荷的文件在请求体中)
+# has_boundary: Content-Type 中带 boundary
+RequestShape = namedtuple('RequestShape', ['method', 'content_type', 'has_content_type', 'has_boundary', 'has_files',
+                                           'has_query', 'has_body'])
+
+FLAGS = ('has_content_type', 'has_boundary', 'has_files', 'has_query', 'has_body')
+
+
+def content_type_kind(content_type):
+    if not content_type:
+        return CONTENT_TYPE_NONE
+    if 'multipart/form-data' in content_type:
+        return CONTENT_TYPE_MULTIPART
+    if 'application/json' in content_type:
+        return CONTENT_TYPE_JSON
+    if 'application/x-www-form-urlencoded' in content_type:
+        return CONTENT_TYPE_FORM
+    return CONTENT_TYPE_OTHER
+
+
+def request_shape(headers, url, method, data, files, analysis):
+    """analysis 为该请求的 RequestAnalysis"""
+    return RequestShape(
+        method=method,
+        content_type=content_type_kind(analysis.content_type),
+        has_content_type=bool(headers) and 'Content-Type' in headers,
+        has_boundary=analysis.boundary is not None,
+        has_files=bool(files) or bool(data) and 'filename' in str(data),
+        has_query=bool(analysis.parsed_url.query),
+        has_body=bool(data),
+    )
+
+
+class Applicability:
+    """
+    一个变异方法的适用条件，各项同时满足时才适用:
+    methods: 适用的请求方法；content_types: 适用的 Content-Type 类别；
+    requires: 必须全部为真的形态字段；requires_any: 至少一个为真的形态字段。
+    条件只排除变异方法必然返回 [] 的请求，满足条件时变异方法仍可能不生成载荷。
+    """
+
+    __slots__ = ('methods', 'content_types', 'requires', 'requires_any')
+
+    def __init__(self, methods=None, content_types=None, requires=(), requires_any=()):
+        for flag in tuple(requires) + tuple(requires_any):
+            if flag not in FLAGS:
+                raise ValueError("unknown request shape field: " + str(flag))
+        self.methods = frozenset(methods) if methods is not None else None
+        self.content_types = frozenset(content_types) if content_types is not None else None
+        self.requires = tuple(requires)
+        self.requires_any = tuple(requires_any)
+
+    def matches(self, shape):
+        if self.methods is not None and shape.method not in self.methods:
+            return False
+        if self.content_types is not None and shape.content_type not in self.content_types:
+            return False
+        if not all(getattr(shape, flag) for flag in self.requires):
+            return False
+        return not self.requires_any or any(getattr(shape, flag) for flag in self.requires_any)
+
+
+class ApplicabilityIndex:
+    """
+    变异方法名 -> 适用条件的索引，启动时由声明建立；没有声明的方法总是适用。
+    每种请求形态只判定一次，结果(该形态下不适用的方法名)缓存，同一语料中形态相同的载荷直接查表。
+    """
+
+    def __init__(self, declarations=None):
+        self._declarations = {}
+        self._inapplicable = {}
+        self._lock = threading.Lock()
+        self.stats = {'dispatched': 0, 'skipped': 0}
+        if declarations:
+            self.register(declarations)
+
+    def register(self, declarations):
+        """declarations: 变异方法名 -> Applicability"""
+        with self._lock:
+            self._declarations.update(declarations)
+            self._inapplicable.clear()
+
+    def inapplicable(self, shape):
+        """该形态下不适用的变异方法名"""
+        names = self._inapplicable.get(shape)
+        if names is None:
+            names = frozenset(name for name, applicability in self._declarations.items()
+                              if not applicability.matches(shape))
+            with self._lock:
+                self._inapplicable[shape] = names
+        return names
+
+    def applies(self, mutant_method, shape):
+        applies = mutant_method.__name__ not in self.inapplicable(shape)
+        with self._lock:
+            self.stats['dispatched' if applies else 'skipped'] += 1
+        return applies
+
+    def applicable(self, mutant_methods, shape):
+        """过滤出适用于该形态的变异方法(保持顺序)"""
+        inapplicable = self.inapplicable(shape)
+        methods = [mutant_method for mutant_method in mutant_methods if mutant_method.__name__ not in inapplicable]
+        skipped = len(mutant_methods) - len(methods)
+        with self._lock:
+            self.stats['dispatched'] += len(methods)
+            self.stats['skipped'] += skipped
+        if skipped:
+            logger.info(TAG + "==>skipped " + str(skipped) + " inapplicable mutant methods for " + str(shape))
+        return methods
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats, shapes=len(self._inapplicable))
+        logger.info(TAG + "==>applicability stats: " + str(stats))
+        return stats
+
+
+# 全局共享的适用条件索引，由 prowler_mutant_methods 注册各变异方法的声明
+applicability_index = ApplicabilityIndex()
+
+
+if __name__ == '__main__':
+    # 对比不过滤与按适用条件过滤时，对各类请求执行全部启用的变异方法的耗时
+    # usage: cd src && python -m utils.prowler_applicability
+    import logging
+    import time
+    from utils.prowler_mutant_methods import mutant_methods
+    from utils.prowler_request import ProwlerRequest
+    from utils.prowler_request_analysis import RequestAnalysis
+    # 以脚本运行时本模块是 __main__，使用 prowler_mutant_methods 注册过声明的索引
+    from utils.prowler_applicability import applicability_index, request_shape
+
+    logger.setLevel(logging.ERROR)
+    upload = ('------B\r\nContent-Disposition: form-data; name="f"; filename="a.php"\r\nContent-Type: image/png;\r\n\r\n' +
+              '<?php system($_GET["cmd"]); ?>' * 256 + '\r\n------B--\r\n')
+    requests = [
+        ProwlerRequest({'User-Agent': 'prowler'}, 'http://127.0.0.1:8001/rce_get?cmd=cat%20/etc/passwd', 'GET', None),
+        ProwlerRequest({'Content-Type': 'application/x-www-form-urlencoded'}, 'http://127.0.0.1:8001/rce_post', 'POST',
+                       'cmd=' + 'cat /etc/passwd;' * 256),
+        ProwlerRequest({'Content-Type': 'multipart/form-data; boundary=----B'}, 'http://127.0.0.1:8001/upload', 'POST',
+                       upload),
+    ]
+    rounds = 20
+
+    def run(request, analysis, select):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for mutant_method in select():
+                try:
+                    request.apply(mutant_method, analysis)
+                except Exception:
+                    pass
+        return (time.perf_counter() - start) / rounds * 1000
+
+    for request in requests:
+        analysis = RequestAnalysis(request.headers, request.url, request.method, request.data)
+        shape = request_shape(*request.fields(), analysis)
+        applicable = applicability_index.applicable(mutant_methods, shape)
+        unfiltered = run(request, analysis, lambda: mutant_methods)
+        filtered = run(request, analysis, lambda: applicability_index.applicable(mutant_methods, shape))
+        print(request.method + " " + str(shape.content_type) + ": all " + str(len(mutant_methods)) + " methods " +
+              str(round(unfiltered, 2)) + " ms, " + str(len(applicable)) + " applicable " + str(round(filtered, 2)) +
+              " ms (" + str(len(mutant_methods) - len(applicable)) + " skipped)")
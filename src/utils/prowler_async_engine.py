@@ -0,0 +1,72 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from utils.logUtils import LoggerSingleton
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_async_engine.py: "
+
+# 全局并发数，1 表示沿用原有的顺序发送
+DEFAULT_CONCURRENCY = 1
+# 同一目标主机的最大并发数
+DEFAULT_PER_HOST_CONCURRENCY = 8
+
+
+def _url_netloc(payload):
+    return urlparse(payload['url']).netloc
+
+
+class AsyncSendEngine:
+    """
+    基于 asyncio 的并发发送引擎，限制全局并发与单主机并发。
+    实际的阻塞发送(run_payload 等)放在线程池中执行，结果判定回调在事件循环线程中串行执行，
+    因此回调中可以安全地修改 results、resLogger 等共享状态。
+    usage:
+        engine = AsyncSendEngine(concurrency=16, per_host_concurrency=4)
+        engine.run(mutant_payloads, send_func, on_result, host_key=lambda payload: target_netloc)
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, per_host_concurrency=DEFAULT_PER_HOST_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self.per_host_concurrency = max(1, per_host_concurrency)
+
+    def run(self, payloads, send_func, on_result=None, host_key=None):
+        """
+        并发发送 payloads。
+        send_func(payload) -> result 在线程池中执行；
+        on_result(payload, result) 返回 True 时停止派发尚未发送的 payload(用于 shortcut)；
+        host_key(payload) 返回实际发往的主机(单主机并发按它限制)，默认取 payload['url'] 的 netloc。
+        返回已发送的 (payload, result) 列表，按完成顺序排列。
+        """
+        return asyncio.run(self._run(iter(payloads), send_func, on_result, host_key or _url_netloc))
+
+    async def _run(self, payload_iter, send_func, on_result, host_key):
+        loop = asyncio.get_running_loop()
+        host_semaphores = {}
+        completed = []
+        stop = False
+
+        def host_semaphore(payload):
+            host = host_key(payload)
+            if host not in host_semaphores:
+                host_semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+            return host_semaphores[host]
+
+        async def worker(executor):
+            nonlocal stop
+            # 每个 worker 依次从共享迭代器中取 payload，worker 数量即为全局并发上限
+            for payload in payload_iter:
+                if stop:
+                    return
+                async with host_semaphore(payload):
+                    result = await loop.run_in_executor(executor, send_func, payload)
+                completed.append((payload, result))
+                if on_result is not None and on_result(payload, result):
+                    stop = True
+                    return
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            await asyncio.gather(*(worker(executor) for _ in range(self.concurrency)))
+        logger.debug(TAG + "==>sent " + str(len(completed)) + " payloads with concurrency " + str(self.concurrency))
+        return completed
@@ -0,0 +1,314 @@
+import json
+import math
+import os
+import re
+import threading
+from urllib.parse import urlparse
+
+from utils.fileLockUtils import locked_file, atomic_write_json
+from utils.logUtils import LoggerSingleton
+from utils.prowler_random import mutation_random
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_bandit.py: "
+
+"""
+多臂老虎机(multi-armed bandit)变异方法调度: 每个变异方法是一个臂，每发出一个变异请求是一次拉动，绕过成功的奖励为 1。
+统计按 (WAF 目标, 攻击类型) 分别记录，每个响应之后立即更新，并保存到磁盘供下次运行使用。
+对一个原始载荷，每当上一个变异方法的载荷取完时，按当前的统计选出下一个变异方法，
+同一次运行中前面载荷的结果会影响后面载荷的方法顺序。
+奖励按请求计: 生成多个载荷的变异方法需要多个请求才能试完，代价相应更高。
+未见过的 (WAF, 攻击类型) 以该方法在所有上下文中的绕过率为先验，没有任何统计时保持 get_weighted_mutant_methods 的顺序。
+多进程(-mp)与分布式运行时，子进程/工作者用 pop_updates 取出新增计数随结果返回，
+由父进程(协调者)累加(merge_updates)，只有父进程(协调者)保存；保存时把新增计数累加到磁盘上的统计，不覆盖其他运行写入的计数。
+usage:
+    bandit_scheduler.configure(strategy='ucb1', path="config/bandit_stats.json")
+    context = bandit_scheduler.context('vendor-a', url)
+    for mutant_method in bandit_scheduler.order([context], mutant_methods):
+        ...
+    bandit_scheduler.update(context, mutant_method.__name__, bypassed)
+"""
+
+STRATEGY_UCB1 = 'ucb1'
+STRATEGY_THOMPSON = 'thompson'
+# 不调度，保持 get_weighted_mutant_methods 按历史成功次数排序的顺序
+STRATEGY_WEIGHTED = 'weighted'
+STRATEGIES = (STRATEGY_UCB1, STRATEGY_THOMPSON, STRATEGY_WEIGHTED)
+
+DEFAULT_STRATEGY = STRATEGY_UCB1
+DEFAULT_STATS_FILE = "config/bandit_stats.json"
+# UCB1 探索项的系数，越小越倾向于已知绕过率高的方法
+DEFAULT_EXPLORATION = 0.2
+# 先验(所有上下文中的绕过率)折合的请求数
+PRIOR_WEIGHT = 1.0
+CONTEXT_SEPARATOR = '|'
+
+_REQUESTS = 0
+_BYPASSES = 1
+
+
+def attack_class(url):
+    """url 路径最后一段的前缀作为攻击类型(测试站点的路径为 /rce_post、/sqli_get、/upload ...)"""
+    segment = urlparse(url).path.rstrip('/').rpartition('/')[2]
+    match = re.match(r'[A-Za-z]+', segment)
+    return match.group(0).lower() if match else 'root'
+
+
+class BanditScheduler:
+    """
+    上下文 'WAF|攻击类型' -> 变异方法名 -> [请求数, 绕过数]。
+    ucb1: 按 后验均值 + 探索项 选择；thompson: 按 Beta 后验的采样值选择(随机数取自 mutation_random，指定 --seed 时可复现)。
+    """
+
+    def __init__(self, strategy=DEFAULT_STRATEGY, path=None, exploration=DEFAULT_EXPLORATION):
+        self.strategy = strategy
+        self.path = path
+        self.exploration = exploration
+        self._stats = {}
+        # 变异方法名 -> 所有上下文合计的 [请求数, 绕过数]
+        self._pooled = {}
+        # 上次保存(或取出)之后新增的计数，保存时累加到磁盘上的统计
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.updates = 0
+
+    def configure(self, strategy=None, path=None, exploration=None):
+        if strategy is not None:
+            if strategy not in STRATEGIES:
+                raise ValueError("unknown scheduler strategy: " + str(strategy))
+            self.strategy = strategy
+        if exploration is not None:
+            self.exploration = exploration
+        if path is not None:
+            self.path = path
+            self.load()
+
+    @property
+    def enabled(self):
+        return self.strategy != STRATEGY_WEIGHTED
+
+    @staticmethod
+    def context(waf, url):
+        return str(waf) + CONTEXT_SEPARATOR + attack_class(url)
+
+    def update(self, context, mutant_method_name, bypassed):
+        """记录一个变异请求的结果"""
+        with self._lock:
+            self._add(context, mutant_method_name, 1, 1 if bypassed else 0)
+            self.updates += 1
+
+    def _add(self, context, name, requests, bypasses, pending=True):
+        targets = [self._stats.setdefault(context, {}).setdefault(name, [0, 0]),
+                   self._pooled.setdefault(name, [0, 0])]
+        if pending:
+            targets.append(self._pending.setdefault(context, {}).setdefault(name, [0, 0]))
+        for counts in targets:
+            counts[_REQUESTS] += requests
+            counts[_BYPASSES] += bypasses
+
+    def pop_updates(self):
+        """取出上次取出之后新增的计数(子进程/工作者随结果返回给父进程或协调者)"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        return pending
+
+    def merge_updates(self, updates):
+        """累加子进程或工作者新增的计数"""
+        with self._lock:
+            for context, methods in updates.items():
+                for name, (requests, bypasses) in methods.items():
+                    self._add(context, name, requests, bypasses)
+                    self.updates += requests
+
+    def _counts(self, contexts, name):
+        requests = bypasses = 0
+        for context in contexts:
+            counts = self._stats.get(context, {}).get(name)
+            if counts:
+                requests += counts[_REQUESTS]
+                bypasses += counts[_BYPASSES]
+        return requests, bypasses
+
+    def _prior(self, name, base_rate):
+        """该方法在所有上下文中的绕过率，以全局绕过率平滑"""
+        requests, bypasses = self._pooled.get(name, (0, 0))
+        return (bypasses + base_rate) / (requests + 1)
+
+    def _scores(self, contexts, names):
+        with self._lock:
+            total_requests = sum(counts[_REQUESTS] for counts in self._pooled.values())
+            total_bypasses = sum(counts[_BYPASSES] for counts in self._pooled.values())
+            base_rate = (total_bypasses + 1) / (total_requests + 2)
+            counts = {name: self._counts(contexts, name) for name in names}
+            priors = {name: self._prior(name, base_rate) for name in names}
+        context_requests = sum(requests for requests, _ in counts.values())
+        scores = {}
+        for name in names:
+            requests, bypasses = counts[name]
+            prior = priors[name]
+            if self.strategy == STRATEGY_THOMPSON:
+                alpha = bypasses + PRIOR_WEIGHT * prior
+                beta = requests - bypasses + PRIOR_WEIGHT * (1 - prior)
+                scores[name] = mutation_random.betavariate(alpha, beta)
+            else:
+                mean = (bypasses + PRIOR_WEIGHT * prior) / (requests + PRIOR_WEIGHT)
+                bonus = self.exploration * math.sqrt(2 * math.log(context_requests + 1) / (requests + PRIOR_WEIGHT))
+                scores[name] = mean + bonus
+        return scores
+
+    def order(self, contexts, mutant_methods):
+        """
+        逐个返回下一个要执行的变异方法: 每次按当前统计在剩余方法中选出得分最高的，得分相同时保持原顺序。
+        多个目标共享一个变异载荷流时 contexts 有多个，统计合并计算。
+        """
+        remaining = list(mutant_methods)
+        while remaining:
+            if not self.enabled:
+                yield from remaining
+                return
+            scores = self._scores(contexts, [mutant_method.__name__ for mutant_method in remaining])
+            best = max(range(len(remaining)), key=lambda index: (scores[remaining[index].__name__], -index))
+            mutant_method = remaining.pop(best)
+            logger.debug(TAG + "==>selected " + mutant_method.__name__ + " for " + str(contexts) + " score " +
+                         str(round(scores[mutant_method.__name__], 4)))
+            yield mutant_method
+
+    def ranked(self, contexts, mutant_methods):
+        """按当前统计排好的完整顺序(组合变异需要事先确定方法顺序)"""
+        if not self.enabled:
+            return list(mutant_methods)
+        scores = self._scores(contexts, [mutant_method.__name__ for mutant_method in mutant_methods])
+        indexed = sorted(enumerate(mutant_methods), key=lambda item: (-scores[item[1].__name__], item[0]))
+        return [mutant_method for _, mutant_method in indexed]
+
+    def reset(self):
+        """清空内存中的统计(不影响磁盘上的文件)"""
+        with self._lock:
+            self._stats = {}
+            self._pooled = {}
+            self._pending = {}
+            self.updates = 0
+
+    def _read(self):
+        """读取磁盘上的统计，文件不存在时为空，读取失败时返回 None"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f).get('stats', {})
+        except (OSError, ValueError, AttributeError) as e:
+            logger.error(TAG + "==>failed to load bandit stats " + self.path + ": " + str(e))
+            return None
+
+    def load(self):
+        if not self.path:
+            return
+        stats = self._read()
+        if not stats:
+            return
+        with self._lock:
+            # 载入的统计替换当前统计，重复载入不会重复计数
+            self._stats = {}
+            self._pooled = {}
+            self._pending = {}
+            for context, methods in stats.items():
+                for name, (requests, bypasses) in methods.items():
+                    self._add(context, name, requests, bypasses, pending=False)
+        logger.info(TAG + "==>loaded bandit stats of " + str(len(stats)) + " contexts from " + self.path)
+
+    def save(self):
+        """在文件锁内把新增的计数累加到磁盘上的统计(其他运行期间写入的计数保留)"""
+        if not self.path:
+            return
+        pending = self.pop_updates()
+        try:
+            with locked_file(self.path):
+                stats = self._read()
+                if stats is None:
+                    # 文件损坏时不覆盖
+                    raise OSError("unreadable stats file")
+                for context, methods in pending.items():
+                    for name, (requests, bypasses) in methods.items():
+                        counts = stats.setdefault(context, {}).setdefault(name, [0, 0])
+                        counts[_REQUESTS] += requests
+                        counts[_BYPASSES] += bypasses
+                atomic_write_json(self.path, {'stats': stats}, indent=4, sort_keys=True)
+        except OSError as e:
+            logger.error(TAG + "==>failed to save bandit stats " + self.path + ": " + str(e))
+            # 保存失败时新增计数放回，下次保存时再写
+            with self._lock:
+                for context, methods in pending.items():
+                    for name, (requests, bypasses) in methods.items():
+                        counts = self._pending.setdefault(context, {}).setdefault(name, [0, 0])
+                        counts[_REQUESTS] += requests
+                        counts[_BYPASSES] += bypasses
+            return
+        logger.info(TAG + "==>saved bandit stats of " + str(len(stats)) + " contexts to " + self.path)
+
+    def report(self):
+        with self._lock:
+            best = {}
+            for context, methods in self._stats.items():
+                name, (requests, bypasses) = max(
+                    methods.items(), key=lambda item: (item[1][_BYPASSES] / item[1][_REQUESTS], item[1][_BYPASSES]))
+                best[context] = name + " " + str(bypasses) + "/" + str(requests)
+            stats = {'strategy': self.strategy, 'updates': self.updates, 'contexts': len(self._stats)}
+        logger.info(TAG + "==>bandit scheduler stats: " + str(stats))
+        for context, summary in best.items():
+            logger.info(TAG + "==>best mutant method for " + context + ": " + summary)
+        return stats
+
+
+# 全局共享的变异方法调度器
+bandit_scheduler = BanditScheduler()
+
+
+if __name__ == '__main__':
+    # 在本地测试 WAF 上对比各策略每个载荷到首次绕过所需的变异请求数，weighted 即 get_weighted_mutant_methods
+    # 按 config/memory.json 中历史成功次数排序的顺序(--disable_shortcut 时新站点使用的顺序)。
+    # 需要先启动 test-wafs/a-simple-waf(docker-compose up -d，原始站点 8001-8003，WAF 9001-9003)，
+    # 路由表为 config/routes.json；载荷集重复 rounds 遍，调度器在每个策略开始时清空统计
+    # usage: cd src && python -m utils.prowler_bandit [payload_folder] [rounds]
+    import random
+    import sys
+
+    # 以 -m 运行时本模块是 __main__，发送端使用的是 utils.prowler_bandit 中的实例
+    from utils.prowler_bandit import bandit_scheduler
+    from utils.prowler_dedup_cache import dedup_cache
+    from utils.prowler_mutation_cache import mutation_cache
+    from utils.prowler_parse_raw_payload import prowler_begin_to_sniff_payload
+    from utils.prowler_process_requests import prowler_begin_to_send_payloads
+    from utils.prowler_routes import route_table
+
+    folder = sys.argv[1] if len(sys.argv) > 1 else "config/payload/json/PHP5"
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    route_table.configure("config/routes.json")
+    # 重复发送同一个变异载荷时需要真实的响应，变异载荷在各策略之间保持一致
+    dedup_cache.configure(enabled=False)
+    mutation_cache.configure(seed=0)
+    payloads = prowler_begin_to_sniff_payload(folder)
+    # 原始站点的响应作为判断绕过的基准
+    prowler_begin_to_send_payloads("localhost", 8001, payloads)
+    summary = {}
+    for strategy in (STRATEGY_WEIGHTED, STRATEGY_UCB1, STRATEGY_THOMPSON):
+        random.seed(0)
+        bandit_scheduler.configure(strategy=strategy)
+        bandit_scheduler.reset()
+        counts = []
+        for round_index in range(rounds):
+            for payload in payloads:
+                results = prowler_begin_to_send_payloads("localhost", 8001, [payload], waf=True,
+                                                         PAYLOAD_MUTANT_ENABLED=True, enable_shortcut=False)
+                mutants = [result for result in results if 'mutant_method' in str(result['payload'])]
+                first = next((index + 1 for index, result in enumerate(mutants) if result['success']), None)
+                counts.append((round_index, payload['url'], first, len(mutants)))
+        summary[strategy] = counts
+    for strategy, counts in summary.items():
+        print(strategy)
+        for round_index, url, first, sent in counts:
+            print("  round " + str(round_index) + " " + url + ": " +
+                  (str(first) if first is not None else "no bypass") + " / " + str(sent) + " requests")
+        bypassed = [first for _, _, first, _ in counts if first is not None]
+        print("  bypassed " + str(len(bypassed)) + "/" + str(len(counts)) + " payloads, mean " +
+              str(round(sum(bypassed) / max(len(bypassed), 1), 2)) + " requests to first bypass")
@@ -0,0 +1,164 @@
+import threading
+import time
+
+from utils.logUtils import LoggerSingleton
+from utils.prowler_rate_limiter import rate_scheduler
+from utils.prowler_timeout_manager import OUTCOME_FAILURE
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_circuit_breaker.py: "
+
+# 连续多少次连接失败后断开(open)
+DEFAULT_FAILURE_THRESHOLD = 5
+# 单个请求遇到超时或连接失败时的最大重试次数
+DEFAULT_MAX_RETRIES = 2
+# 重试的初始退避时间(秒)，每次翻倍
+RETRY_BACKOFF = 0.2
+# 断开后第一次探测前的等待时间(秒)，探测失败时翻倍
+PROBE_BACKOFF = 1.0
+MAX_PROBE_BACKOFF = 30.0
+# 主机持续不可用超过该时长(秒)后不再等待，请求直接发送并快速失败
+DEFAULT_GIVE_UP_AFTER = 300.0
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half-open'
+
+
+class HostCircuit:
+    def __init__(self):
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probe_at = 0
+        self.backoff = PROBE_BACKOFF
+        self.stats = {'opened': 0, 'retried': 0, 'recovered': 0}
+
+
+class CircuitBreaker:
+    """
+    按目标主机的熔断器: 连续连接失败达到阈值后断开，暂停该主机的调度；
+    之后按指数退避只放行一个探测请求，探测成功即恢复，所有等待中的请求继续发送。
+    超时与连接失败在有限次数内带退避重试。
+    usage:
+        response = circuit_breaker.call(netloc, lambda: send_raw_request(raw_request))
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, max_retries=DEFAULT_MAX_RETRIES,
+                 give_up_after=DEFAULT_GIVE_UP_AFTER):
+        self.failure_threshold = failure_threshold
+        self.max_retries = max_retries
+        self.give_up_after = give_up_after
+        self._hosts = {}
+        self._cond = threading.Condition()
+
+    def configure(self, failure_threshold=None, max_retries=None, give_up_after=None):
+        with self._cond:
+            if failure_threshold is not None:
+                self.failure_threshold = failure_threshold
+            if max_retries is not None:
+                self.max_retries = max_retries
+            if give_up_after is not None:
+                self.give_up_after = give_up_after
+
+    def _circuit(self, host):
+        circuit = self._hosts.get(host)
+        if circuit is None:
+            circuit = self._hosts[host] = HostCircuit()
+        return circuit
+
+    def _given_up(self, circuit, now):
+        return circuit.state != STATE_CLOSED and now - circuit.opened_at > self.give_up_after
+
+    def wait(self, host):
+        """阻塞直到主机可用(已恢复，或轮到本请求作为探测请求)；主机长时间不可用时不再等待"""
+        with self._cond:
+            circuit = self._circuit(host)
+            while True:
+                now = time.monotonic()
+                if circuit.state == STATE_CLOSED or self._given_up(circuit, now):
+                    return
+                if circuit.state == STATE_OPEN and now >= circuit.probe_at:
+                    circuit.state = STATE_HALF_OPEN
+                    logger.info(TAG + "==>probe " + host)
+                    return
+                # 半开状态下等待探测结果，断开状态下等到探测时间
+                timeout = circuit.probe_at - now if circuit.state == STATE_OPEN else None
+                self._cond.wait(timeout=timeout)
+
+    def record(self, host, error):
+        """记录一次发送结果，error 为 None 表示拿到了响应"""
+        with self._cond:
+            circuit = self._circuit(host)
+            if error is None:
+                if circuit.state != STATE_CLOSED:
+                    circuit.stats['recovered'] += 1
+                    logger.warning(TAG + "==>host " + host + " is back after " +
+                                   str(round(time.monotonic() - circuit.opened_at, 1)) + "s")
+                circuit.state = STATE_CLOSED
+                circuit.failures = 0
+                circuit.backoff = PROBE_BACKOFF
+                self._cond.notify_all()
+                return
+            if error != OUTCOME_FAILURE and circuit.state == STATE_CLOSED:
+                # 超时不计入连续连接失败
+                return
+            circuit.failures += 1
+            if circuit.state == STATE_HALF_OPEN:
+                # 探测失败，退避时间翻倍后再次探测
+                circuit.backoff = min(MAX_PROBE_BACKOFF, circuit.backoff * 2)
+                self._open(host, circuit, reopen=True)
+            elif circuit.state == STATE_CLOSED and circuit.failures >= self.failure_threshold:
+                circuit.opened_at = time.monotonic()
+                circuit.stats['opened'] += 1
+                self._open(host, circuit)
+
+    def _open(self, host, circuit, reopen=False):
+        circuit.state = STATE_OPEN
+        circuit.probe_at = time.monotonic() + circuit.backoff
+        # 暂停该主机的调度，直到下一次探测
+        rate_scheduler.pause(host, circuit.backoff)
+        if not reopen:
+            logger.warning(TAG + "==>host " + host + " unreachable after " + str(circuit.failures) +
+                           " consecutive failures, pause and probe every " + str(circuit.backoff) + "s")
+        self._cond.notify_all()
+
+    def call(self, host, send):
+        """
+        send() 返回带 error 属性(None/'timeout'/'failure')的响应。
+        等待主机可用后发送，超时或连接失败时带退避重试，返回最后一次的响应。
+        熔断器断开期间的失败不计入重试次数，请求等待主机恢复后重发，直到超过 give_up_after。
+        """
+        attempt = 0
+        while True:
+            self.wait(host)
+            response = send()
+            error = getattr(response, 'error', None)
+            self.record(host, error)
+            if error is None:
+                return response
+            with self._cond:
+                circuit = self._circuit(host)
+                if self._given_up(circuit, time.monotonic()):
+                    return response
+                host_down = circuit.state != STATE_CLOSED
+                if not host_down:
+                    if attempt >= self.max_retries:
+                        return response
+                    attempt += 1
+                circuit.stats['retried'] += 1
+            if not host_down:
+                logger.warning(TAG + "==>" + error + " on " + host + ", retry " + str(attempt) + "/" +
+                               str(self.max_retries))
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+
+    def report(self):
+        with self._cond:
+            snapshot = {host: (circuit.state, dict(circuit.stats)) for host, circuit in self._hosts.items()}
+        for host, (state, stats) in snapshot.items():
+            logger.info(TAG + "==>host: " + host + " state: " + state + " stats: " + str(stats))
+        return snapshot
+
+
+# 全局共享的熔断器
+circuit_breaker = CircuitBreaker()
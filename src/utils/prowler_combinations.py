@@ -0,0 +1,114 @@
+from utils.logUtils import LoggerSingleton
+from utils.prowler_applicability import applicability_index, request_shape
+from utils.prowler_request import ProwlerRequest
+from utils.prowler_mutation_cache import mutation_cache
+from utils.prowler_request_analysis import RequestAnalysis
+from utils.prowler_segmented_body import materialize_body
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_combinations.py: "
+
+# 每个原始载荷最多生成的组合数，None 表示不限制
+DEFAULT_MAX_COMBINATIONS = None
+
+
+class _Prefix:
+    """前缀树的一个节点: 依次执行前缀中的变异方法后得到的请求，及其按需创建、由所有子节点共享的解析结果"""
+
+    __slots__ = ('request', '_analysis', '_shape')
+
+    def __init__(self, request, analysis=None):
+        self.request = request
+        self._analysis = analysis
+        self._shape = None
+
+    @property
+    def analysis(self):
+        if self._analysis is None:
+            request = self.request
+            self._analysis = RequestAnalysis(request.headers, request.url, request.method, request.data)
+        return self._analysis
+
+    @property
+    def shape(self):
+        if self._shape is None:
+            self._shape = request_shape(*self.request.fields(), self.analysis)
+        return self._shape
+
+
+def apply_step(prefix, mutant_method):
+    """
+    在前缀的请求上执行一个变异方法，取第一个子载荷作为组合的下一步；没有子载荷时请求不变，沿用原节点。
+    变异方法不适用于前缀请求的形态时同样沿用原节点，不复制请求。
+    组合中的后续变异方法按字符串处理请求体，分段的填充请求体在此合并。
+    """
+    if not applicability_index.applies(mutant_method, prefix.shape):
+        return prefix
+    sub_payloads = mutation_cache.apply(prefix.request, mutant_method, prefix.analysis)
+    if not sub_payloads:
+        return prefix
+    first = sub_payloads[0]
+    return _Prefix(ProwlerRequest.from_payload(first).replace(data=materialize_body(first['data'])))
+
+
+def apply_chain(request, mutant_methods, analysis=None):
+    """依次执行一组变异方法(组合或记忆中的方法链)，返回最终的 ProwlerRequest"""
+    prefix = _Prefix(request, analysis)
+    for mutant_method in mutant_methods:
+        prefix = apply_step(prefix, mutant_method)
+    return prefix.request
+
+
+class CombinationEngine:
+    """
+    按前缀树生成变异方法组合: 组合顺序与 itertools.combinations 按长度从短到长相同，
+    但 (A,B) 与 (A,C) 共用执行 A 之后的请求，每个不同的前缀只执行一次变异方法。
+    逐层生成，只保留上一层(长度 r-1)的前缀；调用方停止读取后不再生成后续组合。
+    usage:
+        combination_engine.configure(max_combinations=500)
+        for combination, request in combination_engine.iter_combinations(request, methods, 3):
+            ...
+    """
+
+    def __init__(self, max_combinations=DEFAULT_MAX_COMBINATIONS):
+        self.max_combinations = max_combinations
+
+    def configure(self, max_combinations=None):
+        # 0 或负数表示不限制
+        if max_combinations is not None:
+            self.max_combinations = max_combinations if max_combinations > 0 else None
+
+    def iter_combinations(self, request, methods, max_length, analysis=None, max_combinations=None):
+        """
+        逐个返回 (组合, 执行组合中全部变异方法后的 ProwlerRequest)，组合为变异方法的元组。
+        analysis 为原始请求的解析结果；max_combinations 未指定时使用全局配置。
+        """
+        limit = max_combinations if max_combinations is not None else self.max_combinations
+        produced = 0
+        steps = 0
+        # 上一层的前缀: (方法下标元组, 节点)
+        level = [((), _Prefix(request, analysis))]
+        try:
+            for length in range(1, max_length + 1):
+                next_level = []
+                for indexes, prefix in level:
+                    for index in range(indexes[-1] + 1 if indexes else 0, len(methods)):
+                        logger.info(TAG + "==>mutant method: " + str(methods[index]))
+                        child = apply_step(prefix, methods[index])
+                        steps += 1
+                        combination = indexes + (index,)
+                        yield tuple(methods[i] for i in combination), child.request
+                        produced += 1
+                        if limit is not None and produced >= limit:
+                            logger.info(TAG + "==>combination limit " + str(limit) + " reached")
+                            return
+                        # 以最后一个方法结尾的前缀没有后续组合，不保留
+                        if length < max_length and index < len(methods) - 1:
+                            next_level.append((combination, child))
+                level = next_level
+        finally:
+            logger.info(TAG + "==>combinations: " + str(produced) + ", mutation steps: " + str(steps))
+
+
+# 全局共享的组合生成配置
+combination_engine = CombinationEngine()
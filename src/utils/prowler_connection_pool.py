@@ -0,0 +1,214 @@
+import atexit
+import http.client
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+from utils.logUtils import LoggerSingleton
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_connection_pool.py: "
+
+# 每个 netloc 最多保留的空闲连接数
+DEFAULT_POOL_SIZE = 10
+# 空闲连接超过该时长(秒)未被使用则关闭，避免复用已被服务端回收的连接
+DEFAULT_IDLE_TIMEOUT = 30
+
+# 复用旧连接时可能遇到的“连接已被对端关闭”类错误，遇到时换新连接重试一次
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+# sendmsg 单次最多提交的缓冲区个数(不超过常见系统的 IOV_MAX)
+MAX_IOVEC = 1024
+
+
+def send_segments(sock, segments):
+    """
+    把多个缓冲区依次写出而不拼接: 支持 sendmsg 时分散写(writev)，处理部分写入；否则逐段 sendall。
+    """
+    if not hasattr(sock, 'sendmsg'):
+        for segment in segments:
+            sock.sendall(segment)
+        return
+    views = deque(memoryview(segment).cast('B') for segment in segments if len(segment))
+    while views:
+        sent = sock.sendmsg(list(itertools.islice(views, MAX_IOVEC)))
+        while views and sent >= len(views[0]):
+            sent -= len(views.popleft())
+        if sent:
+            views[0] = views[0][sent:]
+
+
+class ConnectionPool:
+    """
+    按 netloc 复用的 HTTP/1.1 长连接池。
+    usage:
+        conn, response = connection_pool.urlopen(netloc, method, url, body=body, headers=headers, timeout=timeout)
+        data = response.read()
+        connection_pool.release(netloc, conn, response)
+    只有保持长连接的请求才能复用连接: 载荷自带的 Connection: close 在序列化时已去掉(见 prowler_raw_request)，
+    仍带有 close 的请求(RawRequest.closes)导致的关闭计入 stats['self_closed']。
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        # netloc -> deque[(conn, last_used)]
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.stats = {'created': 0, 'reused': 0, 'retried': 0, 'discarded': 0, 'self_closed': 0}
+
+    def configure(self, pool_size=None, idle_timeout=None):
+        with self._lock:
+            if pool_size is not None:
+                self.pool_size = pool_size
+            if idle_timeout is not None:
+                self.idle_timeout = idle_timeout
+        logger.info(TAG + "==>pool size: " + str(self.pool_size) + " idle timeout: " + str(self.idle_timeout))
+
+    def _evict_idle(self, idle, now):
+        # 从最旧的一端开始清理过期连接
+        while idle and now - idle[0][1] > self.idle_timeout:
+            conn, _ = idle.popleft()
+            conn.close()
+            self.stats['discarded'] += 1
+
+    def acquire(self, netloc, timeout):
+        """取出一个空闲连接，没有则新建。返回 (conn, reused)"""
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(netloc)
+            if idle:
+                self._evict_idle(idle, now)
+                if idle:
+                    # 后进先出，优先使用最近用过的连接
+                    conn, _ = idle.pop()
+                    self.stats['reused'] += 1
+                    conn.timeout = timeout
+                    return conn, True
+            self.stats['created'] += 1
+        return http.client.HTTPConnection(netloc, timeout=timeout), False
+
+    def release(self, netloc, conn, response=None):
+        """归还连接；服务端要求关闭、响应体未读完或请求报文无法分界(见 RawRequest.framed)的连接直接丢弃"""
+        reusable = conn.sock is not None
+        if response is not None and (response.will_close or not response.isclosed() or
+                                     not getattr(response, 'framed', True)):
+            reusable = False
+        if not reusable:
+            conn.close()
+            with self._lock:
+                self.stats['discarded'] += 1
+                if response is not None and response.will_close and getattr(response, 'requested_close', False):
+                    self.stats['self_closed'] += 1
+            return
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault(netloc, deque())
+            self._evict_idle(idle, now)
+            if len(idle) >= self.pool_size:
+                conn.close()
+                self.stats['discarded'] += 1
+                return
+            idle.append((conn, now))
+
+    def discard(self, conn):
+        conn.close()
+        with self._lock:
+            self.stats['discarded'] += 1
+
+    def _send(self, conn, method, url, body, headers, read_timeout, raw=None):
+        # 显式建立连接以分别统计连接耗时与响应耗时，连接建立后切换为读取超时
+        connect_latency = None
+        if conn.sock is None:
+            start = time.perf_counter()
+            conn.connect()
+            connect_latency = time.perf_counter() - start
+        conn.sock.settimeout(read_timeout)
+        start = time.perf_counter()
+        if raw is not None:
+            # 已序列化的原始报文直接写出，绕过 http.client 对请求行与请求头的规整
+            if isinstance(raw, (bytes, bytearray)):
+                conn.sock.sendall(raw)
+            elif hasattr(raw, 'write_to'):
+                # RawRequest: 分段报文，可能带有流式写出的分块请求体
+                raw.write_to(conn.sock)
+            else:
+                send_segments(conn.sock, raw)
+            response = conn.response_class(conn.sock, method=method)
+            try:
+                response.begin()
+            except Exception:
+                response.close()
+                raise
+        else:
+            conn.request(method, url, body=body, headers=headers or {})
+            response = conn.getresponse()
+        response.connect_latency = connect_latency
+        response.requested_close = getattr(raw, 'closes', False)
+        response.framed = getattr(raw, 'framed', True)
+        response.elapsed = time.perf_counter() - start
+        return response
+
+    def urlopen(self, netloc, method, url, body=None, headers=None, timeout=None, raw=None):
+        """
+        通过连接池发送请求并获取响应头，返回 (conn, response)。
+        timeout 可以是一个数值，也可以是 (connect_timeout, read_timeout)。
+        raw 为已序列化的完整报文(见 prowler_raw_request，RawRequest、bytes 或分段列表)时原样发送，
+        忽略 url/body/headers。
+        响应上附带 connect_latency(复用连接时为 None) 与 elapsed 两个耗时字段。
+        复用的连接若已被对端关闭(broken pipe / reset)，换一个新连接重试一次；
+        超时等其他错误直接抛出，由调用方处理。
+        """
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+        else:
+            connect_timeout = read_timeout = timeout
+        conn, reused = self.acquire(netloc, connect_timeout)
+        try:
+            response = self._send(conn, method, url, body, headers, read_timeout, raw)
+        except STALE_CONNECTION_ERRORS as e:
+            self.discard(conn)
+            if not reused:
+                raise
+            logger.debug(TAG + "==>stale connection to " + netloc + ", retry with a new one: " + str(e))
+            with self._lock:
+                self.stats['retried'] += 1
+                self.stats['created'] += 1
+            conn = http.client.HTTPConnection(netloc, timeout=connect_timeout)
+            try:
+                response = self._send(conn, method, url, body, headers, read_timeout, raw)
+            except Exception:
+                self.discard(conn)
+                raise
+        except Exception:
+            self.discard(conn)
+            raise
+        return conn, response
+
+    def close_all(self):
+        with self._lock:
+            for idle in self._idle.values():
+                while idle:
+                    conn, _ = idle.pop()
+                    conn.close()
+            self._idle.clear()
+        logger.debug(TAG + "==>connection pool stats: " + str(self.stats))
+
+    def reset_after_fork(self):
+        # 子进程不能与父进程共用 socket，丢弃继承来的空闲连接(不关闭，避免影响父进程)
+        self._idle = {}
+        self._lock = threading.Lock()
+
+
+# 全局共享的连接池，原始载荷、WAF 载荷以及强化学习环境共用
+connection_pool = ConnectionPool()
+atexit.register(connection_pool.close_all)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=connection_pool.reset_after_fork)
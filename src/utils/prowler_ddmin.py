@@ -0,0 +1,186 @@
+from collections import namedtuple
+
+from utils.logUtils import LoggerSingleton
+from utils.prowler_combinations import apply_chain
+from utils.prowler_mutant_methods import mutant_methods_config
+from utils.prowler_request import MutantRequest
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_ddmin.py: "
+
+"""
+绕过成功后的增量调试(ddmin): 把成功的变异拆成若干部分(组合中的变异方法，或变异载荷相对原始请求的各项改动)，
+找出仍能绕过的最小子集。每个子集只交给判定函数一次(结果缓存)，判定次数约为 O(k·log n) 而不是组合数。
+usage:
+    minimized = minimize_chain(request, 'a+b+c', still_bypasses)
+    minimized.items  # 仍能绕过的最少变异方法
+"""
+
+# 方法链中变异方法名的分隔符，与组合变异载荷的 mutant_method 一致
+CHAIN_SEPARATOR = '+'
+
+# items: 最小子集(保持原顺序)，tests: 实际调用判定函数的次数(不含缓存命中)
+Minimized = namedtuple('Minimized', ['items', 'tests'])
+
+# 请求改动中表示"删除该请求头"
+_REMOVED = object()
+
+
+def _split(indexes, n):
+    """把下标列表尽量均匀地分成 n 份"""
+    size, extra = divmod(len(indexes), n)
+    chunks = []
+    start = 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(indexes[start:end])
+        start = end
+    return chunks
+
+
+def ddmin(items, test):
+    """
+    Zeller 的 ddmin: items 整体满足 test(绕过成功)、空集不满足，返回满足 test 的 1-最小子集。
+    test(subset) 接收按原顺序排列的子集；同一子集只判定一次。
+    """
+    cache = {frozenset(range(len(items))): True, frozenset(): False}
+    tests = 0
+
+    def check(indexes):
+        nonlocal tests
+        key = frozenset(indexes)
+        if key not in cache:
+            tests += 1
+            cache[key] = bool(test([items[i] for i in indexes]))
+        return cache[key]
+
+    current = list(range(len(items)))
+    n = 2
+    while len(current) >= 2:
+        chunks = _split(current, n)
+        for chunk in chunks:
+            if check(chunk):
+                # 某一份单独即可绕过
+                current, n = chunk, 2
+                break
+        else:
+            for chunk in chunks:
+                complement = [i for i in current if i not in chunk]
+                if check(complement):
+                    # 去掉某一份后仍可绕过
+                    current, n = complement, max(n - 1, 2)
+                    break
+            else:
+                if n >= len(current):
+                    break
+                n = min(len(current), 2 * n)
+    return Minimized([items[i] for i in current], tests)
+
+
+def split_chain(mutant_method_name):
+    return mutant_method_name.split(CHAIN_SEPARATOR)
+
+
+def join_chain(mutant_method_names):
+    return CHAIN_SEPARATOR.join(mutant_method_names)
+
+
+def chain_methods(mutant_method_name):
+    """方法链名 -> 变异方法列表，其中有未配置的方法时返回 None"""
+    names = split_chain(mutant_method_name)
+    if not all(name in mutant_methods_config for name in names):
+        return None
+    return [mutant_methods_config[name][0] for name in names]
+
+
+def minimize_chain(request, mutant_method_name, still_bypasses, analysis=None):
+    """
+    对组合变异 a+b+c 做 ddmin: 在原始请求(ProwlerRequest)上重新执行方法链的子集，
+    交给 still_bypasses(MutantRequest) 判定。返回的 items 为最小方法链中的方法名。
+    """
+    names = split_chain(mutant_method_name)
+    if len(names) < 2:
+        return Minimized(names, 0)
+
+    def test(subset):
+        chain = apply_chain(request, [mutant_methods_config[name][0] for name in subset], analysis)
+        return still_bypasses(MutantRequest(*chain.fields(), mutant_method=join_chain(subset),
+                                            original_url=request.url))
+
+    minimized = ddmin(names, test)
+    logger.info(TAG + "==>minimized " + mutant_method_name + " to " + join_chain(minimized.items) + " with " +
+                str(minimized.tests) + " tests")
+    return minimized
+
+
+def request_changes(request, mutant):
+    """变异载荷相对原始请求的各项改动: ('header', 名称, 值或删除) / ('url' | 'method' | 'data' | 'files', 值)"""
+    changes = []
+    original_headers = dict(request.headers or {})
+    mutant_headers = dict(mutant['headers'] or {})
+    for name in original_headers:
+        if name not in mutant_headers:
+            changes.append(('header', name, _REMOVED))
+    for name, value in mutant_headers.items():
+        if original_headers.get(name, _REMOVED) != value:
+            changes.append(('header', name, value))
+    for field in ('url', 'method', 'data', 'files'):
+        value = mutant[field]
+        if value != getattr(request, field):
+            changes.append((field, value))
+    return changes
+
+
+def apply_changes(request, changes, mutant_method=None):
+    """在原始请求上只应用部分改动，返回 MutantRequest"""
+    headers = dict(request.headers or {})
+    fields = {'url': request.url, 'method': request.method, 'data': request.data, 'files': request.files}
+    for change in changes:
+        if change[0] == 'header':
+            _, name, value = change
+            if value is _REMOVED:
+                headers.pop(name, None)
+            else:
+                headers[name] = value
+        else:
+            fields[change[0]] = change[1]
+    return MutantRequest(headers, fields['url'], fields['method'], fields['data'], fields['files'],
+                         mutant_method=mutant_method, original_url=request.url)
+
+
+def minimize_request(request, mutant, still_bypasses):
+    """
+    对一个绕过成功的变异载荷做 ddmin: 找出仍能绕过的最少改动(请求头、url、方法、请求体)。
+    返回 (只含这些改动的 MutantRequest, 判定次数)。
+    """
+    changes = request_changes(request, mutant)
+    mutant_method = mutant.get('mutant_method')
+    minimized = ddmin(changes, lambda subset: still_bypasses(apply_changes(request, subset, mutant_method)))
+    logger.info(TAG + "==>minimized " + str(mutant_method) + " from " + str(len(changes)) + " to " +
+                str(len(minimized.items)) + " changes with " + str(minimized.tests) + " tests")
+    return apply_changes(request, minimized.items, mutant_method), minimized.tests
+
+
+if __name__ == '__main__':
+    # 判定次数: ddmin 与按长度从短到长穷举组合(dd_mutant 的做法)找到最小方法链所需的请求数
+    # usage: cd src && python -m utils.prowler_ddmin
+    import itertools
+    import random
+    random.seed(0)
+    for size, needed in ((8, 1), (16, 2), (32, 2), (64, 3)):
+        chain = list(range(size))
+        required = set(random.sample(chain, needed))
+        minimized = ddmin(chain, lambda subset: required <= set(subset))
+        brute_force = 0
+        for r in range(1, size + 1):
+            found = False
+            for combination in itertools.combinations(chain, r):
+                brute_force += 1
+                if required <= set(combination):
+                    found = True
+                    break
+            if found:
+                break
+        assert set(minimized.items) == required
+        print("chain of " + str(size) + ", " + str(needed) + " required: ddmin " + str(minimized.tests) +
+              " tests, enumeration " + str(brute_force) + " tests")
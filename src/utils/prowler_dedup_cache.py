@@ -0,0 +1,96 @@
+import threading
+from collections import Counter, OrderedDict
+
+from utils.logUtils import LoggerSingleton
+from utils.prowler_request import result_payload
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_dedup_cache.py: "
+
+# 缓存的请求指纹数量上限，超过后淘汰最久未命中的
+DEFAULT_MAX_ENTRIES = 10000
+
+
+def is_cacheable(result):
+    """只缓存拿到了正常响应的结果；超时、连接失败与限流(429/503)需要真正重发"""
+    status = result.get('response_status_code')
+    return result.get('error') is None and isinstance(status, int) and status not in (429, 503)
+
+
+class RequestDedupCache:
+    """
+    本次运行内的请求去重缓存: 以序列化后报文的指纹为键保存结果，
+    不同变异方法生成的字节完全相同的请求(以及深度变异重新生成的请求)直接复用已有结果，不再发送。
+    usage:
+        fingerprint = raw_request.fingerprint()
+        result = dedup_cache.lookup(fingerprint, payload)
+        if result is None:
+            result = run_payload(...)
+            dedup_cache.store(fingerprint, result)
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, enabled=True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        # mutant_method -> 节省的发送次数
+        self.saved = Counter()
+        # 本进程内命中的总次数(不随 pop_saved 清空)，变异轮次据此判断是否只得到了重复的请求
+        self.hits = 0
+
+    def configure(self, max_entries=None, enabled=None):
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if enabled is not None:
+                self.enabled = enabled
+
+    def lookup(self, fingerprint, payload):
+        """命中时返回已有结果的副本(payload 字段替换为当前载荷)，否则返回 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            result = self._results.get(fingerprint)
+            if result is None:
+                return None
+            self._results.move_to_end(fingerprint)
+            self.saved[payload.get('mutant_method', 'unknown')] += 1
+            self.hits += 1
+        logger.debug(TAG + "==>duplicate request " + fingerprint + ", reuse result of " + str(result['payload']))
+        result = dict(result)
+        result['payload'] = result_payload(payload)
+        result['success'] = ''
+        return result
+
+    def store(self, fingerprint, result):
+        if not self.enabled or not is_cacheable(result):
+            return
+        with self._lock:
+            self._results[fingerprint] = dict(result)
+            self._results.move_to_end(fingerprint)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def pop_saved(self):
+        """取出并清空各方法节省的发送次数(子进程汇总给父进程时使用)"""
+        with self._lock:
+            saved, self.saved = self.saved, Counter()
+        return saved
+
+    def merge_saved(self, saved):
+        with self._lock:
+            self.saved.update(saved)
+
+    def report(self):
+        """输出每个变异方法因去重而节省的发送次数"""
+        with self._lock:
+            saved = dict(self.saved)
+        logger.info(TAG + "==>sends saved by dedup: " + str(sum(saved.values())))
+        for method, count in sorted(saved.items(), key=lambda item: -item[1]):
+            logger.info(TAG + "==>mutant method: " + str(method) + " saved: " + str(count))
+        return saved
+
+
+# 全局共享的去重缓存
+dedup_cache = RequestDedupCache()
@@ -0,0 +1,341 @@
+import base64
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+
+from utils.logUtils import LoggerSingleton
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_distributed.py: "
+
+"""
+协调者/工作者模式: 协调者把 prowler_begin_to_sniff_payload 得到的载荷作为工作单元，通过本地 TCP 协议分发；
+其他主机上的工作者领取单元，执行原始站点测试与 WAF/变异测试，把结果推回协调者，由协调者统一合并为
+一个结果文件和 memory.json。
+协议: 每个请求一个 TCP 连接，请求与响应各为一行 JSON。
+    {"op": "lease", "worker": id}                         -> {"op": "unit", "unit": n, "payload": {...}, "lease": s}
+                                                             | {"op": "wait", "retry": s} | {"op": "done"}
+    {"op": "renew", "worker": id, "unit": n}              -> {"op": "ok"} | {"op": "lost"}
+    {"op": "result", "worker": id, "unit": n, "result": [...]} -> {"op": "ok"} | {"op": "rejected"}
+    {"op": "release", "worker": id, "unit": n, "error": str}   -> {"op": "ok"}
+工作者超过租约时间没有续租(进程退出、主机宕机)时，单元重新分发给其他工作者。
+只接受领取过该单元的工作者推回的结果。协议没有认证，协调者默认只监听 127.0.0.1，
+监听其他地址(如 0.0.0.0)时只应暴露在可信网络中。
+usage:
+    python main.py -m --coordinator 0.0.0.0:7700
+    python main.py -m --worker coordinator-host:7700
+"""
+
+DEFAULT_COORDINATOR_PORT = 7700
+# 租约时长(秒)，工作者每隔 1/3 租约续租一次
+DEFAULT_LEASE_TIMEOUT = 60.0
+# 所有单元都已分发但尚未完成时，工作者等待多久后再次领取
+WAIT_RETRY = 1.0
+# 一个单元最多分发的次数，超过后记为失败(结果为空)，避免一个总让工作者崩溃的载荷无限重试
+DEFAULT_MAX_ATTEMPTS = 3
+# 全部完成后协调者继续应答 done 的时间，让正在等待的工作者正常退出
+DONE_GRACE = 3 * WAIT_RETRY
+# 工作者连不上协调者时的重试次数
+CONNECT_RETRIES = 5
+MAX_MESSAGE_SIZE = 256 * 1024 * 1024
+
+
+def parse_address(address, default_host="127.0.0.1"):
+    """'host:port' / ':port' / 'port' -> (host, port)"""
+    host, _, port = str(address).rpartition(':')
+    return host or default_host, int(port or DEFAULT_COORDINATOR_PORT)
+
+
+def _encode(value):
+    # bytes 用 base64 表示，元组转为列表
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode('ascii')}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode_object(obj):
+    if len(obj) == 1 and "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+def dumps(message):
+    # 结果中的变异载荷(MutantRequest)按 str() 发送
+    return (json.dumps(_encode(message), ensure_ascii=False, default=str) + "\n").encode('utf-8')
+
+
+def loads(line):
+    return json.loads(line.decode('utf-8'), object_hook=_decode_object)
+
+
+def decode_payload(payload):
+    """JSON 中 files 的 (filename, content, content_type) 元组变成了列表，还原为元组"""
+    files = payload.get('files')
+    if isinstance(files, dict):
+        payload['files'] = {name: tuple(value) if isinstance(value, list) else value for name, value in files.items()}
+    return payload
+
+
+class Coordinator:
+    """
+    分发工作单元并收集结果，单元的租约过期后重新排队。
+    同一单元先到的结果有效，过期租约的工作者晚到的结果被忽略；没有领取过该单元的工作者推回的结果被拒绝。
+    租约过期的单元放回队首尽快重新分发；工作者执行出错释放的单元放到队尾，并且不再分发给失败过的工作者，
+    除非最近一个租约时长内没有其他工作者来领取(只剩这一个工作者时仍会重试)。
+    usage:
+        coordinator = Coordinator(payloads)
+        unit_results = coordinator.serve(("127.0.0.1", 7700))
+    """
+
+    def __init__(self, payloads, lease_timeout=DEFAULT_LEASE_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.payloads = list(payloads)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.pending = deque(range(len(self.payloads)))
+        # unit -> (worker, 租约到期时间)
+        self.leases = {}
+        # unit -> 领取过该单元的工作者(租约过期后晚到的结果仍然有效)
+        self.lessees = [set() for _ in self.payloads]
+        # unit -> 执行该单元出错的工作者
+        self.failed_by = [set() for _ in self.payloads]
+        # worker -> 最近一次领取的时间
+        self.last_seen = {}
+        self.attempts = [0] * len(self.payloads)
+        self.results = {}
+        self.stats = {'leased': 0, 'expired': 0, 'released': 0, 'completed': 0, 'late': 0, 'abandoned': 0,
+                      'rejected': 0}
+        self._cond = threading.Condition()
+
+    def _expire(self, now):
+        for unit, (worker, deadline) in list(self.leases.items()):
+            if deadline < now:
+                del self.leases[unit]
+                self.stats['expired'] += 1
+                logger.warning(TAG + "==>lease of unit " + str(unit) + " held by " + worker + " expired")
+                self._requeue(unit)
+
+    def _requeue(self, unit, front=True):
+        if self.attempts[unit] >= self.max_attempts:
+            # 记为失败: 没有结果
+            self.results[unit] = None
+            self.stats['abandoned'] += 1
+            logger.error(TAG + "==>unit " + str(unit) + " abandoned after " + str(self.attempts[unit]) + " attempts")
+            self._cond.notify_all()
+        elif front:
+            self.pending.appendleft(unit)
+        else:
+            self.pending.append(unit)
+
+    def _next_unit(self, worker, now):
+        """队列中第一个该工作者没有失败过的单元；都失败过时，只有近期没有其他工作者才重试"""
+        for unit in self.pending:
+            if worker not in self.failed_by[unit]:
+                break
+        else:
+            others_active = any(other != worker and now - seen < self.lease_timeout
+                                for other, seen in self.last_seen.items())
+            if others_active:
+                return None
+            unit = self.pending[0]
+        self.pending.remove(unit)
+        return unit
+
+    def finished(self):
+        with self._cond:
+            return len(self.results) == len(self.payloads)
+
+    def lease(self, worker):
+        with self._cond:
+            now = time.monotonic()
+            self._expire(now)
+            self.last_seen[worker] = now
+            unit = self._next_unit(worker, now) if self.pending else None
+            if unit is not None:
+                self.attempts[unit] += 1
+                self.leases[unit] = (worker, now + self.lease_timeout)
+                self.lessees[unit].add(worker)
+                self.stats['leased'] += 1
+                logger.info(TAG + "==>unit " + str(unit) + " leased to " + worker)
+                return {"op": "unit", "unit": unit, "payload": self.payloads[unit], "lease": self.lease_timeout}
+            if len(self.results) < len(self.payloads):
+                return {"op": "wait", "retry": WAIT_RETRY}
+            return {"op": "done"}
+
+    def renew(self, worker, unit):
+        with self._cond:
+            holder = self.leases.get(unit)
+            if holder is None or holder[0] != worker:
+                return {"op": "lost"}
+            self.leases[unit] = (worker, time.monotonic() + self.lease_timeout)
+            return {"op": "ok"}
+
+    def complete(self, worker, unit, result):
+        with self._cond:
+            if not isinstance(unit, int) or not 0 <= unit < len(self.payloads) or worker not in self.lessees[unit]:
+                self.stats['rejected'] += 1
+                logger.warning(TAG + "==>reject result of unit " + str(unit) + " from " + worker +
+                               ": the unit was never leased to it")
+                return {"op": "rejected"}
+            if unit in self.results:
+                self.stats['late'] += 1
+                logger.warning(TAG + "==>ignore late result of unit " + str(unit) + " from " + worker)
+                return {"op": "ok"}
+            self.results[unit] = result
+            self.leases.pop(unit, None)
+            if unit in self.pending:
+                self.pending.remove(unit)
+            self.stats['completed'] += 1
+            logger.info(TAG + "==>unit " + str(unit) + " finished by " + worker + ", " + str(len(self.results)) +
+                        "/" + str(len(self.payloads)))
+            self._cond.notify_all()
+        return {"op": "ok"}
+
+    def release(self, worker, unit, error):
+        """工作者执行单元出错，立即重新排队"""
+        with self._cond:
+            holder = self.leases.get(unit)
+            if holder is not None and holder[0] == worker:
+                del self.leases[unit]
+                self.failed_by[unit].add(worker)
+                self.stats['released'] += 1
+                logger.warning(TAG + "==>unit " + str(unit) + " released by " + worker + ": " + str(error))
+                # 放到队尾，交给其他工作者
+                self._requeue(unit, front=False)
+        return {"op": "ok"}
+
+    def handle(self, message):
+        op = message.get('op')
+        worker = str(message.get('worker'))
+        if op == 'lease':
+            return self.lease(worker)
+        if op == 'renew':
+            return self.renew(worker, message['unit'])
+        if op == 'result':
+            return self.complete(worker, message['unit'], message['result'])
+        if op == 'release':
+            return self.release(worker, message['unit'], message.get('error'))
+        return {"op": "error", "error": "unknown op " + str(op)}
+
+    def serve(self, address):
+        """在 address 上提供服务直到所有单元完成，返回按单元序号排列的结果(放弃的单元为 None)"""
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline(MAX_MESSAGE_SIZE)
+                if not line:
+                    return
+                try:
+                    reply = coordinator.handle(loads(line))
+                except Exception as e:
+                    logger.error(TAG + "==>bad message from " + str(self.client_address) + ": " + str(e))
+                    reply = {"op": "error", "error": str(e)}
+                self.wfile.write(dumps(reply))
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        server = socketserver.ThreadingTCPServer(address, Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(TAG + "==>coordinator listening on " + str(server.server_address) + ", units: " +
+                    str(len(self.payloads)))
+        with self._cond:
+            while len(self.results) < len(self.payloads):
+                # 定期检查过期租约，所有工作者都退出时单元也能重新排队
+                self._cond.wait(timeout=min(self.lease_timeout, 5.0))
+                self._expire(time.monotonic())
+        time.sleep(DONE_GRACE)
+        server.shutdown()
+        server.server_close()
+        self.report()
+        return [self.results[unit] for unit in range(len(self.payloads))]
+
+    def report(self):
+        with self._cond:
+            stats = dict(self.stats)
+        logger.info(TAG + "==>coordinator stats: " + str(stats))
+        return stats
+
+
+def request(address, message, timeout=30.0):
+    with socket.create_connection(address, timeout=timeout) as sock:
+        sock.sendall(dumps(message))
+        with sock.makefile('rb') as reader:
+            line = reader.readline(MAX_MESSAGE_SIZE)
+    if not line:
+        raise ConnectionError("empty reply from coordinator")
+    return loads(line)
+
+
+def _request_with_retry(address, message):
+    for attempt in range(CONNECT_RETRIES):
+        try:
+            return request(address, message)
+        except OSError as e:
+            if attempt == CONNECT_RETRIES - 1:
+                raise
+            logger.warning(TAG + "==>coordinator " + str(address) + " unreachable: " + str(e) + ", retry")
+            time.sleep(WAIT_RETRY * 2 ** attempt)
+
+
+class _Heartbeat(threading.Thread):
+    """执行单元期间定期续租"""
+
+    def __init__(self, address, worker, unit, lease):
+        super().__init__(daemon=True)
+        self.address = address
+        self.worker = worker
+        self.unit = unit
+        self.interval = max(0.1, lease / 3)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                if request(self.address, {"op": "renew", "worker": self.worker, "unit": self.unit})['op'] == 'lost':
+                    logger.warning(TAG + "==>lease of unit " + str(self.unit) + " lost")
+                    return
+            except OSError as e:
+                logger.warning(TAG + "==>renew lease failed: " + str(e))
+
+
+def run_worker(address, handler, worker_id=None):
+    """
+    从协调者领取单元并执行 handler((unit, payload)) -> 结果(可 JSON 序列化)，直到协调者返回 done 或不可达。
+    返回本工作者完成的单元数。
+    """
+    worker_id = worker_id or socket.gethostname() + "-" + str(os.getpid())
+    finished = 0
+    while True:
+        try:
+            reply = _request_with_retry(address, {"op": "lease", "worker": worker_id})
+        except OSError:
+            logger.warning(TAG + "==>coordinator gone, worker " + worker_id + " exits")
+            break
+        if reply['op'] == 'done':
+            break
+        if reply['op'] == 'wait':
+            time.sleep(reply.get('retry', WAIT_RETRY))
+            continue
+        unit = reply['unit']
+        heartbeat = _Heartbeat(address, worker_id, unit, reply['lease'])
+        heartbeat.start()
+        try:
+            result = handler((unit, decode_payload(reply['payload'])))
+        except Exception as e:
+            logger.error(TAG + "==>unit " + str(unit) + " failed: " + str(e))
+            heartbeat.stopped.set()
+            _request_with_retry(address, {"op": "release", "worker": worker_id, "unit": unit, "error": str(e)})
+            continue
+        heartbeat.stopped.set()
+        _request_with_retry(address, {"op": "result", "worker": worker_id, "unit": unit, "result": result})
+        finished += 1
+    logger.info(TAG + "==>worker " + worker_id + " finished " + str(finished) + " units")
+    return finished
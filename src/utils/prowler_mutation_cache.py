@@ -0,0 +1,187 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from utils.fileLockUtils import locked_file
+from utils.logUtils import LoggerSingleton
+from utils.prowler_request import cow_copy
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_mutation_cache.py: "
+
+"""
+可复现、可缓存的变异结果: 指定种子后，一个变异方法在一个请求上的结果由 (方法名, 种子, 请求指纹) 唯一确定
+(见 prowler_random)，结果按该键缓存(LRU，可选保存到磁盘)，RL 的多个回合与同一语料的重复运行不再重复执行变异，
+也可以按种子精确重放某个变异载荷。
+多进程(-mp)运行时，子进程用 pop_updates 取出新增的结果(pickle 字节)随结果返回，由父进程用 merge_updates 合并后统一保存。
+pickle 字节只在本机进程池中传递: 分布式运行时工作者自己保存缓存，协调者不反序列化来自网络的数据。
+usage:
+    mutation_cache.configure(seed=1234, path="config/mutation_cache.pkl")
+    sub_mutant_payloads = mutation_cache.apply(request, mutant_method, analysis)
+"""
+
+# 缓存的变异结果数量上限，超过后淘汰最久未使用的
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_CACHE_FILE = "config/mutation_cache.pkl"
+
+
+class MutationCache:
+    """
+    (方法名, 种子, 请求指纹) -> 变异方法返回的子载荷列表，LRU 淘汰。
+    未配置种子时不缓存，变异方法照常使用全局随机数。
+    返回给调用方的子载荷只复制容器(cow_copy)，缓存中的结果不会被修改。
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, seed=None, path=None):
+        self.max_entries = max_entries
+        self.seed = seed
+        self.path = path
+        self._entries = OrderedDict()
+        # 上次取出之后新增的键
+        self._new_keys = set()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def configure(self, max_entries=None, seed=None, path=None):
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if seed is not None:
+                self.seed = seed
+            if path is not None:
+                self.path = path
+        if path is not None:
+            self.load()
+
+    def apply(self, request, mutant_method, analysis=None, seed=None):
+        """在 request(ProwlerRequest)上执行变异方法；seed 未指定时使用全局配置，两者都没有时不缓存"""
+        seed = self.seed if seed is None else seed
+        if seed is None:
+            return request.apply(mutant_method, analysis)
+        key = (mutant_method.__name__, seed, request.fingerprint())
+        with self._lock:
+            sub_payloads = self._entries.get(key)
+            if sub_payloads is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+        if sub_payloads is None:
+            sub_payloads = request.apply(mutant_method, analysis, seed=seed)
+            with self._lock:
+                self.stats['misses'] += 1
+                self._entries[key] = sub_payloads
+                self._new_keys.add(key)
+                self._evict()
+        return cow_copy(sub_payloads)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            self._new_keys.discard(key)
+
+    def pop_updates(self):
+        """取出上次取出之后新增的结果，序列化为 pickle 字节(没有时为 None)，随本机子进程的结果返回"""
+        with self._lock:
+            entries = OrderedDict((key, self._entries[key]) for key in self._entries if key in self._new_keys)
+            self._new_keys = set()
+        if not entries:
+            return None
+        return pickle.dumps(entries, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def merge_updates(self, data):
+        """合并本机子进程新增的结果(不要用于来自网络的数据)"""
+        if not data:
+            return
+        try:
+            entries = pickle.loads(data)
+        except (pickle.UnpicklingError, EOFError, AttributeError, TypeError) as e:
+            logger.error(TAG + "==>failed to merge worker mutation results: " + str(e))
+            return
+        with self._lock:
+            self._entries.update(entries)
+            self._new_keys.update(entries)
+            self._evict()
+
+    def _read(self):
+        """读取磁盘上的缓存，文件不存在或读取失败时为空"""
+        if not os.path.exists(self.path):
+            return OrderedDict()
+        try:
+            with open(self.path, "rb") as f:
+                return OrderedDict(pickle.load(f))
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError, ValueError) as e:
+            logger.error(TAG + "==>failed to load mutation cache " + self.path + ": " + str(e))
+            return OrderedDict()
+
+    def load(self):
+        if not self.path:
+            return
+        entries = self._read()
+        if not entries:
+            return
+        with self._lock:
+            entries.update(self._entries)
+            self._entries = entries
+            self._evict()
+        logger.info(TAG + "==>loaded " + str(len(entries)) + " mutation results from " + self.path)
+
+    def save(self):
+        """在文件锁内与磁盘上的缓存合并后保存，同时运行的多个工作者保存的结果都会保留"""
+        if not self.path:
+            return
+        with self._lock:
+            memory_entries = OrderedDict(self._entries)
+        try:
+            with locked_file(self.path):
+                entries = self._read()
+                entries.update(memory_entries)
+                while len(entries) > self.max_entries:
+                    entries.popitem(last=False)
+                # 临时文件名带上进程号，多个进程同时保存时互不覆盖
+                temp_path = self.path + "." + str(os.getpid()) + ".tmp"
+                with open(temp_path, "wb") as f:
+                    pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, self.path)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.error(TAG + "==>failed to save mutation cache " + self.path + ": " + str(e))
+            return
+        logger.info(TAG + "==>saved " + str(len(entries)) + " mutation results to " + self.path)
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats, entries=len(self._entries))
+        logger.info(TAG + "==>mutation cache stats: " + str(stats))
+        return stats
+
+
+# 全局共享的变异结果缓存
+mutation_cache = MutationCache()
+
+
+if __name__ == '__main__':
+    # 模拟 RL 训练中的多个回合: 每回合在同一组载荷上执行所有启用的变异方法，对比不缓存与按种子缓存的耗时
+    # usage: cd src && python -m utils.prowler_mutation_cache
+    import logging
+    import time
+    from utils.prowler_mutant_methods import mutant_methods
+    from utils.prowler_request import ProwlerRequest
+
+    logger.setLevel(logging.ERROR)
+    requests = [
+        ProwlerRequest({'Content-Type': 'application/x-www-form-urlencoded'}, 'http://127.0.0.1:8001/rce_post', 'POST',
+                       'cmd=' + 'cat /etc/passwd;' * 64),
+        ProwlerRequest({'User-Agent': 'prowler'}, 'http://127.0.0.1:8001/rce_get?cmd=cat%20/etc/passwd', 'GET', None),
+    ]
+    episodes = 20
+    for name, cache in (("no seed", MutationCache()), ("seeded + cached", MutationCache(seed=0))):
+        start = time.perf_counter()
+        for _ in range(episodes):
+            for request in requests:
+                for mutant_method in mutant_methods:
+                    try:
+                        cache.apply(request, mutant_method)
+                    except Exception:
+                        pass
+        elapsed = time.perf_counter() - start
+        print(name + ": " + str(round(elapsed / episodes * 1000, 2)) + " ms per episode (" + str(len(mutant_methods)) +
+              " methods x " + str(len(requests)) + " payloads), " + str(cache.stats))
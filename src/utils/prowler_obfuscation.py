@@ -0,0 +1,236 @@
+import numpy as np
+
+from utils.logUtils import LoggerSingleton
+from utils.prowler_random import mutation_random
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_obfuscation.py: "
+
+"""
+字符级混淆的批量版本: 一次生成一个字符串的 k 个变体。
+每个位置的候选写法(保持原样 / 大写 / 包一层注释 / 追加换行...)先按码点编成一张表，
+k 个变体的随机选择是一个 (k, n) 的矩阵，按矩阵从表中取出码点后逐行解码，不再逐字符拼接字符串。
+与 prowler_mutant_methods 中逐次调用的 random_case / insert_comments 等函数的概率分布相同；
+随机数种子取自 mutation_random(未指定种子时即 random 模块)，结果同样可以按种子复现。
+usage:
+    variants = random_case_variants("cat /etc/passwd", 8)
+"""
+
+# 每个混淆方法生成的变体数(变异载荷数)
+DEFAULT_VARIANTS = 1
+# 码点表中的填充值(不是合法码点)
+_PAD = np.uint32(0xFFFFFFFF)
+# 一次处理的单元格数(变体数 x 字符数 x 最长写法)上限，超长请求体按变体分块处理
+_MAX_BLOCK_CELLS = 4 * 1024 * 1024
+
+GARBAGE_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&()*~+-_.,:;?@[/|\\]^`="
+NEWLINE_CHARS = ["", "\r", "", "\n", "", "\r\n", ""]
+TAB_CHARS = ["", "\t", "", "\n", "", "\t\n", ""]
+
+
+class VariantGenerator:
+    """
+    混淆变异方法每次生成的变体数，变体数大于 1 时每个 *_obfuscation 变异方法返回多个候选载荷。
+    usage:
+        variant_generator.configure(variants=8)
+    """
+
+    def __init__(self, variants=DEFAULT_VARIANTS):
+        self.variants = variants
+
+    def configure(self, variants=None):
+        if variants is not None:
+            self.variants = max(1, variants)
+
+
+def _rng():
+    return np.random.default_rng(mutation_random.getrandbits(64))
+
+
+def _codes(text):
+    return np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+
+
+def _decode(row):
+    return row[row != _PAD].tobytes().decode('utf-32-le', 'surrogatepass')
+
+
+def _option_table(text, options):
+    """options 为每个字符的候选写法函数，返回 (候选数, 字符数, 最长写法) 的码点表，不足处填充"""
+    written = [list(map(option, text)) for option in options]
+    lengths = np.array([list(map(len, column)) for column in written], dtype=np.intp)
+    table = np.full((len(options), len(text), max(1, lengths.max())), _PAD, dtype=np.uint32)
+    for index, column in enumerate(written):
+        # 整列一次编码，再按每个写法的长度分散到 (位置, 偏移)
+        flat = _codes(''.join(column))
+        positions = np.repeat(np.arange(len(text)), lengths[index])
+        offsets = np.arange(len(flat)) - np.repeat(np.cumsum(lengths[index]) - lengths[index], lengths[index])
+        table[index, positions, offsets] = flat
+    return table
+
+
+def _render(table, choose, k):
+    """choose(rows) 返回 rows 个变体在每个位置选择的候选下标，按表取出码点并解码"""
+    options, length, width = table.shape
+    block = max(1, _MAX_BLOCK_CELLS // max(1, length * width))
+    positions = np.arange(length)
+    variants = []
+    for start in range(0, k, block):
+        rows = min(block, k - start)
+        picked = table[np.asarray(choose(rows), dtype=np.intp), positions].reshape(rows, length * width)
+        variants.extend(_decode(row) for row in picked)
+    return variants
+
+
+def _mask(text, predicate):
+    return np.fromiter((predicate(char) for char in text), dtype=bool, count=len(text))
+
+
+def _inner_positions(text):
+    """insert_comments / insert_spaces 不处理首尾字符"""
+    inner = np.zeros(len(text), dtype=bool)
+    inner[1:len(text) - 1] = True
+    return inner
+
+
+def _variants(text, k, options, choose):
+    if not text:
+        return [text] * k
+    return _render(_option_table(text, options), choose, k)
+
+
+def random_case_variants(text, k):
+    """random_case: 每个字符各以 1/2 的概率大写或小写"""
+    rng = _rng()
+    return _variants(text, k, [str.lower, str.upper], lambda rows: rng.integers(0, 2, (rows, len(text))))
+
+
+def comment_variants(text, k):
+    """insert_comments: 首尾以外的字符各以 1/2 的概率包一层 /* */"""
+    rng = _rng()
+    inner = _inner_positions(text)
+    return _variants(text, k, [str, lambda c: '/*' + c + '*/'],
+                     lambda rows: (rng.random((rows, len(text))) < 0.5) & inner)
+
+
+def case_and_comment_variants(text, k):
+    """random_case(insert_comments(text)) 一次完成: 先决定是否包注释，再决定大小写"""
+    rng = _rng()
+    inner = _inner_positions(text)
+    options = [str.lower, str.upper, lambda c: '/*' + c.lower() + '*/', lambda c: '/*' + c.upper() + '*/']
+    return _variants(text, k, options, lambda rows: rng.integers(0, 2, (rows, len(text))) +
+                     2 * ((rng.random((rows, len(text))) < 0.5) & inner))
+
+
+def space_variants(text, k):
+    """insert_spaces: 首尾以外的字符前各以 1/2 的概率插入空格"""
+    rng = _rng()
+    inner = _inner_positions(text)
+    return _variants(text, k, [str, lambda c: ' ' + c], lambda rows: (rng.random((rows, len(text))) < 0.5) & inner)
+
+
+def line_break_variants(text, k):
+    """insert_line_breaks: 每个字符前各以 1/2 的概率插入 %0A"""
+    rng = _rng()
+    return _variants(text, k, [str, lambda c: '%0A' + c], lambda rows: rng.random((rows, len(text))) < 0.5)
+
+
+def unicode_obfuscate_variants(text, k):
+    """unicode_obfuscate: 每个字符各以 1/2 的概率写成 \\uxxxx"""
+    rng = _rng()
+    return _variants(text, k, [str, lambda c: '\\u{:04x}'.format(ord(c))],
+                     lambda rows: rng.random((rows, len(text))) < 0.5)
+
+
+def unicode_normalize_variants(text, k):
+    """unicode_normalize: ASCII 字符各以 1/5 的概率写成 \\uXXXX"""
+    rng = _rng()
+    ascii_chars = _mask(text, str.isascii)
+    return _variants(text, k, [str, lambda c: f"\\u{ord(c):04X}"],
+                     lambda rows: (rng.random((rows, len(text))) < 0.2) & ascii_chars)
+
+
+def _append_one_of_variants(text, k, suffixes):
+    """newline_bypass / tab_bypass: 字母数字后各以 1/3 的概率追加 suffixes 中的一个"""
+    rng = _rng()
+    alnum = _mask(text, str.isalnum)
+    options = [str] + [lambda c, suffix=suffix: c + suffix for suffix in suffixes]
+
+    def choose(rows):
+        selected = (rng.random((rows, len(text))) < 1 / 3) & alnum
+        return np.where(selected, rng.integers(1, len(suffixes) + 1, (rows, len(text))), 0)
+
+    return _variants(text, k, options, choose)
+
+
+def newline_variants(text, k):
+    return _append_one_of_variants(text, k, NEWLINE_CHARS)
+
+
+def tab_variants(text, k):
+    return _append_one_of_variants(text, k, TAB_CHARS)
+
+
+def garbage_character_variants(text, k, max_garbage=10):
+    """garbage_character_bypass: 字母数字后各以 1/3 的概率追加 1~10 个随机垃圾字符"""
+    if not text:
+        return [text] * k
+    rng = _rng()
+    codes = _codes(text)
+    alnum = _mask(text, str.isalnum)
+    garbage = _codes(GARBAGE_CHARS)
+    width = 1 + max_garbage
+    block = max(1, _MAX_BLOCK_CELLS // (len(text) * width))
+    variants = []
+    for start in range(0, k, block):
+        rows = min(block, k - start)
+        cells = np.full((rows, len(text), width), _PAD, dtype=np.uint32)
+        cells[:, :, 0] = codes
+        # 未选中的位置垃圾字符数为 0
+        counts = np.where((rng.random((rows, len(text))) < 1 / 3) & alnum,
+                          rng.integers(1, max_garbage + 1, (rows, len(text))), 0)
+        filled = np.arange(1, width) <= counts[:, :, None]
+        cells[:, :, 1:] = np.where(filled, garbage[rng.integers(0, len(garbage), (rows, len(text), max_garbage))],
+                                   _PAD)
+        variants.extend(_decode(row) for row in cells.reshape(rows, len(text) * width))
+    return variants
+
+
+# 全局共享的变体数配置
+variant_generator = VariantGenerator()
+
+
+if __name__ == '__main__':
+    # 对比逐次调用的混淆函数与批量生成的每秒变体数
+    # usage: cd src && python -m utils.prowler_obfuscation
+    import time
+    from utils.prowler_mutant_methods import random_case, insert_comments, insert_spaces, insert_line_breaks, \
+        unicode_obfuscate, unicode_normalize, newline_bypass, tab_bypass, garbage_character_bypass
+    pairs = [
+        ("random_case", random_case, random_case_variants),
+        ("insert_comments", insert_comments, comment_variants),
+        ("random_case(insert_comments)", lambda text: random_case(insert_comments(text)), case_and_comment_variants),
+        ("insert_spaces", insert_spaces, space_variants),
+        ("insert_line_breaks", insert_line_breaks, line_break_variants),
+        ("unicode_obfuscate", unicode_obfuscate, unicode_obfuscate_variants),
+        ("unicode_normalize", unicode_normalize, unicode_normalize_variants),
+        ("newline_bypass", newline_bypass, newline_variants),
+        ("tab_bypass", tab_bypass, tab_variants),
+        ("garbage_character_bypass", garbage_character_bypass, garbage_character_variants),
+    ]
+    # 预热 numpy
+    random_case_variants("warm up", 2)
+    for size in (64, 4096):
+        text = ("cmd=cat /etc/passwd;id&file=../../etc/shadow" * (size // 44 + 1))[:size]
+        for k in (8, 64):
+            for name, per_call, batched in pairs:
+                start = time.perf_counter()
+                for _ in range(k):
+                    per_call(text)
+                per_call_rate = k / (time.perf_counter() - start)
+                start = time.perf_counter()
+                batched(text, k)
+                batched_rate = k / (time.perf_counter() - start)
+                print(str(size) + " chars, k=" + str(k) + ", " + name + ": per call " + str(round(per_call_rate)) +
+                      " variants/s, batched " + str(round(batched_rate)) + " variants/s (x" +
+                      str(round(batched_rate / per_call_rate, 1)) + ")")
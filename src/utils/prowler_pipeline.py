@@ -0,0 +1,152 @@
+import threading
+
+from utils.logUtils import LoggerSingleton
+from utils.prowler_connection_pool import connection_pool, send_segments, STALE_CONNECTION_ERRORS
+from utils.prowler_timeout_manager import timeout_manager, classify_error
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_pipeline.py: "
+
+# 每批管线化发送的请求数，0/1 表示不启用
+DEFAULT_PIPELINE_DEPTH = 0
+
+
+class _SharedReader:
+    """
+    管线中的多个响应共享同一个读缓冲: http.client 每个响应都会 sock.makefile()，
+    各自的缓冲会读走后续响应的数据，因此所有响应使用同一个 fp，单个响应读完时不关闭它。
+    """
+
+    def __init__(self, sock):
+        self.fp = sock.makefile('rb')
+
+    def makefile(self, *args, **kwargs):
+        return self
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self.fp, name)
+
+
+class PipelinedTransport:
+    """
+    HTTP/1.1 管线化: 在同一个长连接上连续写出一批已序列化的请求，再按顺序读取响应，一批只需一次往返。
+    服务端中途关闭连接、返回 HTTP/1.0 响应或响应无法解析时停止，剩余请求交由调用方逐个发送，
+    并记住该主机不支持管线化，之后的批次直接逐个发送；连接是被请求自带的 Connection: close 关闭时不记。
+    usage:
+        handled = pipelined_transport.send_batch(netloc, raw_requests, handle_response)
+        for raw_request in raw_requests[len(handled):]:
+            ...逐个发送...
+    """
+
+    def __init__(self, pool=connection_pool):
+        self.pool = pool
+        # 不支持管线化的主机
+        self.disabled_hosts = set()
+        self._lock = threading.Lock()
+        self.stats = {'batches': 0, 'pipelined': 0, 'fallback': 0}
+
+    def supports(self, netloc):
+        return netloc not in self.disabled_hosts
+
+    def disable(self, netloc, reason):
+        with self._lock:
+            if netloc in self.disabled_hosts:
+                return
+            self.disabled_hosts.add(netloc)
+        logger.warning(TAG + "==>disable pipelining for " + netloc + ": " + reason)
+
+    def send_batch(self, netloc, raw_requests, handle_response, timeout=None):
+        """
+        管线化发送 raw_requests(RawRequest 列表，目标主机相同)，
+        handle_response(response) 必须读完响应体，返回值按顺序收集。
+        返回已处理的结果列表，长度小于 len(raw_requests) 时剩余请求需要调用方重新发送。
+        """
+        if not self.supports(netloc):
+            return []
+        for index, raw_request in enumerate(raw_requests):
+            if not raw_request.framed:
+                # Content-Length 与请求体不一致，之后的报文无法分界，批次截止到该请求
+                raw_requests = raw_requests[:index + 1]
+                break
+        if len(raw_requests) < 2:
+            return []
+        if timeout is None:
+            timeout = timeout_manager.timeouts(netloc, max(r.size for r in raw_requests))
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        conn, reused = self.pool.acquire(netloc, connect_timeout)
+        handled = []
+        response = None
+        reader = None
+        truncated = False
+        try:
+            if conn.sock is None:
+                conn.connect()
+            conn.sock.settimeout(read_timeout)
+            if any(raw_request.stream is not None for raw_request in raw_requests):
+                # 带分块请求体的请求逐个流式写出
+                for raw_request in raw_requests:
+                    raw_request.write_to(conn.sock)
+            else:
+                send_segments(conn.sock, [segment for raw_request in raw_requests for segment in raw_request.segments])
+            reader = _SharedReader(conn.sock)
+            for raw_request in raw_requests:
+                response = conn.response_class(reader, method=raw_request.method)
+                response.framed = raw_request.framed
+                response.begin()
+                if response.version < 11:
+                    # HTTP/1.0 服务端不会继续处理管线中的后续请求
+                    response.will_close = True
+                handled.append(handle_response(response))
+                if not response.isclosed():
+                    # 响应体被截断(见 prowler_response)，后续响应无法定位，剩余请求逐个发送
+                    truncated = True
+                    break
+                if response.will_close:
+                    break
+        except Exception as e:
+            if reader is not None:
+                reader.fp.close()
+            self.pool.discard(conn)
+            # 复用的连接可能已被对端关闭，不据此判定主机不支持管线化
+            stale = reused and not handled and isinstance(e, STALE_CONNECTION_ERRORS)
+            if not stale and not self._closed_by_request(raw_requests, handled):
+                self.disable(netloc, str(len(handled)) + "/" + str(len(raw_requests)) + " responses, " +
+                             classify_error(e) + ": " + str(e))
+            self._count(len(handled), len(raw_requests))
+            return handled
+        reader.fp.close()
+        if len(handled) < len(raw_requests):
+            self.pool.discard(conn)
+            if not truncated and not self._closed_by_request(raw_requests, handled):
+                self.disable(netloc, "connection closed after " + str(len(handled)) + "/" +
+                             str(len(raw_requests)) + " responses")
+        else:
+            self.pool.release(netloc, conn, response)
+        self._count(len(handled), len(raw_requests))
+        return handled
+
+    @staticmethod
+    def _closed_by_request(raw_requests, handled):
+        """连接是被最后一个已处理请求自带的 Connection: close 关闭的，与主机是否支持管线化无关"""
+        if handled and raw_requests[len(handled) - 1].closes:
+            logger.debug(TAG + "==>connection closed by request header after " + str(len(handled)) + "/" +
+                         str(len(raw_requests)) + " responses")
+            return True
+        return False
+
+    def _count(self, handled, total):
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['pipelined'] += handled
+            self.stats['fallback'] += total - handled
+
+    def report(self):
+        logger.info(TAG + "==>pipelining stats: " + str(self.stats) + " disabled hosts: " + str(self.disabled_hosts))
+        return self.stats
+
+
+# 全局共享的管线化发送器
+pipelined_transport = PipelinedTransport()
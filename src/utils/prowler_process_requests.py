@@ -1,143 +1,97 @@
+import itertools
 import json
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 # from utils.prowler_mutant import prowler_begin_to_mutant_payloads
-from utils.prowler_mutant import prowler_begin_to_mutant_payloads
+from utils.prowler_mutant import iter_mutant_payloads, MutantStream, close_mutant_payloads
 
 from utils.prowler_rl import prowler_begin_to_mutant_payload_with_rl
 from utils.prowler_rl import send_requests as send_requests_for_rl
+from utils.prowler_connection_pool import connection_pool
+from utils.prowler_response import response_reader
+from utils.prowler_timeout_manager import adaptive_urlopen, classify_error, DEFAULT_INITIAL_TIMEOUT
+from utils.prowler_raw_request import serialize_payload, serialize_request
+from utils.prowler_dedup_cache import dedup_cache
+from utils.prowler_circuit_breaker import circuit_breaker
+from utils.prowler_pipeline import pipelined_transport, DEFAULT_PIPELINE_DEPTH
+from utils.prowler_rate_limiter import rate_scheduler, classify_result, RequeueIterator, OUTCOME_OK, OUTCOME_FAILURE, \
+    OUTCOME_THROTTLED, OUTCOME_TIMEOUT
+from utils.prowler_routes import route_table
+from utils.prowler_request import ProwlerRequest, MutantRequest, result_payload
+from utils.prowler_ddmin import minimize_chain, minimize_request, chain_methods, join_chain, CHAIN_SEPARATOR
+from utils.prowler_bandit import bandit_scheduler
+from utils.prowler_async_engine import AsyncSendEngine, DEFAULT_CONCURRENCY, DEFAULT_PER_HOST_CONCURRENCY
 from utils.logUtils import LoggerSingleton
 from utils.recordResUtils import JSONLogger
-import http.client
-import gzip
-from bs4 import BeautifulSoup
-import io
-import xml.etree.ElementTree as ET
 from urllib.parse import urlparse
 from requests.models import Request
 
 logger = LoggerSingleton().get_logger()
 resLogger = JSONLogger()
 TAG = "prowler_process_requests.py: "
-HTTP_CONNECTION_TIMEOUT = 0.2
-
-def handle_json_response(response):
-    try:
-        data = json.loads(response.read().decode('utf-8'))
-        return data
-    except json.JSONDecodeError:
-        logger.warning(TAG + "==> 响应数据不是有效的 JSON 格式")
-        return "解析响应失败"
-
-def handle_html_response(response):
-    try:
-        # 读取响应数据
-        content = response.read()
-
-        # 检查是否需要解压缩
-        if content[:2] == b'\x1f\x8b':  # Gzip 的魔术字节
-            content = gzip.GzipFile(fileobj=io.BytesIO(content)).read()
-
-        # 解码为字符串
-        html_content = content.decode('utf-8')
-
-        # 解析 HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
-        soup = soup.prettify()
-        return soup
-    except UnicodeDecodeError as e:
-        logger.warning(TAG + f"==> 解析 HTML 时出错: {e}")
-        return None
-    except Exception as e:
-        logger.warning(TAG + f"==> 处理 HTML 响应时出错: {e}")
-        return None
-
-def handle_xml_response(response):
-    try:
-        xml_content = response.read().decode('utf-8')
-        root = ET.fromstring(xml_content)
-        return root
-    except ET.ParseError:
-        logger.warning(TAG + "==> 响应数据不是有效的 XML 格式")
-        return "解析响应失败"
-
-def handle_gzip_response(response):
-    try:
-        compressed_data = response.read()
-        with gzip.GzipFile(fileobj=io.BytesIO(compressed_data)) as gz_file:
-            decompressed_data = gz_file.read().decode('utf-8')
-        return decompressed_data
-    except Exception as e:
-        logger.warning(TAG + f"==> 解压缩 Gzip 数据时出错: {e}")
-        return "解析响应失败"
-
-def handle_text_response(response):
-    try:
-        text_content = response.read().decode('utf-8')
-        return text_content
-    except UnicodeDecodeError:
-        logger.warning(TAG + "==> 响应数据不是有效的文本格式")
-        return "解析响应失败"
-
-
+# 初始超时，有了足够的延迟样本后由 timeout_manager 按目标主机自适应调整
+HTTP_CONNECTION_TIMEOUT = DEFAULT_INITIAL_TIMEOUT
+# 多个 WAF 目标并发发送时，结果判定(resLogger 与 results)串行执行
+judge_lock = threading.Lock()
 
 def parse_response(response):
-    content_type = response.getheader('Content-Type')
-    logger.debug(TAG + "==>content_type: " + str(content_type))
-    if content_type is None:
-        logger.warning(TAG + "==>响应头中没有 Content-Type 字段")
-        return "响应头中没有 Content-Type 字段, 解析响应失败"
-    if 'application/json' in content_type:
-        data = handle_json_response(response)
-    elif 'text/html' in content_type:
-        data = handle_html_response(response)
-    elif 'application/xml' in content_type or 'text/xml' in content_type:
-        data = handle_xml_response(response)
-    elif 'gzip' in content_type:
-        data = handle_gzip_response(response)
-    elif 'text/plain' in content_type:
-        data = handle_text_response(response)
-    else:
-        logger.warning(TAG + "==>Unknown response data format, content type: " + content_type)
-        data = "解析响应失败"
-    logger.info(TAG + "==>parsed data: " + str(data)+ "content_type is: " + content_type)
-
+    # 只保留原始字节并解码为文本，JSON/XML/HTML 的解析与格式化由 response.body 按需进行
+    data = response_reader.parse(response)
+    logger.info(TAG + "==>parsed data: " + str(data) + "content_type is: " + str(response.body.content_type))
     return data
 
-def send_requests(prep_request, timeout=HTTP_CONNECTION_TIMEOUT):
+def send_requests(prep_request, timeout=None):
+    """timeout 为 None 时按目标主机与请求体大小使用自适应超时"""
     url = urlparse(prep_request.url)
     logger.debug(TAG + "==>url: " + str(prep_request.url))
     # print content of request
     # logger.debug(TAG + "==>prep_request: " + str(prep_request))
-    conn = http.client.HTTPConnection(url.netloc, timeout=timeout)
+    # 从连接池获取长连接发送请求
     try:
-        conn.request(prep_request.method, prep_request.url, headers=prep_request.headers, body=prep_request.body)
+        conn, response = adaptive_urlopen(url.netloc, prep_request.method, prep_request.url,
+                                          body=prep_request.body, headers=prep_request.headers,
+                                          timeout=timeout)
     except Exception as e:
         logger.error(TAG + "==>error: " + str(e))
         response = requests.Response()
+        # 区分超时与真实失败
+        response.error = classify_error(e)
         # response.text = None
         # response.status_code = None
         return response
+    return read_response(url.netloc, conn, response)
+
+
+def send_raw_request(raw_request, timeout=None):
+    """发送 prowler_raw_request.serialize_payload 生成的原始报文，返回值与 send_requests 相同"""
+    logger.debug(TAG + "==>url: " + raw_request.url)
     try:
-        response = conn.getresponse()
+        conn, response = adaptive_urlopen(raw_request.netloc, raw_request.method, raw_request.target,
+                                          timeout=timeout, raw=raw_request)
     except Exception as e:
         logger.error(TAG + "==>error: " + str(e))
         response = requests.Response()
-        # response.text = None
-        # response.status_code = None
+        response.error = classify_error(e)
         return response
+    return read_response(raw_request.netloc, conn, response)
+
+
+def read_response(netloc, conn, response):
+    read_response_body(response)
+    # 归还连接，服务端要求关闭时由连接池负责关闭
+    connection_pool.release(netloc, conn, response)
+    return response
+
+
+def read_response_body(response):
     temp_log = f"Response status: {response.status} {response.reason} {response.msg}"
     logger.info(TAG + temp_log)
     # 读取响应体内容
-    
     response_body = parse_response(response)
-
-
     logger.info(TAG + str(response_body))
     response.text = response_body
     response.status_code = response.status
-
-    # 关闭连接
-    conn.close()
     return response
 
 def process_requests(headers, url, method, data=None, files=None):
@@ -173,12 +127,14 @@ def process_requests(headers, url, method, data=None, files=None):
         return None
 
 
-def run_payload_for_rl(payload, host=None, port=None, waf=True):
-    logger.info(TAG + "==>run payload: " + str(payload))
+def resolve_payload_urls(payload, waf):
+    """
+    返回 (url, original_url)。
+    waf 为 False 时发往原始站点；为 True 时按路由表映射到第一个 WAF 目标；为目标 id 时映射到该目标。
+    """
     url = payload['url']
-    # todo: more sophiscated way to obtain waf payload
     if waf:
-        url = url.replace("8001", "9001").replace("8002", "9002").replace("8003", "9003")
+        url = route_table.waf_url(url, waf)
     # for not mutanted payload, copy url as original url
     # for mutanted payload, use 'original_url' to display result
 
@@ -187,18 +143,11 @@ def run_payload_for_rl(payload, host=None, port=None, waf=True):
     else:
         original_url = payload['original_url']
         if waf:
-            original_url = original_url.replace("8001", "9001").replace("8002", "9002").replace("8003", "9003")
-    # processed_req = process_requests(headers, url, method, data=data, files=files)
-    processed_req = {
-        "url": url,
-        "headers": payload.get('headers', None),
-        "method": payload.get('method', None),
-        "body": payload.get('body', None),
-    }
-    # print(payload)
-    # print(processed_req)
-    # exit()
-    response = send_requests_for_rl(processed_req)
+            original_url = route_table.waf_url(original_url, waf)
+    return url, original_url
+
+
+def build_result(url, original_url, payload, response):
     logger.info(TAG + "==>send payload to " + url)
     logger.info(TAG + "==>response: " + str(response))
     # logger.debug(TAG + "==>response: " + str(response.text))
@@ -207,91 +156,338 @@ def run_payload_for_rl(payload, host=None, port=None, waf=True):
         result = {
             'url': url,
             'original_url': original_url,
-            'payload': str(payload),
+            'target': route_table.target_of(url) or 'origin',
+            'payload': result_payload(payload),
             'response_status_code': response.status_code,
             'response_text': response.text,
+            'error': getattr(response, 'error', None),
             'success':''
         }
     else:
         result = {
             'url': url,
             'original_url': original_url,
-            'payload': str(payload),
+            'target': route_table.target_of(url) or 'origin',
+            'payload': result_payload(payload),
             'response_status_code': "Error",
             'response_text': "Error",
             'success':''
         }
     return result
-def run_payload(payload, host, port, waf=False):
+
+
+def run_payload_for_rl(payload, host=None, port=None, waf=True):
+    logger.info(TAG + "==>run payload: " + str(payload))
+    url, original_url = resolve_payload_urls(payload, waf)
+    # processed_req = process_requests(headers, url, method, data=data, files=files)
+    processed_req = {
+        "url": url,
+        "headers": payload.get('headers', None),
+        "method": payload.get('method', None),
+        "body": payload.get('body', None),
+    }
+    # print(payload)
+    # print(processed_req)
+    # exit()
+    response = circuit_breaker.call(urlparse(url).netloc, lambda: send_requests_for_rl(processed_req))
+    return build_result(url, original_url, payload, response)
+
+
+def run_payload(payload, host, port, waf=False, raw_request=None):
     logger.info(TAG + "==>run payload: " + str(payload))
+    url, original_url = resolve_payload_urls(payload, waf)
+    # 直接序列化为原始报文发送，不再经过 requests 的 prepare 与 http.client 的规整
+    if raw_request is None:
+        raw_request = serialize_payload(payload, url=url)
+    logger.debug(TAG + "==>request: " + str(raw_request))
+    # 目标不可达时由熔断器暂停并探测，超时与连接失败有限次重试
+    response = circuit_breaker.call(raw_request.netloc, lambda: send_raw_request(raw_request))
+    return build_result(url, original_url, payload, response)
+
+
+def serialize_payload_for_rl(payload, url):
+    # 与 prowler_rl.send_requests 一致: 载荷在 body 中，dict 按 str() 发送，请求行使用 path
+    body = payload.get('body')
+    if isinstance(body, dict):
+        body = str(body)
+    return serialize_request(payload.get('method'), url, payload.get('headers'), data=body, absolute_form=False)
+
+
+def prepare_raw_request(payload, url, rl=False):
+    if rl:
+        return serialize_payload_for_rl(payload, url)
+    return serialize_payload(payload, url=url)
+
+
+def run_payload_batch(payloads, host, port, waf=False, rl=False, raw_requests=None):
+    """
+    通过 HTTP/1.1 管线化在一个长连接上发送一批载荷，按顺序返回结果。
+    目标主机不一致、主机不支持管线化或管线中途断开时，未收到响应的载荷逐个重新发送。
+    """
+    urls = [resolve_payload_urls(payload, waf) for payload in payloads]
+    if raw_requests is None:
+        raw_requests = [prepare_raw_request(payload, url, rl) for payload, (url, _) in zip(payloads, urls)]
+    netloc = raw_requests[0].netloc
+    handled = []
+    if len(payloads) > 1 and all(raw_request.netloc == netloc for raw_request in raw_requests):
+        handled = pipelined_transport.send_batch(netloc, raw_requests, read_response_body)
+    results = [build_result(url, original_url, payload, response)
+               for payload, (url, original_url), response in zip(payloads, urls, handled)]
+    for payload, raw_request in zip(payloads[len(handled):], raw_requests[len(handled):]):
+        if rl:
+            results.append(run_payload_for_rl(payload, host, port, waf))
+        else:
+            results.append(run_payload(payload, host, port, waf, raw_request=raw_request))
+    return results
+
+
+def get_target_netloc(payload, waf):
     url = payload['url']
-    # todo: more sophiscated way to obtain waf payload
     if waf:
-        url = url.replace("8001", "9001").replace("8002", "9002").replace("8003", "9003")
-    # for not mutanted payload, copy url as original url
-    # for mutanted payload, use 'original_url' to display result
+        url = route_table.waf_url(url, waf)
+    return urlparse(url).netloc
 
-    if 'original_url' not in payload:
-        original_url = url
-    else:
-        original_url = payload['original_url']
-        if waf:
-            original_url = original_url.replace("8001", "9001").replace("8002", "9002").replace("8003", "9003")
-
-    headers = payload['headers']
-    data = payload.get('data', None)
-    files = payload.get('files', None)
-    verify = payload.get('verify', False)
-    method = payload['method']
-    processed_req = process_requests(headers, url, method, data=data, files=files)
-    response = send_requests(processed_req)
-    logger.info(TAG + "==>send payload to " + url)
-    logger.info(TAG + "==>response: " + str(response))
-    # logger.debug(TAG + "==>response: " + str(response.text))
-    if response is not None:
-        logger.debug(TAG + "==>response: " + str(response.text))
-        result = {
-            'url': url,
-            'original_url': original_url,
-            'payload': str(payload),
-            'response_status_code': response.status_code,
-            'response_text': response.text,
-            'success':''
-        }
-    else:
-        result = {
-            'url': url,
-            'original_url': original_url,
-            'payload': str(payload),
-            'response_status_code': "Error",
-            'response_text': "Error",
-            'success':''
-        }
-    return result
+
+def bandit_context(url, waf):
+    """变异方法调度的上下文: WAF 目标(路由表中的目标 id，否则为目标地址) + 原始载荷的攻击类型"""
+    return bandit_scheduler.context(waf if isinstance(waf, str) else get_target_netloc({'url': url}, waf), url)
+
+
+def record_mutant_outcome(mutant_payload, waf, bypassed, rl=False):
+    """每个变异请求的结果立即计入调度统计；强化学习生成的载荷与组合变异的方法链不计入"""
+    mutant_method = mutant_payload.get('mutant_method')
+    if rl or not mutant_method or CHAIN_SEPARATOR in mutant_method:
+        return
+    url = mutant_payload.get('original_url') or mutant_payload['url']
+    bandit_scheduler.update(bandit_context(url, waf), mutant_method, bypassed)
+
+
+def send_mutant_payload(mutant_payload, host, port, waf, rl=False):
+    """经主机调度器(令牌桶限速 + AIMD 并发调整)发送一个变异载荷"""
+    return send_mutant_batch([mutant_payload], host, port, waf, rl)[0]
+
+
+def send_mutant_batch(mutant_payloads, host, port, waf, rl=False):
+    """
+    经主机调度器发送一批变异载荷(多于一个时管线化)，按顺序返回结果。
+    与之前发送过的请求字节完全相同的载荷直接复用缓存的结果；
+    一批占用一个并发名额，按其中最差的结果调整速率。
+    """
+    results = [None] * len(mutant_payloads)
+    pending = []
+    # 同一批内重复的载荷: (序号, 载荷, 指纹)，等第一次发送的结果回来后复用
+    duplicates = []
+    pending_fingerprints = set()
+    for index, mutant_payload in enumerate(mutant_payloads):
+        url, _ = resolve_payload_urls(mutant_payload, waf)
+        raw_request = prepare_raw_request(mutant_payload, url, rl)
+        fingerprint = raw_request.fingerprint()
+        if fingerprint in pending_fingerprints:
+            duplicates.append((index, mutant_payload, fingerprint))
+            continue
+        results[index] = dedup_cache.lookup(fingerprint, mutant_payload)
+        if results[index] is None:
+            pending.append((index, mutant_payload, raw_request, fingerprint))
+            pending_fingerprints.add(fingerprint)
+    if not pending:
+        return results
+    target = pending[0][2].netloc
+    rate_scheduler.acquire(target)
+    outcome = OUTCOME_FAILURE
+    try:
+        sent = run_payload_batch([item[1] for item in pending], host, port, waf, rl,
+                                 raw_requests=[item[2] for item in pending])
+        outcomes = [classify_result(result) for result in sent]
+        outcome = next((item for item in (OUTCOME_THROTTLED, OUTCOME_TIMEOUT, OUTCOME_FAILURE) if item in outcomes),
+                       OUTCOME_OK)
+    finally:
+        rate_scheduler.release(target, outcome)
+    sent_results = {}
+    for (index, _, _, fingerprint), result in zip(pending, sent):
+        dedup_cache.store(fingerprint, result)
+        results[index] = sent_results[fingerprint] = result
+    for index, mutant_payload, fingerprint in duplicates:
+        results[index] = dedup_cache.lookup(fingerprint, mutant_payload)
+        if results[index] is None:
+            # 结果不可缓存(超时、限流等)，重复的载荷与第一次得到相同的结果
+            results[index] = dict(sent_results[fingerprint], payload=result_payload(mutant_payload), success='')
+    return results
 
 
+def iter_batches(payload_iter, size):
+    """按 size 个一组从迭代器中取载荷，重新排队的载荷会出现在后续批次中"""
+    while True:
+        batch = list(itertools.islice(payload_iter, max(1, size)))
+        if not batch:
+            return
+        yield batch
 
-def prowler_begin_to_send_payloads(host,port,payloads,waf=False,PAYLOAD_MUTANT_ENABLED=False,enable_shortcut=True,enable_dd=False,rl=False):
+
+def requeue_if_throttled(result, mutant_payload, mutant_iter, waf, rl=False):
+    """被 WAF 限流(429/503)的载荷重新排队，不计为变异失败；超过重试次数后按普通结果处理"""
+    if classify_result(result) != OUTCOME_THROTTLED:
+        return False
+    url, _ = resolve_payload_urls(mutant_payload, waf)
+    if not mutant_iter.requeue(mutant_payload, prepare_raw_request(mutant_payload, url, rl).fingerprint()):
+        logger.warning(TAG + "==>url: " + result['url'] + " still throttled after max requeue")
+        return False
+    rate_scheduler.record_requeue(get_target_netloc(mutant_payload, waf))
+    logger.warning(TAG + "==>url: " + result['url'] + " throttled, requeue mutant payload")
+    return True
+
+
+def judge_mutant_result(result, mutant_payload, results, success_method, rl=False):
+    """判定变异载荷是否绕过成功，并将结果记录到 results 中"""
+    formatted_results = json.dumps(result, indent=4, ensure_ascii=False, default=str)
+    logger.debug(TAG + "==>results: " + formatted_results)
+    with judge_lock:
+        # 检查返回状态码以及结果
+        if result.get('response_status_code') == 200 and resLogger.check_response_text(result['original_url'], result['response_text']):
+            logger.warning(TAG + "==>url: " + result['url'] + " success after mutant")
+            result['success'] = True
+            results.append(result)
+            # 记录成功的 payload
+            resLogger.log_result(result)
+            print(mutant_payload)
+            if not rl:
+                success_method.append(mutant_payload['mutant_method'])
+            return True
+        result['success'] = False
+        results.append(result)
+    logger.warning(TAG + "==>url: " + result['url'] + " failed after mutant " + " response: " + str(result['response_text']))
+    return False
+
+
+def fan_out(targets, func):
+    """对每个目标并发执行 func(target)，按 targets 的顺序返回结果；只有一个目标时在当前线程执行"""
+    if len(targets) == 1:
+        return [func(targets[0])]
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        return list(executor.map(func, targets))
+
+
+def payload_targets(payload, waf):
+    """载荷需要发往的目标: 原始站点为 [False]；WAF 为路由表中该站点的所有目标 id，未配置路由时为 [True]"""
+    if not waf:
+        return [False]
+    return route_table.target_ids(payload['url']) or [True]
+
+
+def send_mutants_to_target(mutant_payloads, target, host, port, results, success_method, enable_shortcut, rl,
+                           concurrency, per_host_concurrency, pipeline, successes=None):
+    """
+    把同一组变异载荷发送到一个目标，返回 (是否绕过成功, 最后一个结果)。
+    多个 WAF 目标时每个目标在各自的线程中执行，判定经 judge_lock 串行。
+    successes 不为 None 时收集绕过成功的 (变异载荷, 结果)。
+    """
+    success_after_mutant = False
+    result = None
+    # 遍历 mutant_payloads 执行 payload，被限流的载荷重新排队
+    mutant_iter = RequeueIterator(mutant_payloads, rate_scheduler.max_requeue)
+    if concurrency > 1:
+        # 并发发送，判定回调在事件循环线程中串行执行
+        judged = {'success': False, 'result': None}
+
+        def on_mutant_result(mutant_payload, mutant_result):
+            if requeue_if_throttled(mutant_result, mutant_payload, mutant_iter, target, rl):
+                return False
+            judged['result'] = mutant_result
+            bypassed = judge_mutant_result(mutant_result, mutant_payload, results, success_method, rl)
+            record_mutant_outcome(mutant_payload, target, bypassed, rl)
+            if bypassed:
+                judged['success'] = True
+                if successes is not None:
+                    successes.append((mutant_payload, mutant_result))
+                return enable_shortcut
+            return False
+
+        engine = AsyncSendEngine(concurrency, per_host_concurrency)
+        # 单主机并发按变异载荷实际发往的 WAF 目标地址限制
+        engine.run(mutant_iter, lambda p: send_mutant_payload(p, host, port, target, rl), on_mutant_result,
+                   host_key=lambda p: get_target_netloc(p, target))
+        return judged['success'], judged['result']
+    # pipeline > 1 时每批变异载荷管线化发送，否则逐个发送
+    for batch in iter_batches(mutant_iter, pipeline):
+        for mutant_payload, result in zip(batch, send_mutant_batch(batch, host, port, target, rl)):
+            if requeue_if_throttled(result, mutant_payload, mutant_iter, target, rl):
+                continue
+            # 检查返回状态码以及结果
+            bypassed = judge_mutant_result(result, mutant_payload, results, success_method, rl)
+            record_mutant_outcome(mutant_payload, target, bypassed, rl)
+            if bypassed:
+                success_after_mutant = True
+                if successes is not None:
+                    successes.append((mutant_payload, result))
+                if enable_shortcut:
+                    return success_after_mutant, result
+    return success_after_mutant, result
+
+
+def is_bypassed(result):
+    """与 judge_mutant_result 相同的绕过判定，不记录结果"""
+    return result.get('response_status_code') == 200 and \
+        resLogger.check_response_text(result['original_url'], result['response_text'])
+
+
+def minimize_successes(successes, request, host, port, target, deep_mutant):
+    """
+    对绕过成功的变异载荷做增量调试(ddmin)，找出仍能绕过的最小部分，判定请求只发往该目标。
+    组合变异(a+b+c)在原始请求上重放方法链的子集，最小方法链记入结果的 minimized_mutant_method，
+    由 update_memory 代替完整的方法链写入 memory.json；其他变异载荷按请求改动最小化，记入 minimized_payload。
+    深度变异先修改了请求方法，方法链无法在原始请求上重放，按请求改动最小化。
+    """
+    def still_bypasses(candidate):
+        result = send_mutant_payload(candidate, host, port, target)
+        return classify_result(result) != OUTCOME_THROTTLED and is_bypassed(result)
+
+    minimized_chains = {}
+    for mutant_payload, result in successes:
+        mutant_method = mutant_payload.get('mutant_method') or ''
+        if not deep_mutant and CHAIN_SEPARATOR in mutant_method and chain_methods(mutant_method) is not None:
+            if mutant_method not in minimized_chains:
+                minimized_chains[mutant_method] = join_chain(minimize_chain(request, mutant_method, still_bypasses).items)
+            result['minimized_mutant_method'] = minimized_chains[mutant_method]
+        elif isinstance(mutant_payload, MutantRequest):
+            minimized_payload, _ = minimize_request(request, mutant_payload, still_bypasses)
+            result['minimized_payload'] = result_payload(minimized_payload)
+
+
+# 每个载荷最多进行的变异轮次(普通变异 + 深度变异)
+MAX_MUTANT_ROUNDS = 2
+
+
+def prowler_begin_to_send_payloads(host,port,payloads,waf=False,PAYLOAD_MUTANT_ENABLED=False,enable_shortcut=True,enable_dd=False,rl=False,
+                                   concurrency=DEFAULT_CONCURRENCY,per_host_concurrency=DEFAULT_PER_HOST_CONCURRENCY,
+                                   pipeline=DEFAULT_PIPELINE_DEPTH):
+    """
+    waf 为 True 时每个载荷发往路由表中配置的所有 WAF 目标(并发)，变异载荷每轮只生成一次，分发给尚未绕过的目标。
+    """
     results = []
     rl_backup = rl
     # 字典：记录成功的mutant_method
     success_method = []
     for payload in payloads:
         # get the payload data
-        result = run_payload(payload, host, port, waf)
+        targets = payload_targets(payload, waf)
+        target_results = fan_out(targets, lambda target: run_payload(payload, host, port, target))
         rl = rl_backup
-        if result.get('response_status_code') == 200:
-            logger.warning(TAG + "==>url: " + result['url'] + " success")
-            result['success'] = True
-            results.append(result)
-            resLogger.log_result( result)
-        else:
-            result['success'] = False
-            results.append(result)
-            if result['response_text'] is not None:
-                logger.warning(TAG + "==>url: " + result['url'] + " failed" + " response: " + result['response_text'])
+        # 未绕过的目标 -> 最近一次结果
+        failed_targets = {}
+        for target, result in zip(targets, target_results):
+            if result.get('response_status_code') == 200:
+                logger.warning(TAG + "==>url: " + result['url'] + " success")
+                result['success'] = True
+                results.append(result)
+                resLogger.log_result( result)
             else:
-                logger.warning(TAG + "==>url: " + result['url'] + " failed")
+                result['success'] = False
+                results.append(result)
+                if result['response_text'] is not None:
+                    logger.warning(TAG + "==>url: " + result['url'] + " failed" + " response: " + result['response_text'])
+                else:
+                    logger.warning(TAG + "==>url: " + result['url'] + " failed")
+                failed_targets[target] = result
+        if failed_targets:
             url = payload['url']
             headers = payload['headers']
             data = payload.get('data', None)
@@ -299,11 +495,16 @@ def prowler_begin_to_send_payloads(host,port,payloads,waf=False,PAYLOAD_MUTANT_E
             verify = payload.get('verify', False)
             method = payload['method']
             processed_req = process_requests(headers, url, method, data=data, files=files)
+            # 变异的起点，ddmin 在其上重放部分变异
+            original_request = ProwlerRequest(processed_req.headers, processed_req.url, processed_req.method,
+                                              processed_req.body)
             logger.info(TAG + "==>PAYLOAD_MUTANT_ENABLED: " + str(PAYLOAD_MUTANT_ENABLED))
             if PAYLOAD_MUTANT_ENABLED:
                 i = 0
                 
                 success_after_mutant = False 
+                # 每个目标是否已绕过
+                target_success = dict.fromkeys(failed_targets, False)
                 if method == 'GET':
                     deep_mutant = True
                 else:
@@ -314,6 +515,10 @@ def prowler_begin_to_send_payloads(host,port,payloads,waf=False,PAYLOAD_MUTANT_E
                 # 修改终止条件为 end_mutant == False
                 while not end_mutant:
                     mutant_payloads = []
+                    # 本轮是否为深度变异，以及本轮开始时的结果数与去重命中数
+                    deep_round = deep_mutant
+                    results_before = len(results)
+                    hits_before = dedup_cache.hits
                     
                     # for success_method_item in success_method:
                     #     headers_copy = copy.deepcopy(processed_req.headers)
@@ -331,43 +536,43 @@ def prowler_begin_to_send_payloads(host,port,payloads,waf=False,PAYLOAD_MUTANT_E
                     #     mutant_payloads.extend(sub_mutant_payloads)
                     # 获取变异后的 payloads
                     enable_shortcut_for_mutant = enable_shortcut
+                    # 变异载荷只生成一次，并发发送到每个尚未绕过的目标(shortcut 关闭时发送到所有目标)
+                    active_targets = [target for target in failed_targets
+                                      if not (enable_shortcut and target_success[target])]
+                    if rl:
+                    # mutant_payloads = prowler_begin_to_mutant_payloads(processed_req.headers, processed_req.url, processed_req.method, data=processed_req.body, deep_mutant=deep_mutant)
+                        mutant_payloads = prowler_begin_to_mutant_payload_with_rl(processed_req.headers, processed_req.url, processed_req.method, data=processed_req.body)
                     if len(mutant_payloads) == 0:
-                        if rl:
-                        # mutant_payloads = prowler_begin_to_mutant_payloads(processed_req.headers, processed_req.url, processed_req.method, data=processed_req.body, deep_mutant=deep_mutant)
-                            mutant_payloads = prowler_begin_to_mutant_payload_with_rl(processed_req.headers, processed_req.url, processed_req.method, data=processed_req.body)
-                        else:
-                            mutant_payloads = prowler_begin_to_mutant_payloads(processed_req.headers, processed_req.url, processed_req.method, data=processed_req.body, deep_mutant=deep_mutant,enable_shortcut=enable_shortcut_for_mutant)
-                    if len(mutant_payloads) == 0 and rl:
                         rl = False
-                        mutant_payloads = prowler_begin_to_mutant_payloads(processed_req.headers, processed_req.url, processed_req.method, data=processed_req.body, deep_mutant=deep_mutant,enable_shortcut=enable_shortcut_for_mutant)
+                        # 惰性生成，绕过成功(shortcut)后不再生成剩余的变异载荷
+                        # 变异方法的顺序由调度器按各方法在这些目标上的绕过统计决定
+                        schedule = [bandit_context(processed_req.url, target) for target in active_targets]
+                        mutant_payloads = iter_mutant_payloads(processed_req.headers, processed_req.url, processed_req.method, data=processed_req.body, deep_mutant=deep_mutant,dd_enabled=enable_dd,enable_shortcut=enable_shortcut_for_mutant,schedule=schedule)
                     #     # use normal mutant
                     #     rl = False  
                     #     mutant_payloads = prowler_begin_to_mutant_payloads(processed_req.headers, processed_req.url, processed_req.method, data=processed_req.body, deep_mutant=deep_mutant,enable_shortcut=enable_shortcut_for_mutant)
-                    # 遍历 mutant_payloads 执行 payload
-                    for mutant_payload in mutant_payloads:
-                        if rl:
-                            result = run_payload_for_rl(mutant_payload, host, port, waf)
-                        else:
-                            result = run_payload(mutant_payload, host, port, waf)
-                        formatted_results = json.dumps(result, indent=4, ensure_ascii=False)
-                        logger.debug(TAG + "==>results: " + formatted_results)
-                        # 检查返回状态码以及结果
-                        if result.get('response_status_code') == 200 and resLogger.check_response_text(result['original_url'], result['response_text']):
-                            logger.warning(TAG + "==>url: " + result['url'] + " success after mutant")
-                            result['success'] = True
-                            results.append(result)
-                            # 记录成功的 payload
-                            resLogger.log_result(result)
-                            success_after_mutant = True
-                            print(mutant_payload)
-                            if not rl:
-                                success_method.append(mutant_payload['mutant_method'])
-                            if enable_shortcut:
-                                break
-                        else:
-                            result['success'] = False
-                            results.append(result)
-                            logger.warning(TAG + "==>url: " + result['url'] + " failed after mutant " + " response: " + str(result['response_text']))
+                    if len(active_targets) > 1:
+                        # 多个目标共享同一个载荷流，每个载荷只生成一次
+                        mutant_payloads = MutantStream(mutant_payloads)
+                    def send_to_target(target):
+                        # enable_dd: 绕过成功后用 ddmin 找出最小的变异
+                        successes = [] if enable_dd and not rl else None
+                        outcome = send_mutants_to_target(
+                            mutant_payloads, target, host, port, results, success_method, enable_shortcut, rl,
+                            concurrency, per_host_concurrency, pipeline, successes)
+                        if successes:
+                            minimize_successes(successes, original_request, host, port, target, deep_mutant)
+                        return outcome
+
+                    try:
+                        outcomes = fan_out(active_targets, send_to_target)
+                    finally:
+                        close_mutant_payloads(mutant_payloads)
+                    for target, (target_succeeded, target_result) in zip(active_targets, outcomes):
+                        target_success[target] = target_success[target] or target_succeeded
+                        if target_result is not None:
+                            failed_targets[target] = target_result
+                    success_after_mutant = all(target_success.values())
                     # if not success_after_mutant:
                     #                             # 若强化学习失败，使用普通变异
                     #     if rl:
@@ -380,7 +585,9 @@ def prowler_begin_to_send_payloads(host,port,payloads,waf=False,PAYLOAD_MUTANT_E
                             end_mutant = True
                         else:
                             deep_mutant = True
-                        logger.warning(TAG + "==>url: " + result['url'] + " begin deep mutant")
+                        for target, result in failed_targets.items():
+                            if not target_success[target]:
+                                logger.warning(TAG + "==>url: " + result['url'] + " begin deep mutant")
                     if rl and not enable_shortcut:
                         end_mutant = True
                     if rl and enable_shortcut:
@@ -392,8 +599,15 @@ def prowler_begin_to_send_payloads(host,port,payloads,waf=False,PAYLOAD_MUTANT_E
                     if success_after_mutant and enable_shortcut:
                         end_mutant = True
                     
-                    if not enable_shortcut and not rl:
-                        i += 1
-                        if i ==2:
-                            end_mutant = True
-    return results
\ No newline at end of file
+                    i += 1
+                    # 深度变异是最后一轮；达到轮次上限、本轮没有生成变异载荷或只得到重复请求的缓存结果时同样结束，
+                    # 否则 GET 载荷(从深度变异开始)在没有绕过时会不断重复同一轮
+                    round_results = len(results) - results_before
+                    if not rl and deep_round and not end_mutant:
+                        for target, result in failed_targets.items():
+                            if not target_success[target]:
+                                logger.warning(TAG + "==>url: " + result['url'] + " deep mutant failed")
+                        end_mutant = True
+                    if i >= MAX_MUTANT_ROUNDS or round_results <= dedup_cache.hits - hits_before:
+                        end_mutant = True
+    return results
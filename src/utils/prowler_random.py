@@ -0,0 +1,48 @@
+import hashlib
+import random
+import threading
+from contextlib import contextmanager
+
+"""
+变异方法使用的随机数: 未指定种子时即全局 random 模块(与之前相同)；
+在 seeded_random(seed) 中为当前线程独立的生成器，其他线程(发送、限速)使用随机数不影响变异结果。
+usage:
+    from utils.prowler_random import mutation_random as rng
+    with seeded_random(mutation_seed(name, seed, request.fingerprint())):
+        rng.choice(...)
+"""
+
+
+class _ThreadGenerator(threading.local):
+    # None 表示使用全局 random 模块
+    generator = None
+
+
+_current = _ThreadGenerator()
+
+
+class MutationRandom:
+    """变异方法使用的随机数生成器，接口与 random 模块相同"""
+
+    def __getattr__(self, name):
+        return getattr(_current.generator or random, name)
+
+
+mutation_random = MutationRandom()
+
+
+@contextmanager
+def seeded_random(seed):
+    """在当前线程中以 seed 初始化 mutation_random，退出时恢复"""
+    previous = _current.generator
+    _current.generator = random.Random(seed)
+    try:
+        yield _current.generator
+    finally:
+        _current.generator = previous
+
+
+def mutation_seed(mutant_method_name, seed, fingerprint):
+    """由 (方法名, 种子, 请求指纹) 导出变异方法实际使用的种子"""
+    digest = hashlib.sha1((mutant_method_name + ":" + str(seed) + ":" + fingerprint).encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
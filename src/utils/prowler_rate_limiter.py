@@ -0,0 +1,233 @@
+import threading
+import time
+from collections import deque
+
+from utils.logUtils import LoggerSingleton
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_rate_limiter.py: "
+
+# WAF 限流时返回的状态码，这类响应不计为变异失败，而是重新排队
+THROTTLE_STATUS_CODES = (429, 503)
+# 单个载荷因限流最多重新排队的次数
+DEFAULT_MAX_REQUEUE = 5
+# 每个主机的最大请求速率(请求/秒)，0 表示不限制
+DEFAULT_RATE_LIMIT = 0
+# 每个主机的最大并发数上限，AIMD 在 [1, 上限] 之间调整
+DEFAULT_MAX_CONCURRENCY = 64
+# 自动调整时每个主机的初始并发数: 从低处开始慢启动，不在探明 WAF 的承受能力之前就按上限发送
+INITIAL_CONCURRENCY = 1
+# AIMD 参数: 每个成功窗口加 1，拥塞时乘以 0.5
+AIMD_INCREASE = 1.0
+AIMD_DECREASE = 0.5
+# 被限流后暂停该主机的初始时长(秒)，连续限流时翻倍
+THROTTLE_PAUSE = 0.5
+MAX_THROTTLE_PAUSE = 30.0
+
+OUTCOME_OK = 'ok'
+OUTCOME_THROTTLED = 'throttled'
+OUTCOME_TIMEOUT = 'timeout'
+OUTCOME_FAILURE = 'failure'
+
+
+def classify_result(result):
+    """根据 run_payload 的结果判断本次请求是正常、被限流、超时还是失败"""
+    if result.get('response_status_code') in THROTTLE_STATUS_CODES:
+        return OUTCOME_THROTTLED
+    if result.get('error') == OUTCOME_TIMEOUT:
+        return OUTCOME_TIMEOUT
+    if result.get('error') is not None or result.get('response_status_code') is None:
+        return OUTCOME_FAILURE
+    return OUTCOME_OK
+
+
+class TokenBucket:
+    """令牌桶，rate 为 None 时不限速"""
+
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """尝试取一个令牌，成功返回 0，否则返回需要等待的秒数"""
+        if not self.rate:
+            return 0
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def set_rate(self, rate):
+        self._refill(time.monotonic())
+        self.rate = rate
+
+
+class HostState:
+    def __init__(self, max_concurrency, rate_limit, initial_concurrency):
+        self.limit = float(initial_concurrency)
+        # 慢启动: 第一次拥塞之前每个成功响应并发数加 1(每个窗口翻倍)，之后转为加性增
+        self.slow_start = True
+        self.in_flight = 0
+        self.bucket = TokenBucket(rate_limit or None, burst=max(1, max_concurrency))
+        self.paused_until = 0
+        self.pause = THROTTLE_PAUSE
+        # 最近的发送时间，用于估计当前实际速率
+        self.sent_at = deque(maxlen=64)
+        self.stats = {'ok': 0, 'throttled': 0, 'timeout': 0, 'failure': 0, 'requeued': 0}
+
+
+class HostScheduler:
+    """
+    按目标主机调度请求: 令牌桶限制速率，AIMD 根据限流、超时和错误调整并发数与速率，
+    从而自动逼近每个 WAF 可持续的最高请求速率。
+    自动调整时并发数从 INITIAL_CONCURRENCY 慢启动，主机状态在整个运行期间保留，后续载荷从学到的并发数继续；
+    不自动调整时固定为上限。
+    usage:
+        rate_scheduler.acquire(host)
+        result = run_payload(...)
+        rate_scheduler.release(host, classify_result(result))
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, rate_limit=DEFAULT_RATE_LIMIT, autotune=True,
+                 max_requeue=DEFAULT_MAX_REQUEUE):
+        self.max_concurrency = max_concurrency
+        self.rate_limit = rate_limit
+        self.autotune = autotune
+        self.max_requeue = max_requeue
+        self._hosts = {}
+        self._cond = threading.Condition()
+
+    def configure(self, max_concurrency=None, rate_limit=None, autotune=None, max_requeue=None):
+        with self._cond:
+            if max_concurrency is not None:
+                self.max_concurrency = max_concurrency
+            if rate_limit is not None:
+                self.rate_limit = rate_limit
+            if autotune is not None:
+                self.autotune = autotune
+            if max_requeue is not None:
+                self.max_requeue = max_requeue
+            self._hosts = {}
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            initial = min(INITIAL_CONCURRENCY, self.max_concurrency) if self.autotune else self.max_concurrency
+            state = self._hosts[host] = HostState(self.max_concurrency, self.rate_limit, initial)
+        return state
+
+    def acquire(self, host):
+        """阻塞直到该主机的并发与速率允许再发送一个请求"""
+        with self._cond:
+            state = self._state(host)
+            while True:
+                now = time.monotonic()
+                wait = state.paused_until - now
+                if wait <= 0 and state.in_flight < max(1, int(state.limit)):
+                    wait = state.bucket.take(now)
+                    if wait <= 0:
+                        state.in_flight += 1
+                        state.sent_at.append(now)
+                        return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def _current_rate(self, state):
+        if len(state.sent_at) < 2:
+            return None
+        span = state.sent_at[-1] - state.sent_at[0]
+        return (len(state.sent_at) - 1) / span if span > 0 else None
+
+    def release(self, host, outcome):
+        with self._cond:
+            state = self._state(host)
+            state.in_flight -= 1
+            state.stats[outcome] += 1
+            if outcome == OUTCOME_OK:
+                state.pause = THROTTLE_PAUSE
+                if self.autotune:
+                    # 加性增: 每成功一整个并发窗口，并发数加 1(慢启动阶段每个成功响应加 1)，速率同理
+                    increase = AIMD_INCREASE if state.slow_start else AIMD_INCREASE / max(state.limit, 1)
+                    state.limit = min(self.max_concurrency, state.limit + increase)
+                    if state.bucket.rate:
+                        rate = state.bucket.rate + AIMD_INCREASE / max(state.bucket.rate, 1)
+                        if self.rate_limit:
+                            rate = min(self.rate_limit, rate)
+                        state.bucket.set_rate(rate)
+            elif self.autotune:
+                # 乘性减: 限流、超时或错误都视为拥塞信号，结束慢启动
+                state.slow_start = False
+                state.limit = max(1.0, state.limit * AIMD_DECREASE)
+                if outcome == OUTCOME_THROTTLED:
+                    rate = state.bucket.rate or self._current_rate(state)
+                    if rate:
+                        state.bucket.set_rate(max(0.5, rate * AIMD_DECREASE))
+            if outcome == OUTCOME_THROTTLED:
+                # 被限流后暂停该主机一段时间，连续限流时指数退避
+                state.paused_until = time.monotonic() + state.pause
+                state.pause = min(MAX_THROTTLE_PAUSE, state.pause * 2)
+                logger.warning(TAG + "==>host " + host + " throttled, concurrency limit: " +
+                               str(round(state.limit, 2)) + " rate: " + str(state.bucket.rate))
+            self._cond.notify_all()
+
+    def pause(self, host, seconds):
+        """暂停向该主机派发请求(例如熔断器断开时)，已在等待的请求在暂停结束后继续"""
+        with self._cond:
+            state = self._state(host)
+            state.paused_until = max(state.paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def record_requeue(self, host):
+        with self._cond:
+            self._state(host).stats['requeued'] += 1
+
+    def report(self):
+        """输出每个主机最终收敛到的并发数与速率"""
+        with self._cond:
+            snapshot = {host: (state.limit, state.bucket.rate, dict(state.stats)) for host, state in self._hosts.items()}
+        for host, (limit, rate, stats) in snapshot.items():
+            logger.info(TAG + "==>host: " + host + " concurrency limit: " + str(round(limit, 2)) +
+                        " rate: " + (str(round(rate, 2)) if rate else "unlimited") + " stats: " + str(stats))
+        return snapshot
+
+
+class RequeueIterator:
+    """
+    在原有载荷迭代器之上支持重新排队: 被限流的载荷放回队首，优先于尚未发送的载荷再次发送。
+    原迭代器耗尽后仍会继续返回重新排队的载荷。
+    重新排队次数按调用方给出的载荷指纹计数(同一载荷的各次重新排队指纹相同)。
+    """
+
+    def __init__(self, payloads, max_requeue=DEFAULT_MAX_REQUEUE):
+        self._payloads = iter(payloads)
+        self._pending = deque()
+        self._attempts = {}
+        self.max_requeue = max_requeue
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._pending:
+            return self._pending.popleft()
+        return next(self._payloads)
+
+    def requeue(self, payload, fingerprint):
+        """重新排队，超过最大次数时返回 False，由调用方按普通失败记录"""
+        attempts = self._attempts.get(fingerprint, 0) + 1
+        if attempts > self.max_requeue:
+            return False
+        self._attempts[fingerprint] = attempts
+        self._pending.append(payload)
+        return True
+
+
+# 全局共享的主机调度器
+rate_scheduler = HostScheduler()
@@ -0,0 +1,328 @@
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit, urlencode
+
+from utils.logUtils import LoggerSingleton
+from utils.prowler_connection_pool import send_segments
+from utils.prowler_segmented_body import SegmentedBody, ChunkedBody
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_raw_request.py: "
+
+"""
+把变异载荷(headers/url/method/data/files)直接序列化为 HTTP/1.1 报文字节，
+替代每个变异载荷都要执行一次的 requests.Request(...).prepare() 以及 http.client 对请求的再次规整。
+请求行与请求头按原样写出，只对空白、控制字符和非 ASCII 字符做百分号编码，变异方法构造的字节不会被改写。
+例外: 载荷文件(抓包所得)自带的逐跳请求头 Connection: close 不写出，否则每个请求之后连接都会被关闭，
+长连接复用与管线化都无法生效；变异方法改写过的 Connection(值不是 close)按原样写出。
+载荷自带的 Content-Length(变异方法可能故意写错)同样按原样写出，不再补写；没有时按请求体长度补上。
+与请求体长度不一致时 framed 为 False，连接上后续的报文无法分界，连接池与管线化不再复用该连接。
+usage:
+    raw_request = serialize_payload(payload)
+    conn, response = connection_pool.urlopen(raw_request.netloc, raw_request.method, raw_request.target,
+                                             raw=raw_request)
+请求体为 SegmentedBody(如共享的填充缓冲区)时报文保持分段，由连接池用 sendmsg 分散写出；
+请求体为 ChunkedBody 时请求头之后逐块写出分块帧(见 write_to)。
+"""
+
+# 同一载荷的变异体大多只修改请求体，请求行 + 请求头部分按内容缓存
+PREFIX_CACHE_SIZE = 1024
+CRLF = b"\r\n"
+# 请求行中需要编码的字符: 空白、控制字符以及非 ASCII 字符，其余字符保持原样
+_UNSAFE_TARGET_CHARS = re.compile(r"[\x00-\x20\x7f-\U0010ffff]")
+_BOUNDARY_PATTERN = re.compile(r'boundary="?([^";,]+)"?', re.IGNORECASE)
+
+
+def _is_default_close(name, value):
+    """载荷自带的 Connection: close，序列化时丢弃"""
+    return isinstance(name, str) and name.lower() == 'connection' and str(value).strip().lower() == 'close'
+
+
+def _requests_close(headers):
+    """写出的 Connection 请求头中带有 close 选项，即请求本身要求服务端在响应后关闭连接"""
+    value = _find_header(headers, 'connection')
+    if value is None or _is_default_close('connection', value):
+        return False
+    return 'close' in (token.strip().lower() for token in str(value).split(','))
+
+
+class RawRequest:
+    """
+    序列化后的请求，segments 为报文的各个分段(通常只有一段)，
+    stream 为跟在 segments 之后流式写出的分块请求体(ChunkedBody)，size 为报文总字节数，
+    closes 表示请求本身带有 Connection: close(服务端响应后关闭连接是请求导致的)，
+    framed 为 False 表示载荷自带的 Content-Length 与请求体长度不一致(该连接不能再复用)。
+    """
+    __slots__ = ('method', 'url', 'netloc', 'target', 'segments', 'stream', 'size', 'closes', 'framed')
+
+    def __init__(self, method, url, netloc, target, segments, stream=None, closes=False, framed=True):
+        self.method = method
+        self.url = url
+        self.netloc = netloc
+        self.target = target
+        self.segments = tuple(segments)
+        self.stream = stream
+        self.size = sum(len(segment) for segment in self.segments) + (len(stream) if stream is not None else 0)
+        self.closes = closes
+        self.framed = framed
+
+    @property
+    def data(self):
+        """完整的报文字节，分段或流式请求体时会拼接出一份副本"""
+        if len(self.segments) == 1 and self.stream is None:
+            return bytes(self.segments[0])
+        return b"".join(self.segments) + (bytes(self.stream) if self.stream is not None else b"")
+
+    def write_to(self, sock):
+        send_segments(sock, self.segments)
+        if self.stream is not None:
+            self.stream.write_to(sock)
+
+    def fingerprint(self):
+        """
+        请求指纹: 目标地址(netloc)相同，且方法、请求目标、请求头与请求体序列化后的字节完全相同即视为同一请求。
+        请求行为 path 形式(如强化学习载荷)时报文中没有目标地址，发往不同 WAF 目标的相同报文靠 netloc 区分。
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(_to_bytes(self.netloc) + CRLF)
+        for segment in self.segments:
+            digest.update(segment)
+        if self.stream is not None:
+            for frame in self.stream.frames():
+                for part in frame:
+                    digest.update(part)
+        return digest.hexdigest()
+
+    def __repr__(self):
+        return "<RawRequest [" + self.method + "] " + self.url + " " + str(self.size) + " bytes>"
+
+
+def _quote_target(target):
+    return _UNSAFE_TARGET_CHARS.sub(lambda m: "".join("%%%02X" % b for b in m.group().encode('utf-8')), target)
+
+
+def _to_bytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    value = str(value)
+    try:
+        return value.encode('latin-1')
+    except UnicodeEncodeError:
+        return value.encode('utf-8')
+
+
+def _find_header(headers, name):
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _encode_multipart(data, files, boundary):
+    """
+    与 requests 的 multipart 编码一致，但优先使用请求头里(可能被变异过)的 boundary。
+    文件内容为 SegmentedBody 时返回 SegmentedBody，不拼接文件内容。
+    """
+    boundary_bytes = _to_bytes(boundary)
+    parts = []
+    fields = []
+    if isinstance(data, dict):
+        fields = list(data.items())
+    elif isinstance(data, (list, tuple)):
+        fields = list(data)
+    for name, value in fields:
+        for item in (value if isinstance(value, (list, tuple)) else [value]):
+            parts.append(b'Content-Disposition: form-data; name="' + _to_bytes(name) + b'"\r\n\r\n' + _to_bytes(item))
+    for name, value in (files.items() if isinstance(files, dict) else files):
+        content_type = None
+        if isinstance(value, (list, tuple)):
+            filename, content = value[0], value[1]
+            if len(value) > 2:
+                content_type = value[2]
+        else:
+            filename, content = getattr(value, 'name', name), value
+        if hasattr(content, 'read'):
+            content = content.read()
+        part = b'Content-Disposition: form-data; name="' + _to_bytes(name) + b'"'
+        if filename is not None:
+            part += b'; filename="' + _to_bytes(os.path.basename(str(filename))) + b'"'
+        part += CRLF
+        if content_type:
+            part += b'Content-Type: ' + _to_bytes(content_type) + CRLF
+        parts.append((part + CRLF, content if isinstance(content, SegmentedBody) else _to_bytes(content)))
+    segments = []
+    for part in parts:
+        segments.append(b"--" + boundary_bytes + CRLF)
+        segments.extend(part if isinstance(part, tuple) else (part,))
+        segments.append(CRLF)
+    segments.append(b"--" + boundary_bytes + b"--" + CRLF)
+    if any(isinstance(segment, SegmentedBody) for segment in segments):
+        return SegmentedBody(segments)
+    return b"".join(segments)
+
+
+def encode_body(method, headers, data=None, files=None):
+    """
+    返回 (method, extra_headers, body)。
+    JSON_POST / UPLOAD 与 process_requests 一样映射为 POST；
+    dict 形式的 data 按 urlencoded 编码，files 按 multipart 编码，str/bytes 原样发送，
+    SegmentedBody/ChunkedBody 原样返回。
+    extra_headers 为请求头中缺失、需要补上的 Content-Type。
+    """
+    extra_headers = []
+    if method == 'JSON_POST':
+        method = 'POST'
+        data = json.dumps(str(data) if isinstance(data, (SegmentedBody, ChunkedBody)) else data)
+    if method == 'UPLOAD':
+        method = 'POST'
+    if files:
+        content_type = _find_header(headers, 'content-type')
+        match = _BOUNDARY_PATTERN.search(content_type) if content_type else None
+        # 未指定 boundary 时由内容生成，相同的载荷得到相同的报文，便于按指纹去重
+        boundary = match.group(1) if match else hashlib.md5(repr((data, files)).encode('utf-8')).hexdigest()
+        if content_type is None:
+            extra_headers.append(('Content-Type', 'multipart/form-data; boundary=' + boundary))
+        return method, extra_headers, _encode_multipart(data, files, boundary)
+    if isinstance(data, ChunkedBody):
+        if _find_header(headers, 'transfer-encoding') is None:
+            extra_headers.append(('Transfer-Encoding', 'chunked'))
+        return method, extra_headers, data
+    if isinstance(data, SegmentedBody):
+        return method, extra_headers, data if data else None
+    if data is None or data == {} or data == []:
+        return method, extra_headers, None
+    if isinstance(data, (dict, list, tuple)):
+        if _find_header(headers, 'content-type') is None:
+            extra_headers.append(('Content-Type', 'application/x-www-form-urlencoded'))
+        return method, extra_headers, urlencode(data, doseq=True).encode('utf-8')
+    if isinstance(data, str):
+        return method, extra_headers, data.encode('utf-8')
+    if hasattr(data, 'read'):
+        return method, extra_headers, data.read()
+    return method, extra_headers, bytes(data)
+
+
+@lru_cache(maxsize=PREFIX_CACHE_SIZE)
+def _serialize_prefix(method, target, host, header_items):
+    """请求行 + 请求头(不含载荷自带的 Connection: close)，按内容缓存，同一载荷的变异体共享"""
+    lines = [_to_bytes(method) + b" " + _to_bytes(target) + b" HTTP/1.1"]
+    names = {name.lower() for name, _ in header_items if isinstance(name, str)}
+    # 与 http.client 的默认行为一致: 未指定时补上 Host 与 Accept-Encoding: identity
+    if 'host' not in names:
+        lines.append(b"Host: " + _to_bytes(host))
+    if 'accept-encoding' not in names:
+        lines.append(b"Accept-Encoding: identity")
+    for name, value in header_items:
+        if _is_default_close(name, value):
+            continue
+        lines.append(_to_bytes(name) + b": " + _to_bytes(value))
+    return CRLF.join(lines) + CRLF
+
+
+def serialize_request(method, url, headers=None, data=None, files=None, absolute_form=True):
+    """
+    把一个请求序列化为 RawRequest。
+    absolute_form 为 True 时请求行使用完整 URL(与原先 http.client 发送 prep_request.url 的行为一致)，
+    否则使用 path?query。
+    headers 中有 Content-Length 时按原样写出(与请求体长度不一致也不修正)，否则按请求体长度补上。
+    """
+    headers = headers or {}
+    method, extra_headers, body = encode_body(method, headers, data, files)
+    parts = urlsplit(url)
+    if absolute_form:
+        target = url
+    else:
+        target = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+    target = _quote_target(target)
+    header_items = tuple(headers.items()) + tuple(extra_headers)
+    try:
+        prefix = _serialize_prefix(method, target, parts.netloc, header_items)
+    except TypeError:
+        # 请求头中有不可哈希的值，跳过缓存
+        prefix = _serialize_prefix.__wrapped__(method, target, parts.netloc, header_items)
+    closes = _requests_close(headers)
+    content_length = _find_header(headers, 'content-length')
+    if isinstance(body, ChunkedBody):
+        # 分块传输的请求体不补写 Content-Length，请求头之后流式写出
+        return RawRequest(method, url, parts.netloc, target, (prefix + CRLF,), stream=body, closes=closes,
+                          framed=content_length is None)
+    # 载荷自带的 Content-Length 已按原样写在请求头中；
+    # 否则与 requests 一致: 有请求体或非 GET/HEAD 请求时写出 Content-Length
+    if content_length is None:
+        if body is not None:
+            prefix += b"Content-Length: " + str(len(body)).encode() + CRLF
+        elif method not in ('GET', 'HEAD'):
+            prefix += b"Content-Length: 0" + CRLF
+    framed = content_length is None or str(content_length).strip() == str(len(body) if body is not None else 0)
+    if isinstance(body, SegmentedBody):
+        return RawRequest(method, url, parts.netloc, target, (prefix + CRLF,) + body.segments, closes=closes,
+                          framed=framed)
+    return RawRequest(method, url, parts.netloc, target, (prefix + CRLF + (body or b""),), closes=closes,
+                      framed=framed)
+
+
+def serialize_payload(payload, url=None, absolute_form=True):
+    """序列化一个载荷字典，url 不为空时替换载荷中的 url(例如映射到 WAF 端口)"""
+    return serialize_request(payload['method'], url or payload['url'], payload.get('headers'),
+                             data=payload.get('data'), files=payload.get('files'), absolute_form=absolute_form)
+
+
+if __name__ == "__main__":
+    # 基准测试: 原有 process_requests + send_requests 与 serialize_payload + 原始报文发送的对比
+    import threading
+    import time
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from utils.prowler_process_requests import process_requests, send_requests, send_raw_request
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            self._reply()
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self._reply()
+
+        def _reply(self):
+            body = b"ok"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:" + str(server.server_port) + "/login?user=admin"
+    headers = {'User-Agent': 'prowler', 'Cookie': 'session=1'}
+    mutants = [{'url': url, 'method': 'POST', 'headers': headers, 'data': {'id': "1' or " + str(i) + "=" + str(i)}}
+               for i in range(2000)]
+
+    start = time.perf_counter()
+    for mutant in mutants:
+        process_requests(mutant['headers'], mutant['url'], mutant['method'], data=mutant['data'])
+    prepare_cost = time.perf_counter() - start
+    start = time.perf_counter()
+    for mutant in mutants:
+        serialize_payload(mutant)
+    serialize_cost = time.perf_counter() - start
+    print("serialize only: prepare %.3fs, raw %.3fs (%.1fx)" % (prepare_cost, serialize_cost, prepare_cost / serialize_cost))
+
+    start = time.perf_counter()
+    for mutant in mutants:
+        send_requests(process_requests(mutant['headers'], mutant['url'], mutant['method'], data=mutant['data']), timeout=5)
+    prepare_cost = time.perf_counter() - start
+    start = time.perf_counter()
+    for mutant in mutants:
+        send_raw_request(serialize_payload(mutant), timeout=5)
+    serialize_cost = time.perf_counter() - start
+    print("serialize + send: prepare %.3fs, raw %.3fs (%.1fx)" % (prepare_cost, serialize_cost, prepare_cost / serialize_cost))
+    server.shutdown()
@@ -0,0 +1,262 @@
+import copy
+import hashlib
+import pickle
+import sys
+from collections.abc import MutableMapping
+
+from utils.logUtils import LoggerSingleton
+from utils.prowler_segmented_body import SegmentedBody, ChunkedBody
+from utils.prowler_random import seeded_random, mutation_seed
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_request.py: "
+
+# 不可变的叶子: 复制时直接共享
+ATOMIC_TYPES = frozenset((str, bytes, int, float, bool, type(None), SegmentedBody, ChunkedBody))
+
+
+def cow_copy(value):
+    """
+    复制可变容器(dict/list/映射类型)本身，共享不可变的叶子(字符串、文件内容 bytes、元组、分段请求体)。
+    代替 copy.deepcopy: 不需要 memo，字典用 C 实现的 copy() 整体复制后只替换其中的可变值。
+    """
+    value_type = type(value)
+    if value_type in ATOMIC_TYPES:
+        return value
+    if value_type is dict or isinstance(value, MutableMapping) and hasattr(value, 'copy'):
+        # CaseInsensitiveDict 等映射类型同样处理
+        copied = value.copy()
+        for key, item in copied.items():
+            if type(item) not in ATOMIC_TYPES:
+                # 替换已有键的值不改变字典大小，可以在遍历中进行
+                copied[key] = cow_copy(item)
+        return copied
+    if value_type is list:
+        return [item if type(item) in ATOMIC_TYPES else cow_copy(item) for item in value]
+    if value_type is tuple:
+        if all(type(item) in ATOMIC_TYPES for item in value):
+            return value
+        return tuple(cow_copy(item) for item in value)
+    return copy.deepcopy(value)
+
+
+class ProwlerRequest:
+    """
+    不可变的请求表示，字段在请求之间结构共享: replace() 只替换变化的字段，其余字段与原请求共用。
+    构造时不复制参数，传入的容器归请求所有，之后不再原地修改。
+    变异方法会原地修改传入的参数，apply() / thaw() 为其复制顶层容器，不可变的叶子仍然共享。
+    usage:
+        request = ProwlerRequest(headers, url, method, data, files)
+        sub_mutant_payloads = request.apply(mutant_method)
+        upload = request.replace(files=new_files)
+    """
+
+    __slots__ = ('headers', 'url', 'method', 'data', 'files')
+
+    def __init__(self, headers, url, method, data=None, files=None):
+        object.__setattr__(self, 'headers', headers)
+        object.__setattr__(self, 'url', url)
+        object.__setattr__(self, 'method', method)
+        object.__setattr__(self, 'data', data)
+        object.__setattr__(self, 'files', files or None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ProwlerRequest is immutable, use replace()")
+
+    def __delattr__(self, name):
+        raise AttributeError("ProwlerRequest is immutable, use replace()")
+
+    @classmethod
+    def from_payload(cls, payload, body_key='data'):
+        """从载荷字典构造，RL 环境中请求体的键为 body"""
+        return cls(payload.get('headers'), payload.get('url'), payload.get('method'), payload.get(body_key),
+                   payload.get('files'))
+
+    def fields(self):
+        return self.headers, self.url, self.method, self.data, self.files
+
+    def replace(self, **changes):
+        fields = dict(zip(self.__slots__, self.fields()))
+        fields.update(changes)
+        return ProwlerRequest(**fields)
+
+    def thaw(self):
+        """返回可原地修改的 (headers, url, method, data, files)，只复制容器，不复制字符串和文件内容"""
+        return cow_copy(self.headers), self.url, self.method, cow_copy(self.data), cow_copy(self.files)
+
+    def apply(self, mutant_method, analysis=None, seed=None):
+        """
+        在本请求的可修改副本上执行变异方法，返回其子载荷列表；analysis 为共享的请求解析结果。
+        指定 seed 时变异方法的随机数由 (方法名, seed, 请求指纹) 决定，相同参数总是得到相同的结果。
+        """
+        if seed is None:
+            return mutant_method(*self.thaw(), analysis=analysis)
+        with seeded_random(mutation_seed(mutant_method.__name__, seed, self.fingerprint())):
+            return mutant_method(*self.thaw(), analysis=analysis)
+
+    def fingerprint(self):
+        """请求内容(含完整的请求体与文件内容)的摘要"""
+        headers = list(self.headers.items()) if self.headers else None
+        try:
+            serialized = pickle.dumps((headers, self.url, self.method, self.data, self.files), protocol=4)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            serialized = repr((headers, self.url, self.method, self.data, self.files)).encode()
+        return hashlib.sha1(serialized).hexdigest()
+
+    def to_payload(self, body_key='data'):
+        """转换为载荷字典，字段与本请求共享"""
+        return {'headers': self.headers, 'url': self.url, 'method': self.method, body_key: self.data,
+                'files': self.files}
+
+    def __eq__(self, other):
+        return isinstance(other, ProwlerRequest) and self.fields() == other.fields()
+
+    def __hash__(self):
+        return hash((self.url, self.method))
+
+    def __reduce__(self):
+        return ProwlerRequest, self.fields()
+
+    def __repr__(self):
+        return "ProwlerRequest(" + str(self.method) + " " + str(self.url) + ")"
+
+
+# 可选字段: 值为 None 时视为不存在，与原先载荷字典中没有该键一致
+OPTIONAL_FIELDS = frozenset(('mutant_method', 'original_url'))
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class MutantRequest:
+    """
+    变异载荷的紧凑表示(__slots__)，代替每个变异载荷一个字典。
+    变异方法名与原始 url 驻留(sys.intern)，同一方法、同一站点的变异载荷共用同一个字符串。
+    提供字典兼容的访问(payload['url'] / payload.get('data') / 'original_url' in payload)，发送与判定代码无需区分。
+    结果中的 payload 字段直接引用变异载荷，写入结果文件或日志时才按原字典格式生成文本。
+    """
+
+    __slots__ = ('headers', 'url', 'method', 'data', 'files', 'mutant_method', 'original_url')
+
+    def __init__(self, headers, url, method, data=None, files=None, mutant_method=None, original_url=None):
+        self.headers = headers
+        self.url = url
+        self.method = method
+        self.data = data
+        self.files = files
+        self.mutant_method = _intern(mutant_method)
+        self.original_url = _intern(original_url)
+
+    @classmethod
+    def from_payload(cls, payload, mutant_method=None, original_url=None):
+        """从变异方法返回的载荷字典构造"""
+        return cls(payload.get('headers'), payload.get('url'), payload.get('method'), payload.get('data'),
+                   payload.get('files'), mutant_method or payload.get('mutant_method'),
+                   original_url or payload.get('original_url'))
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            value = getattr(self, key)
+            if value is not None or key not in OPTIONAL_FIELDS:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, _intern(value) if key in OPTIONAL_FIELDS else value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and (key not in OPTIONAL_FIELDS or getattr(self, key) is not None)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return [key for key in self.__slots__ if key in self]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __reduce__(self):
+        # 多进程/工作者结果合并时经构造函数还原，重新驻留字符串
+        return MutantRequest, tuple(getattr(self, key) for key in self.__slots__)
+
+    def __repr__(self):
+        # 与原载荷字典的 str() 相同，update_memory 按该格式提取 mutant_method
+        return repr(self.to_dict())
+
+
+def result_payload(payload):
+    """结果中的 payload 字段: 变异载荷直接引用(按需生成文本)，其他载荷(原始载荷、RL 载荷字典)仍为 str()"""
+    return payload if isinstance(payload, MutantRequest) else str(payload)
+
+
+if __name__ == '__main__':
+    # 1. 对比 copy.deepcopy 与 ProwlerRequest.thaw 每个变异载荷的耗时和内存分配
+    # 2. 10k 个变异载荷的结果列表: 字典载荷 + str(payload) 与 MutantRequest + 按需生成文本的每条结果内存
+    # usage: cd src && python -m utils.prowler_request
+    import logging
+    import time
+    import tracemalloc
+    from utils.prowler_request import ProwlerRequest as Request, MutantRequest as Mutant
+    headers = {'Content-Type': 'multipart/form-data; boundary=prowler', 'User-Agent': 'prowler',
+               'Accept': '*/*', 'Cookie': 'session=' + 'a' * 64}
+    files = {'file' + str(i): ('shell' + str(i) + '.php', b'<?php system($_GET["c"]); ?>' * 4096,
+                               'application/x-php') for i in range(4)}
+    data = {'name': 'upload', 'token': 'b' * 32, 'ids': ['1', '2', '3']}
+    request = Request(headers, 'http://127.0.0.1:8001/upload', 'UPLOAD', data, files)
+    rounds = 20000
+
+    def deepcopy_fields():
+        return (copy.deepcopy(headers), copy.deepcopy(request.url), copy.deepcopy(request.method),
+                copy.deepcopy(data), copy.deepcopy(files))
+
+    for name, run in (("deepcopy", deepcopy_fields), ("thaw", request.thaw)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            run()
+        elapsed = time.perf_counter() - start
+        # 峰值包含 deepcopy 的 memo 等临时分配
+        tracemalloc.start()
+        kept = [run() for _ in range(1000)]
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(name + ": " + str(round(elapsed / rounds * 1e6, 2)) + " us/mutant, " +
+              str(current // len(kept)) + " bytes kept/mutant, peak " + str(peak // len(kept)) + " bytes/mutant")
+
+    from utils.prowler_mutant import iter_mutant_payloads
+    from utils.prowler_process_requests import build_result
+
+    class Response:
+        status_code = 403
+        text = 'blocked'
+        error = None
+
+    logger.setLevel(logging.ERROR)
+    total = 10000
+    bodies = ['cmd=' + str(i) + ';cat /etc/passwd&id=' + 'x' * 512 for i in range(8)]
+    for name, to_payload in (("dict + str(payload)", Mutant.to_dict), ("MutantRequest", lambda mutant: mutant)):
+        results = []
+        tracemalloc.start()
+        while len(results) < total:
+            for body in bodies:
+                url = 'http://127.0.0.1:8001/rce_post'
+                for mutant in iter_mutant_payloads({'Content-Type': 'application/x-www-form-urlencoded'}, url, 'POST',
+                                                   body, enable_shortcut=False):
+                    results.append(build_result(url.replace('8001', '9001'), url, to_payload(mutant), Response))
+        results = results[:total]
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(name + ": " + str(current // len(results)) + " bytes/result over " + str(len(results)) + " results")
+        del results
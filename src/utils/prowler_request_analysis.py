@@ -0,0 +1,181 @@
+import re
+import urllib.parse
+from functools import cached_property
+
+from utils.logUtils import LoggerSingleton
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_request_analysis.py: "
+
+MULTIPART_FILENAME = re.compile(r'Content-Disposition: form-data;.*filename="([^"]+)"')
+MULTIPART_BOUNDARY = re.compile(r'boundary=(.*)')
+# 请求体中各部分的 Content-Type:xxx; 声明
+PART_CONTENT_TYPE = re.compile(r'Content-Type:[^;]+;\s*')
+
+BODY_NONE = 'none'
+BODY_FORM = 'form'
+BODY_JSON = 'json'
+BODY_MULTIPART = 'multipart'
+BODY_DICT = 'dict'
+BODY_TEXT = 'text'
+
+
+class RequestAnalysis:
+    """
+    对一个原始载荷只解析一次，结果交给所有变异方法共享: 解析后的 url、查询参数、请求体格式、
+    解码后的请求体、multipart 的 boundary / 文件名 / 各部分。各项在首次使用时计算并缓存。
+    返回的解析结果被所有变异方法共享，只读。
+    usage:
+        analysis = RequestAnalysis(headers, url, method, data)
+        sub_mutant_payloads = mutant_method(headers, url, method, data, files, analysis=analysis)
+        # 变异方法内部
+        analysis = analyze(headers, url, method, data, analysis)
+    """
+
+    def __init__(self, headers, url, method, data):
+        self.url = url
+        self.method = method
+        self.data = data
+        # 变异方法会原地修改 headers，这里只保留解析时的 Content-Type
+        self.content_type = headers.get('Content-Type') if headers else None
+
+    def describes(self, headers, url, method, data):
+        """解析结果是否对应这组参数(组合变异的后续步骤、深度变异后参数会变化)"""
+        content_type = headers.get('Content-Type') if headers else None
+        return (self.url is url or self.url == url) and self.method == method and \
+            (self.data is data or type(self.data) is type(data) and self.data == data) and \
+            self.content_type == content_type
+
+    @cached_property
+    def parsed_url(self):
+        return urllib.parse.urlparse(self.url)
+
+    @cached_property
+    def base_url(self):
+        """去掉查询参数的 url"""
+        parsed_url = self.parsed_url
+        return f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
+
+    @cached_property
+    def query_pairs(self):
+        """按出现顺序的 (参数, 值)，保留空值"""
+        return urllib.parse.parse_qsl(self.parsed_url.query, keep_blank_values=True)
+
+    @cached_property
+    def query_params(self):
+        """与 parse_qs(query, keep_blank_values=True) 相同: 参数 -> 值列表"""
+        params = {}
+        for key, value in self.query_pairs:
+            params.setdefault(key, []).append(value)
+        return params
+
+    def query_first_values(self, keep_blank_values=False):
+        """每个参数的第一个值，与 {k: v[0] for k, v in parse_qs(query).items()} 相同"""
+        values = {}
+        for key, value in self.query_pairs:
+            if (value or keep_blank_values) and key not in values:
+                values[key] = value
+        return values
+
+    def replace_url(self, **parts):
+        """替换 url 的部分(path / query 等)后重新拼接"""
+        return urllib.parse.urlunparse(self.parsed_url._replace(**parts))
+
+    @cached_property
+    def text(self):
+        """字符串形式的请求体: bytes 按 utf-8 解码，其余类型原样返回"""
+        if isinstance(self.data, (bytes, bytearray)):
+            return self.data.decode()
+        return self.data
+
+    @cached_property
+    def is_multipart(self):
+        return bool(self.content_type) and self.content_type.startswith('multipart/form-data')
+
+    @cached_property
+    def body_format(self):
+        if not self.data:
+            return BODY_NONE
+        if isinstance(self.data, dict):
+            return BODY_DICT
+        if self.is_multipart:
+            return BODY_MULTIPART
+        if self.content_type and 'application/json' in self.content_type:
+            return BODY_JSON
+        if isinstance(self.text, str) and '=' in self.text:
+            return BODY_FORM
+        return BODY_TEXT
+
+    @cached_property
+    def boundary(self):
+        """Content-Type 中的 boundary，没有时为 None"""
+        match = MULTIPART_BOUNDARY.search(self.content_type) if self.content_type else None
+        return match.group(1) if match else None
+
+    @cached_property
+    def filenames(self):
+        return MULTIPART_FILENAME.findall(self.text) if isinstance(self.text, str) else []
+
+    @cached_property
+    def multipart_parts(self):
+        """按 boundary 拆分的各部分(不含前导与结束标记)"""
+        if not self.boundary or not isinstance(self.text, str):
+            return []
+        parts = self.text.split('--' + self.boundary)
+        return [part for part in parts[1:] if not part.startswith('--')]
+
+    def split_body(self, separator):
+        """请求体按分隔符拆分的结果(参数污染按 '=' / ':' 拆分)"""
+        cache = self.__dict__.setdefault('_split_body', {})
+        if separator not in cache:
+            cache[separator] = self.data.split(separator)
+        return cache[separator]
+
+
+def analyze(headers, url, method, data, analysis=None):
+    """变异方法取得与其参数一致的解析结果: 传入的解析结果对应这组参数时直接使用，否则重新解析"""
+    if analysis is not None and analysis.describes(headers, url, method, data):
+        return analysis
+    return RequestAnalysis(headers, url, method, data)
+
+
+if __name__ == '__main__':
+    # 对比每个变异方法各自解析与共享一次解析时，所有启用的变异方法处理一组载荷的耗时
+    # usage: cd src && python -m utils.prowler_request_analysis
+    import logging
+    import random
+    import time
+    from utils.prowler_mutant_methods import mutant_methods
+    from utils.prowler_request import ProwlerRequest
+    from utils.prowler_request_analysis import RequestAnalysis as Analysis
+
+    logger.setLevel(logging.ERROR)
+    boundary = '----WebKitFormBoundaryprowler'
+    upload = ''.join('--' + boundary + '\r\nContent-Disposition: form-data; name="f' + str(i) + '"; filename="s' +
+                     str(i) + '.php"\r\nContent-Type: application/x-php\r\n\r\n' + '<?php system($_GET[1]); ?>' * 256 +
+                     '\r\n' for i in range(8)) + '--' + boundary + '--\r\n'
+    payloads = [
+        ({'User-Agent': 'prowler'}, 'http://127.0.0.1:8001/rce_get?cmd=cat%20/etc/passwd&' +
+         '&'.join('p' + str(i) + '=' + str(i) for i in range(32)), 'GET', None, None),
+        ({'Content-Type': 'application/x-www-form-urlencoded'}, 'http://127.0.0.1:8001/rce_post', 'POST',
+         'cmd=cat /etc/passwd', None),
+        ({'Content-Type': 'multipart/form-data; boundary=' + boundary}, 'http://127.0.0.1:8001/upload', 'UPLOAD',
+         upload.encode(), None),
+    ]
+    rounds = 20
+    for name, shared in (("parse per method", False), ("parse once", True)):
+        random.seed(0)
+        elapsed = 0
+        for _ in range(rounds):
+            for headers, url, method, data, files in payloads:
+                request = ProwlerRequest(headers, url, method, data, files)
+                start = time.perf_counter()
+                analysis = Analysis(headers, url, method, data) if shared else None
+                for mutant_method in mutant_methods:
+                    try:
+                        request.apply(mutant_method, analysis)
+                    except Exception:
+                        pass
+                elapsed += time.perf_counter() - start
+        print(name + ": " + str(round(elapsed / rounds * 1000, 2)) + " ms per payload set (" +
+              str(len(mutant_methods)) + " methods x " + str(len(payloads)) + " payloads)")
@@ -0,0 +1,123 @@
+import json
+import threading
+import zlib
+import xml.etree.ElementTree as ET
+
+from utils.logUtils import LoggerSingleton
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_response.py: "
+
+# 每个响应最多读取的字节数，超过部分丢弃(连接不再复用)，0 表示不限制
+DEFAULT_MAX_BODY_SIZE = 1024 * 1024
+# 按文本处理的 Content-Type，其余类型仍返回“解析响应失败”
+TEXT_CONTENT_TYPES = ('application/json', 'text/html', 'application/xml', 'text/xml', 'gzip', 'text/plain')
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class ResponseBody:
+    """
+    保存响应体原始字节，按需解压、解码和解析，结果缓存。
+    check_response_text 只做子串匹配，因此通常只会用到 text，不再对每个 HTML 响应执行 BeautifulSoup。
+    """
+    __slots__ = ('raw', 'content_type', 'truncated', '_text')
+
+    def __init__(self, raw, content_type=None, truncated=False):
+        self.raw = raw
+        self.content_type = content_type
+        self.truncated = truncated
+        self._text = None
+
+    @property
+    def content(self):
+        """解压后的字节，被截断的 gzip 数据尽量解压已收到的部分"""
+        if self.raw[:2] != GZIP_MAGIC:
+            return self.raw
+        try:
+            return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(self.raw)
+        except zlib.error as e:
+            logger.warning(TAG + f"==> 解压缩 Gzip 数据时出错: {e}")
+            return self.raw
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.content.decode('utf-8', errors='replace')
+        return self._text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def xml(self):
+        return ET.fromstring(self.text)
+
+    def prettify(self):
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(self.text, 'html.parser').prettify()
+
+    def __len__(self):
+        return len(self.raw)
+
+
+class ResponseReader:
+    """
+    读取 http.client 响应体，最多读取 max_body_size 字节。
+    debug 为 True 时额外输出格式化后的 HTML(仅用于调试，开销较大)。
+    usage:
+        body = response_reader.read(response)
+        body.text
+    """
+
+    def __init__(self, max_body_size=DEFAULT_MAX_BODY_SIZE, debug=False):
+        self.max_body_size = max_body_size
+        self.debug = debug
+        self.stats = {'read': 0, 'truncated': 0}
+        self._lock = threading.Lock()
+
+    def configure(self, max_body_size=None, debug=None):
+        if max_body_size is not None:
+            self.max_body_size = max_body_size
+        if debug is not None:
+            self.debug = debug
+
+    def read(self, response):
+        content_type = response.getheader('Content-Type')
+        if self.max_body_size:
+            raw = response.read(self.max_body_size + 1)
+            truncated = len(raw) > self.max_body_size
+            if truncated:
+                # 剩余数据不再读取，响应未读完的连接由连接池丢弃
+                raw = raw[:self.max_body_size]
+        else:
+            raw = response.read()
+            truncated = False
+        with self._lock:
+            self.stats['read'] += 1
+            self.stats['truncated'] += truncated
+        body = ResponseBody(raw, content_type, truncated)
+        if truncated:
+            logger.warning(TAG + "==>response body truncated to " + str(self.max_body_size) + " bytes")
+        if self.debug and content_type and 'text/html' in content_type:
+            logger.debug(TAG + "==>prettified html: " + body.prettify())
+        return body
+
+    def parse(self, response):
+        """
+        读取响应体并返回用于结果判定的文本，响应上附带 body(ResponseBody)。
+        没有 Content-Type 或类型未知时与原先一样返回提示文本，但仍会读完响应体以便复用连接。
+        """
+        body = self.read(response)
+        response.body = body
+        content_type = body.content_type
+        logger.debug(TAG + "==>content_type: " + str(content_type))
+        if content_type is None:
+            logger.warning(TAG + "==>响应头中没有 Content-Type 字段")
+            return "响应头中没有 Content-Type 字段, 解析响应失败"
+        if not any(item in content_type for item in TEXT_CONTENT_TYPES):
+            logger.warning(TAG + "==>Unknown response data format, content type: " + content_type)
+            return "解析响应失败"
+        return body.text
+
+
+# 全局共享的响应读取器
+response_reader = ResponseReader()
@@ -1,11 +1,6 @@
 import os
 import time
-import http.client
-import gzip
-from bs4 import BeautifulSoup
-import io
 from stable_baselines3 import PPO
-import xml.etree.ElementTree as ET
 from urllib.parse import urlparse
 from requests.models import Request, CaseInsensitiveDict
 import requests
@@ -14,6 +9,16 @@ import numpy as np
 from utils.prowler_feature_extract import prowler_feature_extract
 import utils.prowler_parse_raw_payload
 from utils.prowler_mutant_methods import *
+from utils.prowler_connection_pool import connection_pool
+from utils.prowler_response import response_reader
+from utils.prowler_circuit_breaker import circuit_breaker
+from utils.prowler_segmented_body import materialize_body
+from utils.prowler_request import ProwlerRequest
+from utils.prowler_mutation_cache import mutation_cache
+from utils.prowler_request_analysis import RequestAnalysis
+from utils.prowler_applicability import applicability_index, request_shape
+from utils.prowler_routes import route_table
+from utils.prowler_timeout_manager import adaptive_urlopen, classify_error
 from utils.logUtils import LoggerSingleton
 import sys
 
@@ -27,109 +32,29 @@ SELF_MAX_STEPS = 20
 MAX_TIME_STEPS = 35000
 
 
-def handle_json_response(response):
-    try:
-        data = json.loads(response.read().decode('utf-8'))
-        return data
-    except json.JSONDecodeError:
-        logger.warning(TAG + "==> 响应数据不是有效的 JSON 格式")
-        return "解析响应失败"
-
-
-def handle_html_response(response):
-    try:
-        # 读取响应数据
-        content = response.read()
-
-        # 检查是否需要解压缩
-        if content[:2] == b'\x1f\x8b':  # Gzip 的魔术字节
-            content = gzip.GzipFile(fileobj=io.BytesIO(content)).read()
-
-        # 解码为字符串
-        html_content = content.decode('utf-8')
-
-        # 解析 HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
-        soup = soup.prettify()
-        return soup
-    except UnicodeDecodeError as e:
-        logger.warning(TAG + f"==> 解析 HTML 时出错: {e}")
-        return None
-    except Exception as e:
-        logger.warning(TAG + f"==> 处理 HTML 响应时出错: {e}")
-        return None
-
-
-def handle_xml_response(response):
-    try:
-        xml_content = response.read().decode('utf-8')
-        root = ET.fromstring(xml_content)
-        return root
-    except ET.ParseError:
-        logger.warning(TAG + "==> 响应数据不是有效的 XML 格式")
-        return "解析响应失败"
-
-
-def handle_gzip_response(response):
-    try:
-        compressed_data = response.read()
-        with gzip.GzipFile(fileobj=io.BytesIO(compressed_data)) as gz_file:
-            decompressed_data = gz_file.read().decode('utf-8')
-        return decompressed_data
-    except Exception as e:
-        logger.warning(TAG + f"==> 解压缩 Gzip 数据时出错: {e}")
-        return "解析响应失败"
-
-
-def handle_text_response(response):
-    try:
-        text_content = response.read().decode('utf-8')
-        return text_content
-    except UnicodeDecodeError:
-        logger.warning(TAG + "==> 响应数据不是有效的文本格式")
-        return "解析响应失败"
-
-
 def parse_response(response):
-    content_type = response.getheader('Content-Type')
-    logger.debug(TAG + "==>content_type: " + str(content_type))
-    if content_type is None:
-        logger.warning(TAG + "==>响应头中没有 Content-Type 字段")
-        return "响应头中没有 Content-Type 字段, 解析响应失败"
-    if 'application/json' in content_type:
-        data = handle_json_response(response)
-    elif 'text/html' in content_type:
-        data = handle_html_response(response)
-    elif 'application/xml' in content_type or 'text/xml' in content_type:
-        data = handle_xml_response(response)
-    elif 'gzip' in content_type:
-        data = handle_gzip_response(response)
-    elif 'text/plain' in content_type:
-        data = handle_text_response(response)
-    else:
-        logger.warning(TAG + "==>Unknown response data format, content type: " + content_type)
-        data = "解析响应失败"
-    logger.info(TAG + "==>parsed data: " + str(data) + "content_type is: " + content_type)
-
+    # 只保留原始字节并解码为文本，JSON/XML/HTML 的解析与格式化由 response.body 按需进行
+    data = response_reader.parse(response)
+    logger.info(TAG + "==>parsed data: " + str(data) + "content_type is: " + str(response.body.content_type))
     return data
 
 
-def send_requests(prep_request, timeout=0.1):
+def send_requests(prep_request, timeout=None):
     url = urlparse(prep_request.get('url'))
     logger.debug(TAG + "==>url: " + str(prep_request.get('url')))
-    # 创建 HTTP 连接并设置超时
-    conn = http.client.HTTPConnection(url.netloc, timeout=timeout)
 
-    try:
+    # 获取 URL 和 body 并确保 body 为字节类型
+    body = prep_request.get('body')
+    # 确保 body 为字节类型
+    if isinstance(body, dict):
+        body = str(body).encode('utf-8')  # 将字典转换为字符串并编码为字节
+    elif isinstance(body, str):
+        body = body.encode('utf-8')  # 将字符串编码为字节
 
-        # 获取 URL 和 body 并确保 body 为字节类型
-        body = prep_request.get('body')
-        # 确保 body 为字节类型
-        if isinstance(body, dict):
-            body = str(body).encode('utf-8')  # 将字典转换为字符串并编码为字节
-        elif isinstance(body, str):
-            body = body.encode('utf-8')  # 将字符串编码为字节
-        conn.request(prep_request.get('method'), url.path, body=body, headers=prep_request.get('headers'))
+    try:
+        # 从共享连接池获取长连接发送请求，timeout 为 None 时使用自适应超时，超时将导致异常
+        conn, response = adaptive_urlopen(url.netloc, prep_request.get('method'), url.path, body=body,
+                                          headers=prep_request.get('headers'), timeout=timeout)
     except Exception as e:
         logger.error(TAG + "==>error in sending request: " + str(e))
         logger.warning(TAG + "==>payload: " + str(prep_request))
@@ -139,17 +64,10 @@ def send_requests(prep_request, timeout=0.1):
         logger.warning(TAG + "==>type of body: " + str(type(body)))
         logger.warning(TAG + "==>headers: " + str(prep_request.get('headers')))
         response = requests.Response()
+        response.error = classify_error(e)
         # raise e
         return response
 
-    try:
-        # 获取响应，超时将导致异常
-        response = conn.getresponse()
-    except Exception as e:
-        logger.error(TAG + "==>error in receiving response: " + str(e))
-        response = requests.Response()
-        return response
-
     # 记录响应状态
     temp_log = f"Response status: {response.status} {response.reason} {response.msg}"
     logger.info(TAG + temp_log)
@@ -162,8 +80,8 @@ def send_requests(prep_request, timeout=0.1):
     response.text = response_body
     response.status_code = response.status
 
-    # 关闭连接
-    conn.close()
+    # 归还连接
+    connection_pool.release(url.netloc, conn, response)
     return response
 
 
@@ -203,9 +121,9 @@ def process_requests(headers, url, method, data=None, files=None):
 def run_payload(payload, host=None, port=None, waf=True):
     logger.info(TAG + "==>run payload: " + str(payload))
     url = payload['url']
-    # todo: more sophiscated way to obtain waf payload
+    # waf 为 True 或目标 id 时按路由表映射到 WAF 目标
     if waf:
-        url = url.replace("8001", "9001").replace("8002", "9002").replace("8003", "9003")
+        url = route_table.waf_url(url, waf)
     # for not mutanted payload, copy url as original url
     # for mutanted payload, use 'original_url' to display result
 
@@ -214,7 +132,7 @@ def run_payload(payload, host=None, port=None, waf=True):
     else:
         original_url = payload['original_url']
         if waf:
-            original_url = original_url.replace("8001", "9001").replace("8002", "9002").replace("8003", "9003")
+            original_url = route_table.waf_url(original_url, waf)
     # processed_req = process_requests(headers, url, method, data=data, files=files)
     processed_req = {
         "url": url,
@@ -225,7 +143,7 @@ def run_payload(payload, host=None, port=None, waf=True):
     # print(payload)
     # print(processed_req)
     # exit()
-    response = send_requests(processed_req)
+    response = circuit_breaker.call(urlparse(url).netloc, lambda: send_requests(processed_req))
     logger.info(TAG + "==>send payload to " + url)
     logger.info(TAG + "==>response: " + str(response))
     # logger.debug(TAG + "==>response: " + str(response.text))
@@ -234,6 +152,7 @@ def run_payload(payload, host=None, port=None, waf=True):
         result = {
             'url': url,
             'original_url': original_url,
+            'target': route_table.target_of(url) or 'origin',
             'payload': str(payload),
             'response_status_code': response.status_code,
             'response_text': response.text,
@@ -243,6 +162,7 @@ def run_payload(payload, host=None, port=None, waf=True):
         result = {
             'url': url,
             'original_url': original_url,
+            'target': route_table.target_of(url) or 'origin',
             'payload': str(payload),
             'response_status_code': "Error",
             'response_text': "Error",
@@ -293,7 +213,8 @@ class WAFBypassEnv(gym.Env):
         super(WAFBypassEnv, self).__init__()
 
         self.initial_payload = self._initialize_payload(payload_for_rl)
-        self.payload = copy.deepcopy(self.initial_payload)
+        # 载荷字典不会被原地修改(变异在 ProwlerRequest 的副本上进行)，与初始载荷共享即可
+        self.payload = self.initial_payload
         if 'headers' not in self.payload or 'url' not in self.payload or 'method' not in self.payload:
             raise ValueError("Payload must contain 'headers', 'url', and 'method' fields.")
         self.payloads = [self.payload]
@@ -359,7 +280,7 @@ class WAFBypassEnv(gym.Env):
         self.action_failure_counts = np.zeros(self.total_methods, dtype=np.float32)
         self.past_actions = np.full(self.N, -1, dtype=np.int32)
         self.last_action = -1
-        self.payload = copy.deepcopy(self.initial_payload)
+        self.payload = self.initial_payload
         self.state = self._get_state()
 
     def reset(self, *, seed=None, options=None):
@@ -455,22 +376,16 @@ class WAFBypassEnv(gym.Env):
 
     def _restore_payload(self):
         logger.warning("Restoring original payload.")
-        self.payload = copy.deepcopy(self.initial_payload)
+        self.payload = self.initial_payload
 
     def _apply_special_mutation(self):
         logger.warning("Applying special mutation method.")
-        payload_to_mutate = copy.deepcopy(self.payload)
         special_method_name, special_method_func = deep_mutant_methods[0]
-        headers, url, method, data = payload_to_mutate.get('headers'), payload_to_mutate.get(
-            'url'), payload_to_mutate.get('method'), payload_to_mutate.get('body')
+        # 只复制变异方法可能原地修改的容器
+        request = ProwlerRequest.from_payload(self.payload, body_key='body').replace(files=None)
         try:
-            headers, url, method, data, files, res = special_method_func(
-                headers,
-                url,
-                method,
-                data,
-                None
-            )
+            # 配置了种子时，相同载荷上的变异结果从缓存中取得，不再重复执行
+            headers, url, method, data, files, res = mutation_cache.apply(request, special_method_func)
             payloads = []
             payloads.append({
                 'headers': headers,
@@ -491,16 +406,16 @@ class WAFBypassEnv(gym.Env):
 
         name, func = self.enabled_methods[method_index]
         logger.warning(f"Applying mutation method '{name}'.")
-        payload_to_mutate = copy.deepcopy(self.payload)
+        request = ProwlerRequest.from_payload(self.payload, body_key='body').replace(files=None)
+        # 不适用于当前载荷形态的变异方法必然不生成载荷，直接跳过
+        shape = request_shape(*request.fields(), RequestAnalysis(request.headers, request.url, request.method,
+                                                                  request.data))
+        if not applicability_index.applies(func, shape):
+            return
 
         try:
-            payloads = func(
-                payload_to_mutate.get('headers'),
-                payload_to_mutate.get('url'),
-                payload_to_mutate.get('method'),
-                payload_to_mutate.get('body'),
-                None
-            )
+            # 配置了种子时，各回合中相同载荷上的变异结果从缓存中取得，不再重复执行
+            payloads = mutation_cache.apply(request, func)
             self._update_payload_from_mutation_results(payloads)
         except Exception as e:
             logger.error(f"Error applying mutation method '{name}': {e}")
@@ -510,9 +425,10 @@ class WAFBypassEnv(gym.Env):
         if payloads:
             for payload in payloads:
                 if 'data' in payload:
-                    payload['body'] = payload.pop('data')
+                    # 填充类变异返回分段的请求体，RL 环境的特征提取与后续变异按字符串处理
+                    payload['body'] = materialize_body(payload.pop('data'))
             # 保留最后一个有效载荷
-            self.payload = copy.deepcopy(payloads[-1])
+            self.payload = payloads[-1]
             self.payloads = payloads
         logger.info(f"{TAG}==>mutated payload: {self.payload}")
 
@@ -889,7 +805,8 @@ def prowler_begin_to_mutant_payload_with_rl(headers, url, method, data, files=No
             # 仅保留奖励为 100 的 payload
             if reward > 1:
                 payload = env.get_payload()
-                mutant_payloads.append(copy.deepcopy(payload))
+                # 环境中的载荷不会被原地修改，复制字典本身即可
+                mutant_payloads.append(dict(payload))
                 logger.info("Added payload with reward 100 to mutant_payloads")
 
                 # 在 "first" 模式下，找到一个成功的 payload 就直接返回
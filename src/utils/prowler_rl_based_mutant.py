@@ -7,6 +7,8 @@ import collections
 
 from utils.prowler_mutant_methods import *
 from utils.logUtils import LoggerSingleton
+from utils.prowler_routes import route_table
+from utils.prowler_request import ProwlerRequest
 
 logger = LoggerSingleton().get_logger()
 TAG = "prowler_mutant.py: "
@@ -97,7 +99,7 @@ def prowler_begin_to_mutant_payloads(headers, url, method, data, files=None, dee
         mem_dict = {}
         for mem in memories:
             mem_dict[mem['url']] = mem['successful_mutant_method']
-        __url = url.replace('8001', '9001').replace('8002', '9002').replace('8003', '9003')
+        __url = route_table.waf_url(url)
         if __url in mem_dict:
             if mem_dict[__url] in mutant_methods_config:
                 mutant_method, flag = mutant_methods_config[mem_dict[__url]]
@@ -145,11 +147,7 @@ def prowler_begin_to_mutant_payloads(headers, url, method, data, files=None, dee
     action = agent.choose_action(state_vector)
 
     # 执行动作
-    headers_copy = copy.deepcopy(headers)
-    url_copy = copy.deepcopy(url)
-    method_copy = copy.deepcopy(method)
-    data_copy = copy.deepcopy(data)
-    files_copy = copy.deepcopy(files) if files else None
+    headers_copy, url_copy, method_copy, data_copy, files_copy = ProwlerRequest(headers, url, method, data, files).thaw()
     logger.info(TAG + "==>mutant method: " + str(action))
     sub_mutant_payloads = action(headers_copy, url_copy, method_copy, data_copy, files_copy)
 
@@ -0,0 +1,119 @@
+import json
+import os
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from utils.logUtils import LoggerSingleton
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_routes.py: "
+
+# 路由表文件: 原始站点 -> 多个 WAF 部署
+DEFAULT_ROUTES_FILE = "config/routes.json"
+# 没有路由表文件时的默认路由，与原先的 8001->9001 / 8002->9002 / 8003->9003 端口替换一致
+# 以 ':' 开头的 netloc 只匹配端口，目标保持原主机名
+DEFAULT_ROUTES = [
+    {"origin": ":8001", "targets": [{"id": "waf", "netloc": ":9001"}]},
+    {"origin": ":8002", "targets": [{"id": "waf", "netloc": ":9002"}]},
+    {"origin": ":8003", "targets": [{"id": "waf", "netloc": ":9003"}]},
+]
+
+# target_id: 目标标识(写入结果的 target 字段)，origin / netloc: 路由表中的原始站点与 WAF 地址
+Route = namedtuple('Route', ['target_id', 'origin', 'netloc'])
+
+
+def _port_key(netloc):
+    host, sep, port = netloc.rpartition(':')
+    return ':' + port if sep and port.isdigit() else None
+
+
+def _replace_netloc(url, netloc, spec):
+    """把 url 中的 netloc 替换为 spec(只有端口时保留原主机名)，其余部分按原样保留"""
+    if spec.startswith(':'):
+        spec = netloc.rpartition(':')[0] + spec
+    index = url.find(netloc)
+    if index < 0:
+        return url
+    return url[:index] + spec + url[index + len(netloc):]
+
+
+class RouteTable:
+    """
+    原始站点到 WAF 部署的路由表，启动时编译为按 netloc / 端口索引的字典。
+    一个原始站点可以对应多个 WAF 目标，变异载荷生成一次后并发发送到每个目标。
+    usage:
+        route_table.configure("config/routes.json")
+        for target_id in route_table.target_ids(url):
+            waf_url = route_table.waf_url(url, target_id)
+    """
+
+    def __init__(self, routes=None):
+        self.compile(DEFAULT_ROUTES if routes is None else routes)
+
+    def configure(self, path=None):
+        path = path or DEFAULT_ROUTES_FILE
+        if not os.path.exists(path):
+            logger.info(TAG + "==>no route table at " + path + ", use default routes")
+            return
+        with open(path, "r") as f:
+            self.compile(json.load(f)['routes'])
+        logger.info(TAG + "==>loaded route table " + path + ", targets: " + str(self.all_target_ids))
+
+    def compile(self, routes):
+        # 正向: 原始站点 netloc/端口 -> (Route, ...)；反向: WAF netloc/端口 -> Route
+        self._forward = {}
+        self._reverse = {}
+        self.all_target_ids = []
+        for route in routes:
+            origin = route['origin']
+            targets = tuple(Route(target['id'], origin, target['netloc']) for target in route['targets'])
+            self._forward[origin] = targets
+            for target in targets:
+                self._reverse[target.netloc] = target
+                if target.target_id not in self.all_target_ids:
+                    self.all_target_ids.append(target.target_id)
+
+    @staticmethod
+    def _lookup(table, netloc):
+        found = table.get(netloc)
+        if found is None:
+            found = table.get(_port_key(netloc))
+        return found
+
+    def targets(self, url):
+        """url 所属原始站点配置的 WAF 目标，未配置时为空"""
+        return self._lookup(self._forward, urlsplit(url).netloc) or ()
+
+    def target_ids(self, url):
+        return [target.target_id for target in self.targets(url)]
+
+    def waf_url(self, url, target_id=True):
+        """
+        把原始站点的 url 映射到 WAF 目标，target_id 为 True 时使用第一个目标。
+        url 不属于路由表中的原始站点时原样返回。
+        """
+        netloc = urlsplit(url).netloc
+        for target in self._lookup(self._forward, netloc) or ():
+            if target_id is True or target.target_id == target_id:
+                return _replace_netloc(url, netloc, target.netloc)
+        return url
+
+    def waf_urls(self, url):
+        return [self.waf_url(url, target_id) for target_id in self.target_ids(url)]
+
+    def origin_url(self, url):
+        """把 WAF 目标的 url 映射回原始站点，不是 WAF 目标时原样返回"""
+        netloc = urlsplit(url).netloc
+        target = self._lookup(self._reverse, netloc)
+        if target is None:
+            return url
+        return _replace_netloc(url, netloc, target.origin)
+
+    def target_of(self, url):
+        """url 对应的 WAF 目标 id，不是 WAF 目标时返回 None"""
+        target = self._lookup(self._reverse, urlsplit(url).netloc)
+        return target.target_id if target is not None else None
+
+
+# 全局共享的路由表
+route_table = RouteTable()
@@ -0,0 +1,337 @@
+import threading
+import time
+
+from utils.logUtils import LoggerSingleton
+from utils.prowler_connection_pool import send_segments
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_segmented_body.py: "
+
+# 填充类变异默认的填充字节数，可通过 --padding-size 调整以探测 WAF 的检测长度上限
+DEFAULT_PADDING_SIZE = 1024
+PADDING_FILL = b'x'
+# 分块传输变异默认每块的字节数与块间延迟(秒)，可通过 --chunk-size / --chunk-delay 调整
+DEFAULT_CHUNK_SIZE = 1
+DEFAULT_CHUNK_DELAY = 0
+# 分块请求体的结束块
+LAST_CHUNK = b"0\r\n\r\n"
+# 没有块间延迟时，小块先合并到该大小的缓冲区再写出
+CHUNK_WRITE_BUFFER = 64 * 1024
+
+
+def _segment_bytes(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return value
+    return str(value).encode('utf-8')
+
+
+class SegmentedBody:
+    """
+    由多个缓冲区组成的请求体(例如共享的填充缓冲区 + 载荷)，发送时用 sendmsg 分散写出，
+    不会拼接成一个完整的字符串，每个变异载荷的内存占用与填充大小无关。
+    对象不可变，深拷贝时直接返回自身。
+    usage:
+        data = SegmentedBody([payload_bytes, padding_buffer.segment()])
+    """
+    __slots__ = ('segments',)
+
+    def __init__(self, segments):
+        flattened = []
+        for segment in segments:
+            if isinstance(segment, SegmentedBody):
+                flattened.extend(segment.segments)
+            else:
+                flattened.append(_segment_bytes(segment))
+        self.segments = tuple(flattened)
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def __bool__(self):
+        return any(len(segment) for segment in self.segments)
+
+    def __add__(self, other):
+        return SegmentedBody(self.segments + (other,))
+
+    def __radd__(self, other):
+        return SegmentedBody((other,) + self.segments)
+
+    def __bytes__(self):
+        # 会拼接出完整的请求体，只在无法分散写出的旧路径(如 RL 环境)中使用
+        return b"".join(self.segments)
+
+    def encode(self, encoding='utf-8'):
+        return bytes(self)
+
+    def __str__(self):
+        return bytes(self).decode('utf-8', errors='replace')
+
+    def __repr__(self):
+        # 日志与结果文件中只记录各段长度和开头，避免写出数 MB 的填充数据
+        return "SegmentedBody(" + ", ".join(
+            repr(bytes(segment[:32])) + ("...(" + str(len(segment)) + " bytes)" if len(segment) > 32 else "")
+            for segment in self.segments) + ")"
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return SegmentedBody, (tuple(bytes(segment) for segment in self.segments),)
+
+
+class ChunkedBody:
+    """
+    分块传输编码(Transfer-Encoding: chunked)的请求体，由生成器逐块产生分块帧并直接写到 socket，
+    不预先拼接完整的请求体；块之间可以插入延迟。
+    块大小、块扩展(如 ';')在构造时确定，data 可以是 str/bytes/SegmentedBody。
+    usage:
+        data = ChunkedBody(payload, chunk_size=1, extension=';')
+        raw_request = serialize_request('POST', url, headers, data)   # 不写 Content-Length
+    """
+    __slots__ = ('body', 'chunk_size', 'delay', 'extension')
+
+    def __init__(self, data, chunk_size=DEFAULT_CHUNK_SIZE, delay=DEFAULT_CHUNK_DELAY, extension=''):
+        self.body = data if isinstance(data, SegmentedBody) else SegmentedBody([data] if data else [])
+        self.chunk_size = max(1, chunk_size)
+        self.delay = delay
+        self.extension = _segment_bytes(extension)
+
+    def _chunks(self):
+        for segment in self.body.segments:
+            view = memoryview(segment).cast('B')
+            for start in range(0, len(view), self.chunk_size):
+                yield view[start:start + self.chunk_size]
+
+    def frames(self):
+        """逐块产生 (块头, 块数据, CRLF)，最后是结束块"""
+        for chunk in self._chunks():
+            yield (b"%x" % len(chunk) + self.extension + b"\r\n", chunk, b"\r\n")
+        yield (LAST_CHUNK,)
+
+    def write_to(self, sock):
+        """
+        把分块帧写到 socket。没有延迟时小块先合并到固定大小的缓冲区(CHUNK_WRITE_BUFFER)再写出，
+        大块直接分散写；有延迟时每块单独写出并在块之间等待。内存占用与请求体大小无关。
+        """
+        if self.delay:
+            for index, frame in enumerate(self.frames()):
+                if index:
+                    time.sleep(self.delay)
+                send_segments(sock, frame)
+            return
+        pending = bytearray()
+        for frame in self.frames():
+            if len(frame) > 1 and len(frame[1]) >= CHUNK_WRITE_BUFFER:
+                send_segments(sock, (pending,) + frame)
+                pending = bytearray()
+                continue
+            for part in frame:
+                pending += part
+            if len(pending) >= CHUNK_WRITE_BUFFER:
+                sock.sendall(pending)
+                pending = bytearray()
+        sock.sendall(pending)
+
+    def __len__(self):
+        """编码后在线路上的字节数"""
+        size = len(LAST_CHUNK)
+        for segment in self.body.segments:
+            full, rest = divmod(len(segment), self.chunk_size)
+            size += full * (len(b"%x" % self.chunk_size) + len(self.extension) + 4 + self.chunk_size)
+            if rest:
+                size += len(b"%x" % rest) + len(self.extension) + 4 + rest
+        return size
+
+    def __bool__(self):
+        return True
+
+    def __bytes__(self):
+        # 会拼接出完整的分块请求体，只在无法流式发送的旧路径(如 RL 环境)中使用
+        return b"".join(part for frame in self.frames() for part in frame)
+
+    def encode(self, encoding='utf-8'):
+        return bytes(self)
+
+    def __str__(self):
+        return bytes(self).decode('utf-8', errors='replace')
+
+    def __repr__(self):
+        return ("ChunkedBody(" + repr(self.body) + ", chunk_size=" + str(self.chunk_size) + ", delay=" +
+                str(self.delay) + ", extension=" + repr(self.extension) + ")")
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return ChunkedBody, (self.body, self.chunk_size, self.delay, self.extension)
+
+
+def materialize_body(body):
+    """把 SegmentedBody/ChunkedBody 转换为 str，供只接受字符串的旧代码(RL 环境、特征提取)使用"""
+    if isinstance(body, (SegmentedBody, ChunkedBody)):
+        return str(body)
+    return body
+
+
+class PaddingBuffer:
+    """
+    所有填充类变异共享的只读填充缓冲区，segment() 返回其切片(memoryview)，不复制数据。
+    """
+
+    def __init__(self, size=DEFAULT_PADDING_SIZE, fill=PADDING_FILL):
+        self.size = size
+        self.fill = fill
+        self._buffer = b""
+        self._lock = threading.Lock()
+
+    def configure(self, size=None):
+        if size is not None:
+            self.size = size
+            logger.info(TAG + "==>padding size: " + str(size))
+
+    def segment(self, size=None):
+        size = self.size if size is None else size
+        buffer = self._buffer
+        if len(buffer) < size:
+            with self._lock:
+                if len(self._buffer) < size:
+                    self._buffer = self.fill * size
+                buffer = self._buffer
+        return memoryview(buffer)[:size]
+
+
+class ChunkedEncoder:
+    """分块传输变异使用的块大小与块间延迟配置"""
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, delay=DEFAULT_CHUNK_DELAY):
+        self.chunk_size = chunk_size
+        self.delay = delay
+
+    def configure(self, chunk_size=None, delay=None):
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        if delay is not None:
+            self.delay = delay
+        logger.info(TAG + "==>chunk size: " + str(self.chunk_size) + " chunk delay: " + str(self.delay))
+
+    def encode(self, data, extension=''):
+        return ChunkedBody(data, chunk_size=self.chunk_size, delay=self.delay, extension=extension)
+
+
+# 全局共享的填充缓冲区
+padding_buffer = PaddingBuffer()
+# 全局共享的分块传输配置
+chunked_encoder = ChunkedEncoder()
+
+
+if __name__ == "__main__":
+    # 基准测试: 按原先的字符串拼接方式与分段方式发送 4MB 填充的变异载荷，对比每个请求的内存峰值；
+    # 以及分块传输请求体的流式发送: 本地服务端重组分块后返回长度与摘要，校验与原始请求体一致
+    import hashlib
+    import tracemalloc
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from utils.prowler_raw_request import serialize_payload
+    from utils.prowler_process_requests import send_raw_request
+    # 以脚本运行时本模块是 __main__，需使用序列化器导入的同一个类
+    from utils.prowler_segmented_body import SegmentedBody, padding_buffer, ChunkedBody
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        # 服务端读入预先分配的缓冲区，避免把服务端的内存计入客户端的峰值
+        scratch = memoryview(bytearray(65536))
+
+        def _read_into(self, length, digest):
+            received = 0
+            while received < length:
+                count = self.rfile.readinto(self.scratch[:min(65536, length - received)])
+                digest.update(self.scratch[:count])
+                received += count
+            return received
+
+        def do_POST(self):
+            digest = hashlib.blake2b(digest_size=8)
+            received = chunks = 0
+            if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                # 按分块帧重组请求体: 块长度[;扩展]\r\n 块数据\r\n ... 0\r\n\r\n
+                while True:
+                    size = int(self.rfile.readline().split(b";")[0], 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        break
+                    received += self._read_into(size, digest)
+                    chunks += 1
+                    self.rfile.readline()
+            else:
+                received = self._read_into(int(self.headers.get('Content-Length', 0)), digest)
+            body = (str(received) + ":" + digest.hexdigest() + ":" + str(chunks)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    def expected(data, chunks=0):
+        return str(len(data)) + ":" + hashlib.blake2b(data, digest_size=8).hexdigest() + ":" + str(chunks)
+
+    logger.setLevel("WARNING")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:" + str(server.server_port) + "/upload"
+    payload = "id=1' union select 1,2,3 -- "
+    for size in (64 * 1024, 1024 * 1024, 4 * 1024 * 1024):
+        padding_buffer.segment(size)
+        reply = expected(payload.encode() + b'x' * size)
+        for name, build in (("concat", lambda: payload + 'x' * size),
+                            ("segmented", lambda: SegmentedBody([payload, padding_buffer.segment(size)]))):
+            tracemalloc.start()
+            start = time.perf_counter()
+            for _ in range(20):
+                response = send_raw_request(serialize_payload({'url': url, 'method': 'POST', 'headers': {},
+                                                               'data': build()}), timeout=10)
+                assert response.text == reply
+            cost = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("padding %8d bytes, %-9s: %.2fms/request, peak memory %8.1f KiB" %
+                  (size, name, cost / 20 * 1e3, peak / 1024))
+
+    # 分块发送: 原先整体拼接的分块字符串与流式分块帧的内存峰值
+    for size, chunk_size in ((64 * 1024, 1), (4 * 1024 * 1024, 4096)):
+        data = payload.encode() + b'x' * size
+        chunks = -(-len(data) // chunk_size)
+        for name, build in (("string", lambda: "".join("%x;\r\n%s\r\n" % (len(data[i:i + chunk_size]),
+                                                                             data[i:i + chunk_size].decode())
+                                                          for i in range(0, len(data), chunk_size)) + "0\r\n\r\n"),
+                            ("streamed", lambda: ChunkedBody(SegmentedBody([payload, padding_buffer.segment(size)]),
+                                                             chunk_size=chunk_size, extension=';'))):
+            tracemalloc.start()
+            start = time.perf_counter()
+            body = build()
+            response = send_raw_request(serialize_payload({'url': url, 'method': 'POST', 'data': body,
+                                                           'headers': {'Transfer-Encoding': 'chunked'}}), timeout=30)
+            cost = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            assert response.text == expected(data, chunks), response.text
+            print("chunked %8d bytes / %4d-byte chunks, %-8s: %.1fms, peak memory %8.1f KiB" %
+                  (len(data), chunk_size, name, cost * 1e3, peak / 1024))
+
+    # 块间延迟: 服务端按块收到完整请求体，总耗时不少于 (块数 - 1) * 延迟
+    start = time.perf_counter()
+    response = send_raw_request(serialize_payload({'url': url, 'method': 'POST', 'headers': {},
+                                                   'data': ChunkedBody(payload, chunk_size=8, delay=0.05)}),
+                                timeout=10)
+    assert response.text == expected(payload.encode(), 4), response.text
+    print("chunked with 0.05s delay, 4 chunks: %.0fms" % ((time.perf_counter() - start) * 1e3))
+    server.shutdown()
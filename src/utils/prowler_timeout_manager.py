@@ -0,0 +1,175 @@
+import math
+import socket
+import threading
+from collections import Counter, deque
+
+from utils.logUtils import LoggerSingleton
+from utils.prowler_connection_pool import connection_pool
+
+logger = LoggerSingleton().get_logger()
+TAG = "prowler_timeout_manager.py: "
+
+# 没有足够样本时使用的初始超时(秒)，与原先固定的 HTTP_CONNECTION_TIMEOUT 一致
+DEFAULT_INITIAL_TIMEOUT = 0.2
+DEFAULT_PERCENTILE = 95
+# 超时 = 分位数 * multiplier + margin
+DEFAULT_MULTIPLIER = 1.5
+DEFAULT_MARGIN = 0.05
+DEFAULT_MIN_TIMEOUT = 0.05
+DEFAULT_MAX_TIMEOUT = 10.0
+# 每个 (host, 大小区间) 保留的最近延迟样本数
+DEFAULT_WINDOW = 200
+# 样本数少于该值时退回到主机级别的分布，再不足则使用初始超时
+DEFAULT_MIN_SAMPLES = 8
+
+OUTCOME_OK = 'ok'
+OUTCOME_TIMEOUT = 'timeout'
+OUTCOME_FAILURE = 'failure'
+
+
+def request_body_size(body):
+    if isinstance(body, (str, bytes, bytearray)):
+        return len(body)
+    if isinstance(body, (list, tuple)):
+        # 分段的原始报文(见 prowler_raw_request)
+        return sum(len(segment) for segment in body)
+    # RawRequest
+    return getattr(body, 'size', 0)
+
+
+def is_timeout_error(error):
+    return isinstance(error, (socket.timeout, TimeoutError))
+
+
+def classify_error(error):
+    """区分超时与真实失败(连接被拒绝、连接重置等)"""
+    return OUTCOME_TIMEOUT if is_timeout_error(error) else OUTCOME_FAILURE
+
+
+class AdaptiveTimeoutManager:
+    """
+    按目标主机和请求体大小区间维护滚动延迟分布，据此给出连接超时和读取超时。
+    usage:
+        connect_timeout, read_timeout = timeout_manager.timeouts(netloc, body_size)
+        ...发送请求...
+        timeout_manager.record_success(netloc, body_size, connect_latency, read_latency)
+        timeout_manager.record_error(netloc, body_size, error, read_timeout)
+    """
+
+    def __init__(self, initial_timeout=DEFAULT_INITIAL_TIMEOUT, percentile=DEFAULT_PERCENTILE,
+                 multiplier=DEFAULT_MULTIPLIER, margin=DEFAULT_MARGIN, min_timeout=DEFAULT_MIN_TIMEOUT,
+                 max_timeout=DEFAULT_MAX_TIMEOUT, window=DEFAULT_WINDOW, min_samples=DEFAULT_MIN_SAMPLES):
+        self.initial_timeout = initial_timeout
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.margin = margin
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.window = window
+        self.min_samples = min_samples
+        # (host, bucket) -> deque[latency]，bucket 为 None 时表示主机级别
+        self._connect_samples = {}
+        self._read_samples = {}
+        # host -> Counter({'ok': n, 'timeout': n, 'failure': n})
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    def configure(self, **kwargs):
+        with self._lock:
+            for key, value in kwargs.items():
+                if value is not None:
+                    setattr(self, key, value)
+
+    @staticmethod
+    def size_bucket(size):
+        # 以 1KB 为单位按 2 的幂分桶: 0 -> <1KB, 1 -> 1~2KB, 2 -> 2~4KB ...
+        return int(math.log2(size // 1024 + 1))
+
+    def _add_sample(self, samples, host, bucket, latency):
+        for key in ((host, bucket), (host, None)):
+            window = samples.get(key)
+            if window is None:
+                window = samples[key] = deque(maxlen=self.window)
+            window.append(latency)
+
+    def _derive(self, samples, host, bucket):
+        window = samples.get((host, bucket))
+        if window is None or len(window) < self.min_samples:
+            window = samples.get((host, None))
+        if window is None or len(window) < self.min_samples:
+            return self.initial_timeout
+        ordered = sorted(window)
+        index = min(len(ordered) - 1, int(math.ceil(self.percentile / 100 * len(ordered))) - 1)
+        timeout = ordered[max(index, 0)] * self.multiplier + self.margin
+        return min(self.max_timeout, max(self.min_timeout, timeout))
+
+    def timeouts(self, host, size=0):
+        """返回 (connect_timeout, read_timeout)"""
+        bucket = self.size_bucket(size)
+        with self._lock:
+            return self._derive(self._connect_samples, host, bucket), self._derive(self._read_samples, host, bucket)
+
+    def record_success(self, host, size, connect_latency, read_latency):
+        bucket = self.size_bucket(size)
+        with self._lock:
+            # 复用的长连接没有连接耗时
+            if connect_latency is not None:
+                self._add_sample(self._connect_samples, host, bucket, connect_latency)
+            self._add_sample(self._read_samples, host, bucket, read_latency)
+            self.outcomes.setdefault(host, Counter())[OUTCOME_OK] += 1
+
+    def record_error(self, host, size, error, read_timeout=None):
+        """记录一次失败，返回判定结果 OUTCOME_TIMEOUT 或 OUTCOME_FAILURE"""
+        bucket = self.size_bucket(size)
+        outcome = classify_error(error)
+        with self._lock:
+            if outcome == OUTCOME_TIMEOUT and read_timeout is not None:
+                # 超时样本被截断，按两倍超时记入，使慢目标的超时逐步放宽
+                self._add_sample(self._read_samples, host, bucket, min(self.max_timeout, read_timeout * 2))
+            self.outcomes.setdefault(host, Counter())[outcome] += 1
+        return outcome
+
+    def pop_outcomes(self):
+        """取出并清空各主机的判定计数(子进程汇总给父进程时使用)"""
+        with self._lock:
+            outcomes, self.outcomes = self.outcomes, {}
+        return outcomes
+
+    def merge_outcomes(self, outcomes):
+        with self._lock:
+            for host, counter in outcomes.items():
+                self.outcomes.setdefault(host, Counter()).update(counter)
+
+    def report(self):
+        """输出每个主机的成功、超时以及真实失败次数"""
+        with self._lock:
+            outcomes = {host: dict(counter) for host, counter in self.outcomes.items()}
+        for host, counter in outcomes.items():
+            logger.info(TAG + "==>host: " + host + " ok: " + str(counter.get(OUTCOME_OK, 0)) +
+                        " timeouts: " + str(counter.get(OUTCOME_TIMEOUT, 0)) +
+                        " failures: " + str(counter.get(OUTCOME_FAILURE, 0)) +
+                        " current timeouts(connect, read): " + str(self.timeouts(host)))
+        return outcomes
+
+
+# 全局共享的超时管理器
+timeout_manager = AdaptiveTimeoutManager()
+
+
+def adaptive_urlopen(netloc, method, url, body=None, headers=None, timeout=None, raw=None):
+    """
+    通过共享连接池发送请求，timeout 为 None 时使用自适应超时，并记录本次延迟或失败类型。
+    异常原样抛出，调用方可用 classify_error 判断是超时还是真实失败。
+    """
+    size = request_body_size(raw if raw is not None else body)
+    if timeout is None:
+        timeout = timeout_manager.timeouts(netloc, size)
+    read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+    try:
+        conn, response = connection_pool.urlopen(netloc, method, url, body=body, headers=headers, timeout=timeout,
+                                                 raw=raw)
+    except Exception as e:
+        timeout_manager.record_error(netloc, size, e, read_timeout)
+        raise
+    timeout_manager.record_success(netloc, size, response.connect_latency, response.elapsed)
+    return conn, response
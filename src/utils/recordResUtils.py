@@ -1,7 +1,10 @@
 import json
 import os
+import re
 from datetime import datetime
 from utils.logUtils import LoggerSingleton
+from utils.fileLockUtils import locked_file, atomic_write_json
+from utils.prowler_routes import route_table
 import atexit
 
 logger = LoggerSingleton().get_logger()
@@ -19,6 +22,11 @@ class JSONLogger:
         self.update_file_name()
         # 初始化缓存并从文件中加载数据
         self.cache = self.load_data()
+        # 已写入文件的缓存条目数，保存时只追加之后的条目
+        self.persisted_count = len(self.cache)
+        # 按规范化 URL 索引的基线响应，check_response_text 只查看同一 URL 的条目
+        self._index = {}
+        self._indexed_count = 0
         # 注册退出时保存数据
         atexit.register(self.save_on_exit)
 
@@ -41,8 +49,12 @@ class JSONLogger:
 
     def save_on_exit(self):
         # 程序退出时保存缓存中的数据到文件
-        with open(self.file_name, 'w') as f:
-            json.dump(self.cache, f, indent=4, ensure_ascii=False)
+        # 多个进程可能写同一个结果文件，加锁后与文件中已有的数据合并
+        with locked_file(self.file_name):
+            existing = self.load_data()
+            existing.extend(self.cache[self.persisted_count:])
+            atomic_write_json(self.file_name, existing, indent=4, ensure_ascii=False, default=str)
+            self.persisted_count = len(self.cache)
         logger.info(f'{TAG} Data saved to {self.file_name} on exit.')
 
     def log_result(self, data):
@@ -51,25 +63,121 @@ class JSONLogger:
 
     def check_response_text(self, url, response_text):
         # 预处理URL
-        url = url.replace('9001', '8001').replace('9002', '8002').replace('9003', '8003')
+        url = normalize_url(url)
 
+        # 一次扫描找出响应中的固定特征串
+        markers = set(RESPONSE_MARKERS.findall(response_text))
         # 检查是否有匹配条件
-        if '4d2e58c872d529fba1d14ba0949b644d' in response_text:
+        if MD5_MARKER in markers:
             return True
 
         # 查找具有相同 URL 的条目
         logger.info(f'{TAG} check_response_text url:{url}')
         logger.info(f'{TAG} check_response_text response_text:{response_text}')
-        for entry in self.cache:
+        self._update_index()
+        baseline = self._index.get(url)
+        if baseline is not None and baseline.match(response_text, markers):
+            return True
+
+        logger.info(f'{TAG} no same url in existing_data, return False')
+        # 如果没有找到相同的 URL，返回 False
+        return False
+
+    def _update_index(self):
+        # cache 只会追加(log_result，或多进程时父进程直接 extend)，只索引新增的条目
+        for entry in self.cache[self._indexed_count:]:
+            text = entry.get('response_text')
+            if isinstance(text, str):
+                self._index.setdefault(entry['url'], UrlBaseline()).add(text)
+        self._indexed_count = len(self.cache)
+
+
+def normalize_url(url):
+    # WAF 目标的 url 按路由表映射回原始站点
+    return route_table.origin_url(url)
+
+
+# 固定特征串: 响应中出现 md5 标记即判定成功；.php 与 passwd 行需要基线中也出现
+MD5_MARKER = '4d2e58c872d529fba1d14ba0949b644d'
+PHP_MARKER = '.php'
+PASSWD_MARKER = 'root:x:0:0:root:/root:/bin/bash'
+# 与原判定保持一致: 基线中检查的 passwd 行没有 /root 这一段
+BASELINE_PASSWD_MARKER = 'root:x:0:0:root:/bin/bash'
+# 多个特征串编译为一个正则(多模式匹配)，一次扫描完成；各特征串之间不会相互重叠
+RESPONSE_MARKERS = re.compile('|'.join(re.escape(marker) for marker in (MD5_MARKER, PASSWD_MARKER, PHP_MARKER)))
+BASELINE_MARKERS = re.compile('|'.join(re.escape(marker) for marker in (BASELINE_PASSWD_MARKER, PHP_MARKER)))
+
+
+class UrlBaseline:
+    """同一 URL 下已记录结果的响应文本，加入时预先计算特征串，判定时不再重复扫描基线"""
+    __slots__ = ('texts', 'has_php', 'has_passwd')
+
+    def __init__(self):
+        # 去重后的基线文本，保持加入顺序
+        self.texts = {}
+        self.has_php = False
+        self.has_passwd = False
+
+    def add(self, text):
+        if text in self.texts:
+            return
+        self.texts[text] = None
+        markers = set(BASELINE_MARKERS.findall(text))
+        self.has_php = self.has_php or PHP_MARKER in markers
+        self.has_passwd = self.has_passwd or BASELINE_PASSWD_MARKER in markers
+
+    def match(self, response_text, markers):
+        if PHP_MARKER in markers and self.has_php:
+            return True
+        if PASSWD_MARKER in markers and self.has_passwd:
+            return True
+        # 完全相同的响应直接命中，否则检查基线是否为响应的子串
+        if response_text in self.texts:
+            return True
+        return any(text in response_text for text in self.texts)
+
+
+if __name__ == "__main__":
+    # 基准测试: 原先逐条扫描 cache 的判定与索引判定的结果一致性以及随 cache 增长的单次耗时
+    import random
+    import tempfile
+    import time
+
+    def check_response_text_linear(cache, url, response_text):
+        url = normalize_url(url)
+        if MD5_MARKER in response_text:
+            return True
+        for entry in cache:
             if entry['url'] == url:
-                # 比较 response_text
                 if '.php' in response_text and '.php' in entry['response_text']:
                     return True
-                if 'root:x:0:0:root:/root:/bin/bash' in response_text and 'root:x:0:0:root:/bin/bash' in entry['response_text']:
+                if PASSWD_MARKER in response_text and BASELINE_PASSWD_MARKER in entry['response_text']:
                     return True
                 if entry['response_text'] == response_text or entry['response_text'] in response_text:
                     return True
-
-        logger.info(f'{TAG} no same url in existing_data, return False')
-        # 如果没有找到相同的 URL，返回 False
         return False
+
+    logger.setLevel("WARNING")
+    random.seed(0)
+    pages = ["<html>blocked by waf</html>", "<p>welcome admin</p>", "upload ok: shell.php", BASELINE_PASSWD_MARKER,
+             "id=1 ok", MD5_MARKER]
+    res_logger = JSONLogger(directory=tempfile.mkdtemp())
+    queries = [("http://localhost:9001/u" + str(random.randrange(2000)),
+                random.choice(pages) + random.choice(["", " tail", PASSWD_MARKER, "a.php"])) for _ in range(2000)]
+    for size in (1000, 5000, 20000):
+        while len(res_logger.cache) < size:
+            res_logger.log_result({'url': "http://localhost:8001/u" + str(random.randrange(2000)),
+                                   'response_text': random.choice(pages[:-1]) + str(random.randrange(3))})
+        start = time.perf_counter()
+        expected = [check_response_text_linear(res_logger.cache, url, text) for url, text in queries]
+        linear_cost = time.perf_counter() - start
+        # 新增条目的索引在 log_result 之后的第一次判定时建立，单独计时
+        start = time.perf_counter()
+        res_logger._update_index()
+        index_cost = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = [res_logger.check_response_text(url, text) for url, text in queries]
+        indexed_cost = time.perf_counter() - start
+        assert actual == expected
+        print("cache size %6d: linear %.2fus/check, indexed %.2fus/check (index update %.2fms)" %
+              (size, linear_cost / len(queries) * 1e6, indexed_cost / len(queries) * 1e6, index_cost * 1e3))